@@ -1,17 +1,22 @@
+import time
+_START_TIME = time.perf_counter()
+
 import sys
-import os,torch
+import os
 import logging
-import time
+import argparse
 import platform
+from importlib import metadata
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QComboBox, QSpinBox,
     QTableWidget, QTableWidgetItem, QHeaderView, QStatusBar,
-    QTextEdit, QSplitter, QMessageBox, QProgressBar, QAction, QMenu
+    QTextEdit, QSplitter, QMessageBox, QProgressBar, QAction, QMenu, QActionGroup
 )
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QIcon, QFont
 from src.gui_interface import GUIInterface
+from src.startup_profile import StartupProfile
 
 # 获取资源路径函数
 def resource_path(relative_path):
@@ -24,8 +29,9 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 class MaterialSearchApp(QMainWindow):
-    def __init__(self):
+    def __init__(self, profile=None):
         super().__init__()
+        self.profile = profile or StartupProfile()
         self.setWindowTitle("作文素AI检索系统 V1.0.0 By WZH 已开源(可按Ctrl+Q退出)")
         self.setGeometry(100, 100, 1440, 720)
         
@@ -39,15 +45,22 @@ class MaterialSearchApp(QMainWindow):
         self.search_interface = GUIInterface(model_dir="model")
         self.load_model()
         
+        # 后台检索线程，界面线程不阻塞在推理上
+        self.search_thread = self.search_interface.search_async()
+        self.search_thread.results_ready.connect(self.on_search_finished)
+        self.search_thread.error.connect(self.on_search_error)
+        self.search_thread.start()
+        
         # 配置日志
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger("GUI")
         self.logger.addHandler(self.log_handler)
         
-        # 初始化设备信息
+        # 设备信息与PyTorch版本在模型加载完成后更新（避免在界面线程导入torch）
         self.device_type = "CPU"  # 默认为CPU
-        if torch.cuda.is_available():
-            self.device_type = f"GPU ({torch.cuda.get_device_name(0)})"
+        self.torch_version = None
+        # 已确认退出（等待检索线程结束时窗口先隐藏）
+        self._closing = False
     
     def init_ui(self):
         """初始化用户界面"""
@@ -75,6 +88,13 @@ class MaterialSearchApp(QMainWindow):
             }
         """)
         self.search_input.returnPressed.connect(self.do_search)
+        self.search_input.textEdited.connect(self.on_text_edited)
+        
+        # 输入时自动搜索: 停止输入一段时间后再检索（防抖）
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.do_search)
         
         # 类型选择框
         self.category_combo = QComboBox()
@@ -249,7 +269,7 @@ class MaterialSearchApp(QMainWindow):
         self.status_bar.addPermanentWidget(self.progress_bar)
         
         # 添加版本信息到状态栏
-        self.version_label = QLabel(f"版本: 1.0 | PyTorch: {torch.__version__}")
+        self.version_label = QLabel("版本: 1.0")
         self.status_bar.addPermanentWidget(self.version_label)
         
         # 组装主布局
@@ -270,6 +290,28 @@ class MaterialSearchApp(QMainWindow):
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
         
+        # 设置菜单 - 推理精度
+        settings_menu = menu_bar.addMenu("设置")
+        precision_menu = settings_menu.addMenu("推理精度")
+        self.precision_group = QActionGroup(self)
+        precision_options = [
+            ("fp32", "FP32 全精度"),
+            ("bf16", "BF16 混合精度"),
+            ("int8", "INT8 动态量化 (仅CPU)")
+        ]
+        for precision, label in precision_options:
+            action = QAction(label, self, checkable=True)
+            action.setData(precision)
+            action.setChecked(precision == "fp32")
+            self.precision_group.addAction(action)
+            precision_menu.addAction(action)
+        self.precision_group.triggered.connect(self.change_precision)
+        
+        # 设置菜单 - 输入时自动搜索
+        self.live_search_action = QAction("输入时自动搜索", self, checkable=True)
+        self.live_search_action.setChecked(False)
+        settings_menu.addAction(self.live_search_action)
+        
         # 帮助菜单
         help_menu = menu_bar.addMenu("帮助")
         
@@ -277,6 +319,15 @@ class MaterialSearchApp(QMainWindow):
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
     
+    def torch_version_text(self):
+        """PyTorch版本: 优先使用加载线程已取得的版本，否则只读取包元数据，不导入torch"""
+        if self.torch_version is not None:
+            return self.torch_version
+        try:
+            return metadata.version("torch")
+        except metadata.PackageNotFoundError:
+            return "未安装"
+    
     def show_about(self):
         """显示关于对话框"""
         about_text = """
@@ -297,7 +348,7 @@ class MaterialSearchApp(QMainWindow):
         </ul>
         <p>HJWZH(WZH)  制作 , 项目已开源 , 遵循MIT协议 , See it on <a href='https://github.com/HJWZH/composition-assistant'>GitHub</a></p>
         """.format(
-            torch.__version__,
+            self.torch_version_text(),
             platform.platform(),
             platform.python_version(),
             self.device_type
@@ -315,6 +366,8 @@ class MaterialSearchApp(QMainWindow):
         """加载模型"""
         self.status_bar.showMessage("正在加载模型，请稍候...")
         self.search_btn.setEnabled(False)
+        # 加载期间禁止切换精度: 同时只有一个加载线程，避免仍在运行的线程失去引用被销毁
+        self.precision_group.setEnabled(False)
         
         # 更新设备信息
         self.device_label.setText(f"设备: {self.device_label}")
@@ -324,32 +377,80 @@ class MaterialSearchApp(QMainWindow):
         self.loader_thread.error.connect(self.on_model_error)
         self.loader_thread.start()
     
+    def change_precision(self, action):
+        """切换推理精度并重新加载模型"""
+        precision = action.data()
+        if precision == self.search_interface.precision:
+            return
+        if self.loader_thread is not None and self.loader_thread.isRunning():
+            self.sync_precision_menu()
+            return
+        self.search_interface.precision = precision
+        self.logger.info(f"切换推理精度: {precision}，重新加载模型")
+        self.load_model()
+    
     def on_model_loaded(self, engine, has_fine_tuned, has_embeddings):
         """模型加载完成"""
         self.search_interface.engine = engine
+        self.device_type = "CPU"
+        # torch 后端已由加载线程导入torch；onnx/snapshot 后端不导入，版本取自包元数据
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            self.torch_version = torch.__version__
+            if engine.device == "cuda":
+                self.device_type = f"GPU ({torch.cuda.get_device_name(0)})"
+        self.version_label.setText(f"版本: 1.0 | PyTorch: {self.torch_version_text()}")
         self.search_btn.setEnabled(True)
+        self.precision_group.setEnabled(True)
         
         # 更新状态信息
         model_type = "微调模型" if has_fine_tuned else "预训练模型"
         embeddings = "预计算嵌入" if has_embeddings else "实时编码"
         
-        status_msg = f"就绪 | 模型: {model_type} | 编码: {embeddings}"
+        status_msg = f"就绪 | 模型: {model_type} | 编码: {embeddings} | 精度: {engine.precision}"
+        
+        # 自检未通过时引擎会回退到fp32，同步菜单选中项
+        self.search_interface.precision = engine.precision
+        self.sync_precision_menu()
         self.status_bar.showMessage(status_msg)
         
         # 更新设备标签
         self.device_label.setText(f"设备: {self.device_type}")
         
         self.logger.info(f"模型加载完成 | 设备: {self.device_type} | 模型类型: {model_type} | 编码方式: {embeddings}")
+        
+        # 启动耗时报告（--startup-profile，仅首次加载）
+        if self.profile.enabled and not self.profile.reported:
+            for phase, name in (("model", "加载模型"), ("index", "加载索引"), ("warm_up", "预热编码")):
+                self.profile.add(name, engine.load_timings.get(phase, 0.0))
+            self.profile.mark("模型就绪")
+            self.logger.info(self.profile.report())
+    
+    def sync_precision_menu(self):
+        """菜单选中项与当前推理精度保持一致"""
+        for action in self.precision_group.actions():
+            action.setChecked(action.data() == self.search_interface.precision)
     
     def on_model_error(self, error_msg):
         """模型加载错误"""
+        # 仍在使用之前加载的引擎时，精度恢复为该引擎的精度
+        if self.search_interface.engine is not None:
+            self.search_interface.precision = self.search_interface.engine.precision
+            self.sync_precision_menu()
+        self.precision_group.setEnabled(True)
         self.status_bar.showMessage(f"加载失败: {error_msg}")
         self.logger.error(f"模型加载错误: {error_msg}")
     
+    def on_text_edited(self, text):
+        """输入变化时重新计时，开启自动搜索后停止输入300ms才检索"""
+        if self.live_search_action.isChecked() and text.strip():
+            self.search_timer.start()
+    
     def do_search(self):
-        """执行搜索操作"""
+        """提交搜索到后台线程，结果由 on_search_finished 显示"""
+        self.search_timer.stop()
         query = self.search_input.text().strip()
-        if not query:
+        if not query or self.search_interface.engine is None:
             return
             
         # 获取搜索参数
@@ -362,40 +463,24 @@ class MaterialSearchApp(QMainWindow):
         category = category_map.get(self.category_combo.currentText(), "all")
         top_k = self.count_spin.value()
         
-        # 记录开始时间
-        start_time = time.time()
-        
-        # 如果是CPU设备，显示等待提示
-        if "GPU" not in self.device_type:
-            self.status_bar.showMessage("正在搜索，请稍候...")
-            self.progress_bar.setVisible(True)
-            self.search_btn.setEnabled(False)
-            self.search_btn.setText("搜索中...")
-            QApplication.processEvents()  # 更新UI
+        # 显示等待提示；搜索期间仍可输入，新查询会取代尚未完成的旧查询
+        self.status_bar.showMessage("正在搜索，请稍候...")
+        self.progress_bar.setVisible(True)
+        self.search_btn.setText("搜索中...")
         
         self.logger.info(f"搜索: '{query}' 类型: {category} 数量: {top_k}")
+        self.search_thread.submit(query, category=category, top_k=top_k)
+    
+    def on_search_finished(self, request_id, query, results, elapsed_time):
+        """后台搜索完成，过期查询的结果直接忽略"""
+        if request_id != self.search_thread.latest_id:
+            self.logger.debug(f"忽略已被取代的查询结果: '{query}'")
+            return
         
-        # 执行搜索
-        try:
-            results = self.search_interface.search(
-                query, 
-                category=category, 
-                top_k=top_k
-            )
-        except Exception as e:
-            self.logger.error(f"搜索出错: {str(e)}")
-            results = []
-        
-        # 计算处理时间
-        elapsed_time = time.time() - start_time
+        self.progress_bar.setVisible(False)
+        self.search_btn.setText("搜索")
         time_msg = f"搜索完成 | 耗时: {elapsed_time:.2f}秒 | 设备: {self.device_type}"
         
-        # 隐藏进度条（如果是CPU）
-        if "GPU" not in self.device_type:
-            self.progress_bar.setVisible(False)
-            self.search_btn.setEnabled(True)
-            self.search_btn.setText("搜索")
-        
         # 显示结果
         self.show_results(results)
         
@@ -406,6 +491,16 @@ class MaterialSearchApp(QMainWindow):
             self.status_bar.showMessage(f"未找到相关素材 | {time_msg}")
             self.logger.info(f"未找到相关素材 | {time_msg}")
     
+    def on_search_error(self, request_id, error_msg):
+        """后台搜索出错"""
+        self.logger.error(f"搜索出错: {error_msg}")
+        if request_id != self.search_thread.latest_id:
+            return
+        self.progress_bar.setVisible(False)
+        self.search_btn.setText("搜索")
+        self.show_results([])
+        self.status_bar.showMessage(f"搜索出错: {error_msg}")
+    
     def show_results(self, results):
         """在表格中显示搜索结果"""
         self.results_table.setRowCount(len(results) if results else 1)
@@ -529,6 +624,10 @@ class MaterialSearchApp(QMainWindow):
     
     def closeEvent(self, event):
         """关闭应用程序事件处理"""
+        if self._closing:
+            # 已确认退出，检索线程结束后再次触发关闭
+            event.accept()
+            return
         reply = QMessageBox.question(
             self, 
             "退出确认", 
@@ -539,12 +638,26 @@ class MaterialSearchApp(QMainWindow):
         
         if reply == QMessageBox.Yes:
             self.logger.info("应用程序退出")
-            event.accept()
+            self.search_timer.stop()
+            self._closing = True
+            if self.search_thread.stop():
+                event.accept()
+                return
+            # 仍有查询在编码: 先隐藏窗口不阻塞界面，线程结束后再关闭（线程仍在运行时销毁会导致崩溃）
+            self.hide()
+            self.search_thread.finished.connect(self.close)
+            event.ignore()
         else:
             event.ignore()
 
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="作文素材AI检索系统")
+    parser.add_argument("--startup-profile", action="store_true", help="模型加载完成后输出启动各阶段耗时")
+    args, qt_args = parser.parse_known_args()
+    profile = StartupProfile(enabled=args.startup_profile, start_time=_START_TIME)
+    profile.add("导入模块", time.perf_counter() - _START_TIME)
+    
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # 设置应用程序样式
     app.setStyle("Fusion")
@@ -555,8 +668,9 @@ def main():
     font.setPointSize(10)
     app.setFont(font)
     
-    window = MaterialSearchApp()
+    window = MaterialSearchApp(profile)
     window.show()
+    profile.mark("窗口显示")
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
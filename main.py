@@ -1,6 +1,5 @@
 import os
 import sys
-import torch
 import logging
 
 # 添加src目录到Python路径
@@ -1,24 +1,43 @@
+import time
+_START_TIME = time.perf_counter()
+
 import os
 import sys
-import torch
 import logging
+import argparse
 
 # 添加src目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.cli_interface import CLIInterface
+from src.startup_profile import StartupProfile
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("Main")
 
-def check_model_files():
-    """检查必要的模型文件"""
-    required_files = [
-        "model/pretrained/config.json",
-        "model/pretrained/pytorch_model.bin",
-        "model/pretrained/vocab.txt"
-    ]
+def check_model_files(backend="torch", model_dir="model"):
+    """检查所选推理后端需要的模型文件
+    
+    torch 需要预训练权重；onnx 只需导出的ONNX图与分词器/池化配置；
+    snapshot 只需 snapshot.bin。
+    """
+    if backend == "snapshot":
+        from src.snapshot import SNAPSHOT_FILE
+        required_files = [os.path.join(model_dir, SNAPSHOT_FILE)]
+    elif backend == "onnx":
+        from src.onnx_encoder import ONNX_DIR, RAW_MODEL_FILE, OPTIMIZED_MODEL_FILE, ENCODER_FILES
+        onnx_dir = os.path.join(model_dir, ONNX_DIR)
+        required_files = [os.path.join(onnx_dir, name) for name in ENCODER_FILES]
+        # 优化图与原始图有其一即可
+        if not os.path.exists(os.path.join(onnx_dir, OPTIMIZED_MODEL_FILE)):
+            required_files.insert(0, os.path.join(onnx_dir, RAW_MODEL_FILE))
+    else:
+        required_files = [
+            os.path.join(model_dir, "pretrained", "config.json"),
+            os.path.join(model_dir, "pretrained", "pytorch_model.bin"),
+            os.path.join(model_dir, "pretrained", "vocab.txt")
+        ]
     
     missing_files = []
     for file in required_files:
@@ -27,18 +46,40 @@ def check_model_files():
     
     return missing_files
 
+MISSING_HINTS = {
+    "torch": "模型文件缺失，请先运行 organize_model.py",
+    "onnx": "ONNX编码器文件缺失，请先运行 python -m src.onnx_encoder 导出",
+    "snapshot": "快照文件缺失，请先运行 python -m src.snapshot 生成"
+}
+
 def main():
+    parser = argparse.ArgumentParser(description="作文素材AI检索系统（命令行版）")
+    parser.add_argument("--precision", default="fp32", choices=("fp32", "bf16", "int8"),
+                        help="推理精度: fp32 全精度 / bf16 混合精度 / int8 动态量化（仅CPU）")
+    parser.add_argument("--backend", default="torch", choices=("torch", "onnx", "snapshot"),
+                        help="推理后端: torch / onnx（需先运行 python -m src.onnx_encoder 导出）"
+                             " / snapshot（需先运行 python -m src.snapshot 打包）")
+    parser.add_argument("--mode", default="semantic", choices=("semantic", "hybrid"),
+                        help="检索模式: semantic 语义检索 / hybrid 词法召回 + 语义重排")
+    parser.add_argument("--eager-load", action="store_true",
+                        help="先加载模型再显示提示符（默认在后台加载，提示符立即出现）")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="首次检索后输出启动各阶段耗时")
+    args = parser.parse_args()
+    profile = StartupProfile(enabled=args.startup_profile, start_time=_START_TIME)
+    profile.add("导入模块", time.perf_counter() - _START_TIME)
+    
     # 检查模型文件
-    missing_files = check_model_files()
+    missing_files = check_model_files(args.backend)
     if missing_files:
-        logger.error("模型文件缺失，请先运行 organize_model.py")
+        logger.error(MISSING_HINTS[args.backend])
         logger.error("缺失文件:")
         for file in missing_files:
             logger.error(f" - {file}")
         
         # 尝试自动修复路径
         cache_path = os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "hub")
-        if os.path.exists(cache_path):
+        if args.backend == "torch" and os.path.exists(cache_path):
             logger.info(f"检测到Hugging Face缓存目录: {cache_path}")
             #logger.info("请运行: python organize_model.py")
         return
@@ -46,16 +87,12 @@ def main():
     # 检查是否有微调模型
     use_fine_tuned = os.path.exists("model/fine_tuned")
     
-    # 显示系统信息
-    print(f"PyTorch版本: {torch.__version__}")
-    print(f"CUDA可用: {torch.cuda.is_available()}")
-    if torch.cuda.is_available():
-        print(f"GPU设备: {torch.cuda.get_device_name(0)}")
-
     print("作文素材AI检索系统\n版本: 1.0.0\n基于深度学习技术的作文素材检索工具，帮助用户快速找到相关名言、事例和古诗文素材。\nHJWZH(WZH)制作 , 项目已开源 , 遵循MIT协议 , See it on 'https://github.com/HJWZH/composition-assistant'")
 
     # 启动命令行界面
-    cli = CLIInterface(model_dir="model", use_fine_tuned=use_fine_tuned)
+    # 默认在后台加载模型与索引（系统信息在加载完成后显示）
+    cli = CLIInterface(model_dir="model", use_fine_tuned=use_fine_tuned, precision=args.precision, backend=args.backend, mode=args.mode,
+                       background=not args.eager_load, profile=profile)
     cli.run()
 
 if __name__ == "__main__":
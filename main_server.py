@@ -0,0 +1,54 @@
+import os
+import sys
+import logging
+import argparse
+
+# 添加src目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from main_nogui import check_model_files, MISSING_HINTS
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("Main")
+
+def main():
+    parser = argparse.ArgumentParser(description="作文素材AI检索系统（HTTP服务版）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，局域网共享时使用 0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--max_batch_size", type=int, default=32, help="单次批量编码的最大请求数")
+    parser.add_argument("--max_wait_ms", type=float, default=5.0, help="合并并发请求的最长等待时间（毫秒）")
+    parser.add_argument("--precision", default="fp32", choices=("fp32", "bf16", "int8"),
+                        help="推理精度: fp32 全精度 / bf16 混合精度 / int8 动态量化（仅CPU）")
+    parser.add_argument("--backend", default="torch", choices=("torch", "onnx", "snapshot"),
+                        help="推理后端: torch / onnx（需先运行 python -m src.onnx_encoder 导出）"
+                             " / snapshot（需先运行 python -m src.snapshot 打包）")
+    parser.add_argument("--no-metrics", action="store_true", help="关闭分阶段计时统计（/metrics 只输出批处理统计）")
+    args = parser.parse_args()
+    
+    # 检查模型文件
+    missing_files = check_model_files(args.backend)
+    if missing_files:
+        logger.error(MISSING_HINTS[args.backend])
+        for file in missing_files:
+            logger.error(f" - {file}")
+        return
+    
+    from src.semantic_search import SemanticSearchEngine
+    from src.search_server import run_server
+    
+    # 设备由引擎选择: torch 后端有GPU时使用CUDA，onnx/snapshot 后端在CPU上运行且不导入torch
+    engine = SemanticSearchEngine(
+        model_dir="model",
+        use_fine_tuned=os.path.exists("model/fine_tuned"),
+        precision=args.precision,
+        backend=args.backend,
+        metrics=not args.no_metrics
+    )
+    logger.info(f"使用设备: {engine.device} | 推理精度: {engine.precision} | 推理后端: {args.backend}")
+    
+    run_server(engine, host=args.host, port=args.port,
+               max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import time
+import logging
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("ANNIndex")
+
+ANN_FILE = "ann_index.npz"
+# 2: 记录训练时的规模、之后增量加入的行数及训练时的平均簇内相似度
+FORMAT_VERSION = 2
+
+# 低于该规模时暴力检索已足够快，直接使用精确搜索
+ANN_MIN_ROWS = 50000
+
+# 增量更新时新行直接分配到最近的已有簇；以下任一条件成立时才重新训练聚类中心:
+#   训练后累计新增的行数超过训练时规模的该比例
+ANN_RETRAIN_FRACTION = 0.2
+#   簇数与 sqrt(N) 相差超过该倍数
+ANN_RETRAIN_LIST_RATIO = 2.0
+#   新行与所属簇中心的平均相似度比训练时低出该值（分布漂移）
+ANN_DRIFT_TOLERANCE = 0.05
+
+
+def _assign(embeddings, centroids, chunk_rows=65536, return_scores=False):
+    """将每一行分配给内积最大的聚类中心（分块计算以控制内存），可同时返回对应的内积"""
+    assign = np.empty(embeddings.shape[0], dtype=np.int32)
+    scores = np.empty(embeddings.shape[0], dtype=np.float32) if return_scores else None
+    for start in range(0, embeddings.shape[0], chunk_rows):
+        block = np.asarray(embeddings[start:start + chunk_rows], dtype=np.float32)
+        block_scores = block @ centroids.T
+        block_assign = np.argmax(block_scores, axis=1)
+        assign[start:start + block.shape[0]] = block_assign
+        if return_scores:
+            scores[start:start + block.shape[0]] = block_scores[np.arange(block.shape[0]), block_assign]
+    return (assign, scores) if return_scores else assign
+
+
+class IVFIndex:
+    """倒排文件（IVF）近似最近邻索引，纯NumPy实现
+    
+    用球面k-means将归一化嵌入划分为 n_lists 个簇，查询时只对与查询最接近的
+    nprobe 个簇内的行精确打分。nprobe 越大召回越高、速度越慢。
+    索引更新时新行分配到已有簇（见 IndexWriter），needs_retrain() 判断何时重新训练。
+    """
+    def __init__(self, centroids, offsets, list_rows, trained_rows=None, added_rows=0, train_score=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.list_rows = list_rows
+        self.trained_rows = self.rows if trained_rows is None else int(trained_rows)
+        self.added_rows = int(added_rows)
+        self.train_score = train_score
+    
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+    
+    @property
+    def rows(self):
+        return int(self.list_rows.shape[0])
+    
+    def assignments(self):
+        """每行所属的簇号（按行号排列）"""
+        assign = np.empty(self.rows, dtype=np.int32)
+        assign[self.list_rows] = np.repeat(np.arange(self.n_lists, dtype=np.int32), np.diff(self.offsets))
+        return assign
+    
+    def assign(self, embeddings):
+        """将归一化的新行分配到最近的已有簇，返回(簇号, 与簇中心的内积)"""
+        return _assign(embeddings, self.centroids, return_scores=True)
+    
+    @classmethod
+    def from_assignments(cls, centroids, assign, **stats):
+        """由逐行簇号按簇排列行号（簇内保持行号升序）"""
+        list_rows = np.argsort(assign, kind='stable').astype(np.int64)
+        offsets = np.zeros(centroids.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=centroids.shape[0]), out=offsets[1:])
+        return cls(centroids, offsets, list_rows, **stats)
+    
+    def needs_retrain(self, rows, added_rows, added_score=None):
+        """增量加入 added_rows 行（与簇中心的平均内积为 added_score）后总行数为 rows 时，是否应重新训练"""
+        if self.added_rows + added_rows > ANN_RETRAIN_FRACTION * self.trained_rows:
+            return True
+        ratio = self.n_lists / max(1.0, np.sqrt(rows))
+        if not 1 / ANN_RETRAIN_LIST_RATIO <= ratio <= ANN_RETRAIN_LIST_RATIO:
+            return True
+        return (self.train_score is not None and added_score is not None
+                and added_score < self.train_score - ANN_DRIFT_TOLERANCE)
+    
+    def updated(self, assign, added_rows):
+        """沿用聚类中心，由更新后的逐行簇号生成新索引"""
+        return IVFIndex.from_assignments(
+            self.centroids, assign,
+            trained_rows=self.trained_rows, added_rows=self.added_rows + added_rows, train_score=self.train_score
+        )
+    
+    @classmethod
+    def build(cls, embeddings, n_lists=None, iterations=10, sample_per_list=64, seed=0):
+        """从归一化嵌入构建索引，n_lists 默认约为 sqrt(N)"""
+        start_time = time.time()
+        rows = embeddings.shape[0]
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(rows)))
+        n_lists = min(n_lists, rows)
+        
+        # 在采样子集上训练聚类中心
+        rng = np.random.default_rng(seed)
+        sample_size = min(rows, n_lists * sample_per_list)
+        sample_rows = np.sort(rng.choice(rows, size=sample_size, replace=False))
+        sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+        
+        for _ in range(iterations):
+            assign = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            # 空簇重新随机取样，避免中心退化
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        
+        # 全量分配，平均簇内相似度作为之后判断分布漂移的基准
+        assign, scores = _assign(embeddings, centroids, return_scores=True)
+        
+        logger.info(f"IVF索引构建完成: {rows} 条, {n_lists} 个簇, 耗时 {time.time()-start_time:.2f}s")
+        return cls.from_assignments(centroids, assign, train_score=float(scores.mean()))
+    
+    def save(self, directory):
+        """保存到索引目录（index_dir() 的结果，原子替换）"""
+        path = os.path.join(directory, ANN_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                format_version=np.array(FORMAT_VERSION),
+                centroids=self.centroids,
+                offsets=self.offsets,
+                list_rows=self.list_rows,
+                trained_rows=np.array(self.trained_rows),
+                added_rows=np.array(self.added_rows),
+                train_score=np.array(np.nan if self.train_score is None else self.train_score)
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"IVF索引已保存: {path}")
+        return path
+    
+    @classmethod
+    def load(cls, directory):
+        """从索引目录（index_dir() 的结果）加载，不存在时返回None"""
+        path = os.path.join(directory, ANN_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data['format_version']) > FORMAT_VERSION:
+                raise ValueError(f"不支持的IVF索引版本: {int(data['format_version'])}")
+            stats = {}
+            if 'trained_rows' in data.files:
+                train_score = float(data['train_score'])
+                stats = {
+                    'trained_rows': int(data['trained_rows']),
+                    'added_rows': int(data['added_rows']),
+                    'train_score': None if np.isnan(train_score) else train_score
+                }
+            return cls(data['centroids'], data['offsets'], data['list_rows'], **stats)
+    
+    def search(self, embeddings, query, top_k, nprobe=8, row_mask=None):
+        """检索单个归一化查询，返回(分数, 行号)，均按分数降序
+        
+        row_mask 为布尔数组时先过滤候选行（类别预过滤）；若探查 nprobe 个簇后
+        候选不足 top_k，则继续探查下一个最近的簇。
+        """
+        centroid_order = np.argsort(-(self.centroids @ query))
+        
+        parts = []
+        candidates = 0
+        for probed, lst in enumerate(centroid_order, 1):
+            rows = self.list_rows[self.offsets[lst]:self.offsets[lst + 1]]
+            if row_mask is not None:
+                rows = rows[row_mask[rows]]
+            parts.append(rows)
+            candidates += rows.shape[0]
+            if probed >= nprobe and candidates >= top_k:
+                break
+        
+        if candidates == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        
+        rows = np.sort(np.concatenate(parts))
+        scores = np.asarray(embeddings[rows], dtype=np.float32) @ query
+        k = min(top_k, rows.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return scores[top], rows[top]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="构建IVF近似最近邻索引")
+    parser.add_argument("--model_dir", default="model", help="模型目录")
+    parser.add_argument("--n_lists", type=int, default=None, help="聚类簇数，默认约为sqrt(N)")
+    args = parser.parse_args()
+    # 在新的索引代中构建并提交，不改动读取方可能已打开的当前索引代
+    from .index_builder import build_ann_index
+    build_ann_index(args.model_dir, n_lists=args.n_lists)
@@ -0,0 +1,139 @@
+import contextlib
+import numpy as np
+
+
+class NumpyOps:
+    """检索打分所需数组运算的 numpy 实现（仅CPU）
+    
+    onnx/snapshot 后端的编码器直接输出 numpy 数组，检索全程不导入 torch。
+    mask 参数均为布尔数组，True 表示保留，可按行广播。
+    """
+    # model.encode 是否应返回张量
+    tensors = False
+    # 计时前的设备同步函数（仅CUDA需要）
+    sync = None
+    
+    def asarray(self, array):
+        """numpy数组（如内存映射的嵌入）→ 后端数组，不复制"""
+        return array
+    
+    def numpy(self, x):
+        return np.asarray(x)
+    
+    def to_device(self, x):
+        return x
+    
+    def to(self, x, like):
+        """将 x 移到 like 所在设备（like 为None时不变）"""
+        return x
+    
+    def float32(self, x):
+        return np.asarray(x, dtype=np.float32)
+    
+    def clone(self, x):
+        return np.array(x, copy=True)
+    
+    def stack(self, rows):
+        return np.stack(rows).astype(np.float32, copy=False)
+    
+    def no_grad(self):
+        return contextlib.nullcontext()
+    
+    def normalize(self, x):
+        """按行L2归一化（与 F.normalize 相同的下限）"""
+        return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+    
+    def mm(self, queries, matrix):
+        """Q×D 与 N×D → Q×N 点积"""
+        return queries @ matrix.T
+    
+    def batched_dot(self, rows, queries):
+        """Q×C×D 与 Q×D → Q×C 点积"""
+        return np.matmul(rows, queries[:, :, None])[:, :, 0]
+    
+    def masked_fill(self, scores, mask):
+        return np.where(mask, scores, np.float32(-np.inf))
+    
+    def isin(self, codes, values):
+        return np.isin(codes, values)
+    
+    def topk(self, scores, k):
+        """每行取最大的k个，返回(分数, 列号)，按分数降序"""
+        if k <= 0:
+            return scores[:, :0], np.empty((scores.shape[0], 0), dtype=np.int64)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+    
+    def gather(self, indices, order):
+        return np.take_along_axis(indices, order, axis=1)
+    
+    def take_rows(self, matrix, indices, like):
+        """按行号（任意形状）取出 matrix 的行，结果形状为 indices.shape + (D,)"""
+        return np.asarray(matrix[np.asarray(indices).reshape(-1)]).reshape(*np.shape(indices), -1)
+
+
+class TorchOps:
+    """检索打分所需数组运算的 torch 实现，嵌入可放在GPU上（torch 后端）"""
+    tensors = True
+    
+    def __init__(self, device="cpu"):
+        import torch
+        import torch.nn.functional as F
+        self.torch = torch
+        self.F = F
+        self.device = device
+        self.sync = torch.cuda.synchronize if str(device).startswith("cuda") else None
+    
+    def asarray(self, array):
+        return self.torch.from_numpy(array)
+    
+    def numpy(self, x):
+        return x.cpu().numpy()
+    
+    def to_device(self, x):
+        return x.to(self.device)
+    
+    def to(self, x, like):
+        if like is None or x.device == like.device:
+            return x
+        return x.to(like.device)
+    
+    def float32(self, x):
+        return x.float()
+    
+    def clone(self, x):
+        return x.detach().clone()
+    
+    def stack(self, rows):
+        return self.torch.stack(rows).float()
+    
+    def no_grad(self):
+        return self.torch.no_grad()
+    
+    def normalize(self, x):
+        return self.F.normalize(x, dim=-1)
+    
+    def mm(self, queries, matrix):
+        return self.torch.mm(queries, matrix.t())
+    
+    def batched_dot(self, rows, queries):
+        return self.torch.bmm(rows, queries.unsqueeze(2)).squeeze(2)
+    
+    def masked_fill(self, scores, mask):
+        return scores.masked_fill(~mask, float('-inf'))
+    
+    def isin(self, codes, values):
+        return self.torch.isin(codes, self.torch.tensor(values, dtype=self.torch.long, device=codes.device))
+    
+    def topk(self, scores, k):
+        return self.torch.topk(scores, k=k, dim=1)
+    
+    def gather(self, indices, order):
+        return self.torch.gather(indices, 1, order)
+    
+    def take_rows(self, matrix, indices, like):
+        indices = self.torch.as_tensor(indices)
+        rows = matrix[indices.reshape(-1).cpu()]
+        return rows.to(like.device).view(*indices.shape, -1)
@@ -0,0 +1,46 @@
+import sys
+import json
+import logging
+import argparse
+from .runner import run_benchmarks, STAGES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线性能基准: 随机初始化编码器 + 合成语料，结果输出为JSON")
+    parser.add_argument("--rows", type=int, nargs='+', default=[1000, 10000], help="合成语料条数，可指定多个（如 1000 100000 1000000）")
+    parser.add_argument("--queries", type=int, default=200, help="每项延迟测试的查询数")
+    parser.add_argument("--batch_size", type=int, default=32, help="批量检索的批大小")
+    parser.add_argument("--top_k", type=int, default=5, help="返回结果数")
+    parser.add_argument("--device", default="cpu", help="推理设备 cpu / cuda")
+    parser.add_argument("--layers", type=int, default=2, help="随机编码器层数")
+    parser.add_argument("--hidden_size", type=int, default=256, help="随机编码器隐层维度")
+    parser.add_argument("--index_batch_size", type=int, default=128, help="构建索引时的编码批大小")
+    parser.add_argument("--stages", nargs='+', default=list(STAGES), choices=STAGES, help="要运行的测试项")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--work_dir", default=None, help="工作目录，默认使用临时目录")
+    parser.add_argument("--keep", action="store_true", help="保留生成的语料与索引")
+    parser.add_argument("--output", default=None, help="结果JSON文件，默认输出到标准输出")
+    parser.add_argument("--verbose", action="store_true", help="输出INFO日志（每次检索的日志会计入延迟）")
+    args = parser.parse_args()
+    
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    
+    results = run_benchmarks(
+        rows_list=args.rows, work_dir=args.work_dir, n_queries=args.queries, batch_size=args.batch_size,
+        top_k=args.top_k, device=args.device, layers=args.layers, hidden_size=args.hidden_size,
+        index_batch_size=args.index_batch_size, stages=args.stages, seed=args.seed, keep=args.keep
+    )
+    results['config']['verbose'] = args.verbose
+    
+    text = json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"基准结果已写入: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import torch
+from ..data_processor import DataProcessor
+from ..model_loader import ModelLoader
+from ..index_builder import stream_index
+from ..ann_index import ANN_MIN_ROWS
+from ..semantic_search import SemanticSearchEngine
+from ..search_engine import MaterialSearchEngine
+from .synthetic import SyntheticCorpus, build_random_encoder
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("Benchmark")
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+RESULT_VERSION = 1
+STAGES = ("preprocess", "index_build", "cold_start", "semantic_search", "material_search")
+
+# 冷启动在独立进程中测量，包含解释器启动与全部导入
+COLD_START_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+from src.semantic_search import SemanticSearchEngine
+imported = time.perf_counter()
+engine = SemanticSearchEngine(sys.argv[1], use_fine_tuned=False, device=sys.argv[2])
+loaded = time.perf_counter()
+engine.warm_up()
+ready = time.perf_counter()
+engine.search(sys.argv[3], top_k=5, similarity_threshold=0.0)
+searched = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'model_s': engine.load_timings['model'],
+    'index_s': engine.load_timings['index'],
+    'warm_up_s': ready - loaded,
+    'first_search_s': searched - ready
+}))
+"""
+
+
+def latency_stats(seconds):
+    """延迟样本（秒）→ 毫秒统计"""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        'count': int(ms.size),
+        'mean_ms': round(float(ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'max_ms': round(float(ms.max()), 3)
+    }
+
+
+def time_calls(fn, inputs, warm_up=5):
+    """逐个调用并记录延迟，先用前 warm_up 个输入预热（不计入）"""
+    for value in inputs[:warm_up]:
+        fn(value)
+    samples = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'numpy': np.__version__,
+        'cuda': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
+    }
+
+
+def bench_preprocess(data_dir, work_dir):
+    """DataProcessor.load_and_preprocess: 首次全量分词与命中预处理缓存两种情况"""
+    cache_path = os.path.join(work_dir, "cleaned_text_cache.json")
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    result = {}
+    for name in ("cold", "cached"):
+        start = time.perf_counter()
+        datasets = DataProcessor(data_dir=data_dir, cache_path=cache_path).load_and_preprocess()
+        result[f"{name}_s"] = round(time.perf_counter() - start, 4)
+    rows = sum(len(items) for items in datasets.values())
+    result['rows_per_s'] = round(rows / result['cold_s'], 1)
+    return result
+
+
+def bench_index_build(model_dir, data_dir, device, batch_size):
+    """流式全量构建嵌入索引（预处理 + 编码 + 写盘）"""
+    model_loader = ModelLoader(model_dir)
+    model, device = model_loader.load_model(use_fine_tuned=False, device=device)
+    processor = DataProcessor(data_dir=data_dir, use_cache=False)
+    stats = stream_index(
+        model, model_loader.fingerprint, processor.iter_preprocessed(),
+        model_dir=model_dir, device=device, batch_size=batch_size, full=True
+    )
+    return {
+        'elapsed_s': round(stats['elapsed'], 4),
+        'rows_per_s': round(stats['total'] / stats['elapsed'], 1),
+        'ann_index': stats['total'] >= ANN_MIN_ROWS
+    }
+
+
+def bench_cold_start(model_dir, device, query):
+    """在新进程中加载检索引擎并执行首次检索，返回各阶段耗时（秒）"""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", COLD_START_SCRIPT, model_dir, device, query],
+        cwd=REPO_ROOT, capture_output=True, text=True, encoding='utf-8', check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_s'] = time.perf_counter() - start
+    return {name: round(value, 4) for name, value in result.items()}
+
+
+def bench_semantic_search(model_dir, corpus, device, n_queries, batch_size, top_k):
+    """SemanticSearchEngine: 单条检索延迟（禁用查询缓存）与批量检索吞吐"""
+    engine = SemanticSearchEngine(model_dir, use_fine_tuned=False, device=device, cache_size=0)
+    sentences = corpus.queries(n_queries, "sentence")
+    terms = corpus.queries(n_queries, "term")
+    filters = {'themes': corpus.themes[:3]}
+    
+    def search(query):
+        return engine.search(query, top_k=top_k, similarity_threshold=0.0)
+    
+    def filtered_search(query):
+        return engine.search(query, top_k=top_k, similarity_threshold=0.0, filters=filters)
+    
+    result = {
+        'sentence': time_calls(search, sentences),
+        'term': time_calls(search, terms),
+        'filtered': time_calls(filtered_search, sentences)
+    }
+    
+    batches = [sentences[i:i + batch_size] for i in range(0, len(sentences), batch_size)]
+    engine.search_batch(batches[0], top_k=top_k, similarity_threshold=0.0)
+    start = time.perf_counter()
+    for batch in batches:
+        engine.search_batch(batch, top_k=top_k, similarity_threshold=0.0)
+    elapsed = time.perf_counter() - start
+    result['batch'] = {
+        'batch_size': batch_size,
+        'queries_per_s': round(len(sentences) / elapsed, 1),
+        'mean_batch_ms': round(elapsed / len(batches) * 1000, 3)
+    }
+    # 引擎内部的分阶段耗时（覆盖以上全部检索）
+    result['stages'] = engine.stats()['stages']
+    return result
+
+
+def bench_material_search(model_dir, data_dir, corpus, n_queries, top_k):
+    """MaterialSearchEngine（BM25）: 索引构建、复用磁盘索引及检索延迟"""
+    result = {}
+    for name in ("build", "load"):
+        engine = MaterialSearchEngine(model_dir, data_dir=data_dir)
+        start = time.perf_counter()
+        engine.load_data()
+        result[f"{name}_s"] = round(time.perf_counter() - start, 4)
+    result['search'] = time_calls(lambda query: engine.search(query, top_k=top_k), corpus.queries(n_queries, "sentence"))
+    return result
+
+
+def run_benchmarks(rows_list=(1000, 10000), work_dir=None, n_queries=200, batch_size=32, top_k=5,
+                   device="cpu", layers=2, hidden_size=256, index_batch_size=128, stages=STAGES,
+                   seed=0, keep=False):
+    """在合成语料上依次测量各阶段，返回可序列化为JSON的结果字典"""
+    owns_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="ca-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    
+    config = {
+        'rows': list(rows_list), 'queries': n_queries, 'batch_size': batch_size, 'top_k': top_k,
+        'device': device, 'layers': layers, 'hidden_size': hidden_size,
+        'index_batch_size': index_batch_size, 'stages': list(stages), 'seed': seed
+    }
+    results = {'version': RESULT_VERSION, 'environment': environment(), 'config': config, 'runs': []}
+    
+    try:
+        encoder_dir = os.path.join(work_dir, "encoder")
+        alphabet = SyntheticCorpus(0, seed=seed).alphabet
+        build_random_encoder(encoder_dir, alphabet, layers=layers, hidden_size=hidden_size, seed=seed)
+        
+        for rows in rows_list:
+            logger.info(f"=== 基准测试: {rows} 条 ===")
+            run_dir = os.path.join(work_dir, f"rows_{rows}")
+            data_dir = os.path.join(run_dir, "data")
+            model_dir = os.path.join(run_dir, "model")
+            shutil.rmtree(run_dir, ignore_errors=True)
+            shutil.copytree(encoder_dir, os.path.join(model_dir, "pretrained"))
+            corpus = SyntheticCorpus(rows, seed=seed)
+            corpus.write(data_dir)
+            
+            run = {'rows': rows}
+            if "preprocess" in stages:
+                run['preprocess'] = bench_preprocess(data_dir, run_dir)
+            # 检索相关阶段依赖已构建的索引
+            if any(stage in stages for stage in STAGES[1:4]):
+                run['index_build'] = bench_index_build(model_dir, data_dir, device, index_batch_size)
+            if "cold_start" in stages:
+                run['cold_start'] = bench_cold_start(model_dir, device, corpus.queries(1, "sentence")[0])
+            if "semantic_search" in stages:
+                run['semantic_search'] = bench_semantic_search(model_dir, corpus, device, n_queries, batch_size, top_k)
+            if "material_search" in stages:
+                run['material_search'] = bench_material_search(model_dir, data_dir, corpus, n_queries, top_k)
+            results['runs'].append(run)
+            if not keep:
+                shutil.rmtree(run_dir, ignore_errors=True)
+    finally:
+        if owns_work_dir and not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
@@ -0,0 +1,114 @@
+import os
+import json
+import random
+import logging
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("Synthetic")
+
+# 各类素材的占比及正文长度范围（与真实语料相近: 名言短句、事例约百字、诗句十余字）
+CORPUS_SHAPE = {
+    'quotes': (0.4, 8, 30),
+    'examples': (0.3, 60, 140),
+    'poems': (0.3, 10, 24),
+}
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+PUNCTUATION = "，。；！？"
+
+
+def _alphabet(size=3000, seed=0):
+    """从常用汉字区间中抽取固定的字表"""
+    rng = random.Random(seed)
+    return [chr(c) for c in rng.sample(range(0x4e00, 0x9fa6), size)]
+
+
+class SyntheticCorpus:
+    """按固定随机种子生成与素材文件格式一致的合成语料，可复现且无需下载数据"""
+    def __init__(self, rows, seed=0, alphabet_size=3000, n_keywords=2000, n_themes=60, n_sources=500):
+        self.rows = rows
+        self.seed = seed
+        self.alphabet = _alphabet(alphabet_size, seed)
+        rng = random.Random(seed + 1)
+        self.keywords = list(dict.fromkeys(self._word(rng, 2, 3) for _ in range(n_keywords)))
+        self.themes = list(dict.fromkeys(self._word(rng, 4, 4) for _ in range(n_themes)))
+        self.sources = [f"《{self._word(rng, 2, 6)}》" for _ in range(n_sources)]
+    
+    def _word(self, rng, min_len, max_len):
+        return ''.join(rng.choices(self.alphabet, k=rng.randint(min_len, max_len)))
+    
+    def _sentence(self, rng, min_len, max_len):
+        length = rng.randint(min_len, max_len)
+        chars = rng.choices(self.alphabet, k=length)
+        # 每隔若干字插入标点，接近真实文本的分句
+        for pos in range(rng.randint(5, 12), length - 1, rng.randint(6, 14)):
+            chars[pos] = rng.choice(PUNCTUATION)
+        return ''.join(chars)
+    
+    def counts(self):
+        """各类素材条数（合计为 rows）"""
+        counts = {name: int(self.rows * share) for name, (share, _, _) in CORPUS_SHAPE.items()}
+        counts['quotes'] += self.rows - sum(counts.values())
+        return counts
+    
+    def iter_items(self, data_type):
+        """逐条生成某类素材"""
+        _, min_len, max_len = CORPUS_SHAPE[data_type]
+        rng = random.Random(f"{self.seed}-{data_type}")
+        for _ in range(self.counts()[data_type]):
+            yield {
+                'content': self._sentence(rng, min_len, max_len),
+                'source': rng.choice(self.sources),
+                'keywords': rng.sample(self.keywords, 3),
+                'theme': rng.choice(self.themes)
+            }
+    
+    def write(self, data_dir):
+        """以JSONL格式流式写出三类素材文件"""
+        os.makedirs(data_dir, exist_ok=True)
+        for data_type in CORPUS_SHAPE:
+            path = os.path.join(data_dir, f"{data_type}.jsonl")
+            with open(path, 'w', encoding='utf-8') as f:
+                for item in self.iter_items(data_type):
+                    f.write(json.dumps(item, ensure_ascii=False))
+                    f.write('\n')
+        logger.info(f"合成语料已写入: {data_dir} ({self.rows} 条)")
+        return data_dir
+    
+    def queries(self, n, kind="sentence", seed=None):
+        """生成查询: sentence 为正文片段（需编码器前向），term 为关键词/主题（命中词典）"""
+        rng = random.Random(self.seed + 2 if seed is None else seed)
+        if kind == "term":
+            return [rng.choice(self.keywords + self.themes) for _ in range(n)]
+        return [self._sentence(rng, 4, 16) for _ in range(n)]
+
+
+def build_random_encoder(output_dir, alphabet, layers=2, hidden_size=256, heads=4, max_length=256, seed=0):
+    """生成随机初始化的BERT编码器（与 chinese_roberta 同结构，层数与宽度缩小）
+    
+    以与 model/pretrained 相同的 HuggingFace 目录格式保存，SentenceTransformer
+    加载时自动添加均值池化，无需下载任何模型。
+    """
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    
+    os.makedirs(output_dir, exist_ok=True)
+    vocab_path = os.path.join(output_dir, "vocab.txt")
+    vocab = list(dict.fromkeys(SPECIAL_TOKENS + list(PUNCTUATION) + [str(d) for d in range(10)] + list(alphabet)))
+    with open(vocab_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(vocab))
+        f.write('\n')
+    
+    torch.manual_seed(seed)
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=heads,
+        intermediate_size=hidden_size * 4,
+        max_position_embeddings=max_length
+    )
+    BertModel(config).save_pretrained(output_dir)
+    BertTokenizerFast(vocab_file=vocab_path, model_max_length=max_length).save_pretrained(output_dir)
+    logger.info(f"随机编码器已生成: {output_dir} ({layers} 层, 隐层 {hidden_size})")
+    return output_dir
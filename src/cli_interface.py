@@ -1,32 +1,105 @@
-import torch,os
+import os
+import threading
+from .startup_profile import StartupProfile
+
 class CLIInterface:
-    def __init__(self, model_dir="model", use_fine_tuned=True):
-        from .semantic_search import SemanticSearchEngine
-        from .model_loader import ModelLoader
-        
-        # 自动选择设备
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"使用设备: {'GPU加速' if device == 'cuda' else 'CPU运行'}")
-        
-        self.engine = SemanticSearchEngine(
-            model_dir=model_dir,
-            use_fine_tuned=use_fine_tuned,
-            device=device
-        )
-        
-        # 检查是否有微调模型可用
-        model_loader = ModelLoader(model_dir)
-        self.has_fine_tuned = os.path.exists(os.path.join(model_dir, "fine_tuned"))
-        self.has_embeddings = os.path.exists(os.path.join(model_dir, "embeddings.pt"))
+    def __init__(self, model_dir="model", use_fine_tuned=True, precision="fp32", backend="torch", mode="semantic",
+                 background=False, profile=None):
+        """background=True 时立即返回，模型与索引在后台线程加载并预热，首次检索时再等待加载完成"""
+        self.model_dir = model_dir
+        self.use_fine_tuned = use_fine_tuned
+        self.precision = precision
+        self.backend = backend
+        self.mode = mode
+        self.profile = profile or StartupProfile()
+        self.engine = None
+        self.searcher = None
+        self.load_error = None
+        self._messages = []
+        self._ready = threading.Event()
         
-        if self.has_fine_tuned and self.has_embeddings:
-            print("使用微调模型和预计算嵌入向量")
-        elif self.has_fine_tuned:
-            print("使用微调模型（实时编码）")
+        if background:
+            threading.Thread(target=self._load, daemon=True, name="CLILoader").start()
         else:
-            print("使用预训练模型（实时编码）")
+            self._load()
+            self._flush_messages()
+            if self.load_error is not None:
+                raise self.load_error
+    
+    def _load(self):
+        """加载模型与索引并预热，状态信息暂存到 _messages"""
+        try:
+            # 延迟导入: torch 与 sentence-transformers 导入耗时较长，onnx/snapshot 后端完全不导入torch
+            with self.profile.phase("导入依赖"):
+                if self.backend == "torch":
+                    import torch
+                from .semantic_search import SemanticSearchEngine
+                from .embedding_store import has_embedding_index
+            
+            # 自动选择设备（onnx/snapshot 后端只在CPU上推理）
+            device = "cpu"
+            if self.backend == "torch":
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+                self._messages.append(f"PyTorch版本: {torch.__version__} | CUDA可用: {torch.cuda.is_available()}")
+                if device == "cuda":
+                    self._messages.append(f"GPU设备: {torch.cuda.get_device_name(0)}")
+            self._messages.append(f"使用设备: {'GPU加速' if device == 'cuda' else 'CPU运行'}")
+            
+            self.engine = SemanticSearchEngine(
+                model_dir=self.model_dir,
+                use_fine_tuned=self.use_fine_tuned,
+                device=device,
+                precision=self.precision,
+                backend=self.backend
+            )
+            self.profile.add("加载模型", self.engine.load_timings['model'])
+            self.profile.add("加载索引", self.engine.load_timings['index'])
+            self._messages.append(f"推理精度: {self.engine.precision} | 推理后端: {self.backend}")
+            
+            # 混合检索: BM25词法召回 + 语义重排
+            searcher = self.engine
+            if self.mode == "hybrid":
+                from .hybrid_search import HybridSearchEngine
+                with self.profile.phase("加载词法索引"):
+                    searcher = HybridSearchEngine(self.engine)
+                self._messages.append("检索模式: 混合检索（词法 + 语义）")
+            
+            # 检查是否有微调模型可用
+            self.has_fine_tuned = os.path.exists(os.path.join(self.model_dir, "fine_tuned"))
+            self.has_embeddings = has_embedding_index(self.model_dir)
+            
+            if self.has_fine_tuned and self.has_embeddings:
+                self._messages.append("使用微调模型和预计算嵌入向量")
+            elif self.has_fine_tuned:
+                self._messages.append("使用微调模型（实时编码）")
+            else:
+                self._messages.append("使用预训练模型（实时编码）")
+            
+            # 预热，避免首次检索承担延迟初始化开销
+            self.profile.add("预热编码", self.engine.warm_up())
+            self.searcher = searcher
+            self.profile.mark("模型就绪")
+        except Exception as e:
+            self.load_error = e
+        finally:
+            self._ready.set()
+    
+    def _flush_messages(self):
+        for message in self._messages:
+            print(message)
+        self._messages = []
+    
+    def wait_until_ready(self):
+        """等待后台加载完成，加载失败时抛出异常"""
+        if not self._ready.is_set():
+            print("模型加载中，请稍候...")
+            self._ready.wait()
+        self._flush_messages()
+        if self.load_error is not None:
+            raise self.load_error
     
     def run(self):
+        self.profile.mark("显示提示符")
         print("\n=== 作文素材智能检索工具 ===")
         print("支持检索类型: 名言(1) 事例(2) 古诗文(3) 全部(4)")
         
@@ -55,13 +128,19 @@ class CLIInterface:
                     print("无效的结果数，使用默认值5")
                     top_k = 5
 
-                results = self.engine.search(
+                self.wait_until_ready()
+                results = self.searcher.search(
                     query, 
                     top_k=top_k, 
                     category=category,
                     similarity_threshold=similarity_threshold
                 )
                 
+                # 首次检索完成后输出启动耗时报告
+                if self.profile.enabled and not self.profile.reported:
+                    self.profile.mark("首次检索完成")
+                    print(self.profile.report())
+                
                 if not results:
                     print("\n未找到相关素材")
                     continue
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import logging
+from itertools import islice
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("CorpusReader")
+
+CORPUS_TYPES = ('quotes', 'examples', 'poems')
+READ_SIZE = 1 << 16
+# 单个元素的缓冲上限（字符数），超过时视为文件损坏，避免缓冲区随文件大小增长
+MAX_ITEM_SIZE = 1 << 24
+
+_decoder = json.JSONDecoder()
+# 数字可能在这些字符处被缓冲区截断（如"1."、"1.5e"），解码出的只是前缀
+_NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*\Z')
+
+
+def iter_jsonl(f):
+    """逐行读取JSONL，跳过空行"""
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"第 {line_no} 行不是合法的JSON: {str(e)}") from e
+
+
+def _check_trailing(f, rest, read_size):
+    """数组结束的']'之后直到文件末尾只允许空白"""
+    rest = rest or f.read(read_size)
+    while rest:
+        if not rest.isspace():
+            raise ValueError("JSON数组结束后还有多余内容")
+        rest = f.read(read_size)
+
+
+def iter_json_array(f, read_size=READ_SIZE, max_item_size=MAX_ITEM_SIZE):
+    """惰性解析顶层JSON数组，逐个产出元素
+    
+    每次只读取 read_size 个字符，缓冲区中只保留尚未解析完的一个元素，
+    内存占用与单条素材大小相关而与文件大小无关；单个元素超过 max_item_size 个字符
+    （包括元素损坏、始终无法解析的情况）时抛出 ValueError。元素之间必须恰好有一个逗号，
+    缺少、重复、开头或结尾多余的逗号，以及']'之后的非空白内容都视为文件损坏并抛出 ValueError。
+    """
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+    # 下一个期望的记号: 'first' 元素或']'，'value' 元素（逗号之后），'separator' 逗号或']'
+    expect = 'first'
+    count = 0
+    
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("JSON数组不完整")
+            chunk = f.read(read_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        
+        char = buffer[pos]
+        if not started:
+            if char != '[':
+                raise ValueError("素材文件顶层必须是JSON数组")
+            started = True
+            pos += 1
+            continue
+        
+        if expect == 'separator':
+            if char == ']':
+                _check_trailing(f, buffer[pos + 1:], read_size)
+                return
+            if char != ',':
+                raise ValueError(f"JSON数组第 {count} 个元素之后缺少逗号")
+            expect = 'value'
+            pos += 1
+            continue
+        if char == ']':
+            if expect == 'value':
+                raise ValueError(f"JSON数组第 {count} 个元素之后有多余的逗号")
+            _check_trailing(f, buffer[pos + 1:], read_size)
+            return
+        if char == ',':
+            raise ValueError(f"JSON数组第 {count + 1} 个元素之前有多余的逗号")
+        
+        try:
+            item, end = _decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # 元素跨越了缓冲区边界，继续读取
+            if eof:
+                raise
+            if len(buffer) - pos > max_item_size:
+                raise ValueError(f"JSON数组第 {count + 1} 个元素超过 {max_item_size} 个字符仍无法解析，文件可能已损坏")
+            chunk = f.read(read_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        
+        # 数字在缓冲区末尾可能被截断（截断处之前仍是合法数字），其后出现分隔符或读到文件末尾才算完整
+        if not eof and not isinstance(item, (dict, list, str)) and _NUMBER_TAIL.match(buffer, end):
+            if len(buffer) - pos > max_item_size:
+                raise ValueError(f"JSON数组第 {count + 1} 个元素超过 {max_item_size} 个字符仍无法解析，文件可能已损坏")
+            chunk = f.read(read_size)
+            buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+            continue
+        yield item
+        count += 1
+        expect = 'separator'
+        pos = end
+
+
+def iter_batches(iterable, batch_size):
+    """将可迭代对象切分为不超过 batch_size 的列表"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_corpus_file(path):
+    """按扩展名流式读取素材文件（.jsonl 逐行，.json 惰性解析数组）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            yield from iter_jsonl(f)
+        else:
+            yield from iter_json_array(f)
+
+
+def find_corpus_file(data_dir, data_type):
+    """查找某类素材文件，同时存在时优先使用 .jsonl"""
+    for ext in ('.jsonl', '.json'):
+        path = os.path.join(data_dir, f"{data_type}{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def iter_corpus(data_dir, file_types=CORPUS_TYPES):
+    """依次流式产出 (类别, 素材)，同一类别的素材连续产出"""
+    for data_type in file_types:
+        path = find_corpus_file(data_dir, data_type)
+        if path is None:
+            logger.warning(f"文件不存在: {os.path.join(data_dir, data_type)}.json(l)")
+            continue
+        for item in iter_corpus_file(path):
+            yield data_type, item
@@ -1,72 +1,218 @@
 import json
 import os
 import re
+import hashlib
 import jieba
 import logging
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from .corpus_reader import CORPUS_TYPES, find_corpus_file, iter_corpus_file, iter_batches
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("DataProcessor")
 
+CACHE_FILE = "cleaned_text_cache.json"
+# 清理规则变化时递增，使已有缓存失效
+CLEAN_VERSION = 1
+# 待清理条数少于该值时串行处理，避免进程池启动开销
+PARALLEL_MIN_ITEMS = 2000
+CHUNK_SIZE = 1000
+# 流式预处理时每批处理的素材条数
+STREAM_CHUNK_SIZE = 10000
+# 预处理缓存条目上限（超过时先淘汰最久未用到的条目，当前语料的条目总会保留）
+CACHE_MAX_ENTRIES = 200000
+
+STOPWORDS = frozenset([
+    "的", "了", "和", "是", "就", "都", "而", "及", "与", "等", "在", "这",
+    "有", "以", "于", "之", "为", "对", "中", "下", "后", "由", "来", "到",
+    "去", "上", "出", "要", "但", "从", "并", "也", "又", "或", "一个", "没有"
+])
+
+# 移除特殊字符和标点，保留中文字符
+_SPECIAL_CHARS = re.compile(r'[^\w\s\u4e00-\u9fff]')
+
+_worker_stopwords = STOPWORDS
+
+
+def clean_text(text, stopwords=STOPWORDS):
+    """清理文本: 去除标点、分词并过滤停用词和单字"""
+    text = _SPECIAL_CHARS.sub('', text)
+    
+    # 分词
+    try:
+        words = jieba.cut(text)
+    except Exception:
+        words = text.split()
+    
+    words = (word.strip() for word in words)
+    return ' '.join(word for word in words if len(word) > 1 and word not in stopwords)
+
+
+def _init_worker(stopwords):
+    """进程池初始化: 每个工作进程只加载一次jieba词典"""
+    global _worker_stopwords
+    _worker_stopwords = stopwords
+    jieba.setLogLevel(logging.INFO)
+    jieba.initialize()
+
+
+def _clean_chunk(texts):
+    return [clean_text(text, _worker_stopwords) for text in texts]
+
+
+def text_hash(text):
+    """原始文本哈希（含清理规则版本），作为清理缓存的键"""
+    return hashlib.sha1(f"{CLEAN_VERSION}\n{text}".encode('utf-8')).hexdigest()
+
+
+def build_model_text(item):
+    """创建模型输入文本"""
+    text = f"{item['content']} [SEP] {' '.join(item['keywords'])}"
+    if 'theme' in item:
+        text += f" [SEP] {item['theme']}"
+    return text
+
+
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, workers=None, cache_path=None, use_cache=True, data_dir=None):
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.data_dir = os.path.join(base_dir, 'data')
+        default_data_dir = os.path.join(base_dir, 'data')
+        self.data_dir = data_dir or default_data_dir
+        self.cache_path = cache_path or os.path.join(base_dir, 'model', self._cache_file(default_data_dir))
+        self.use_cache = use_cache
+        self.workers = workers or os.cpu_count() or 1
         self.stopwords = self._load_stopwords()
         jieba.setLogLevel(logging.INFO)
-        
+    
+    def _cache_file(self, default_data_dir):
+        """默认数据目录使用 cleaned_text_cache.json，其他数据目录按路径哈希使用各自的缓存文件"""
+        if os.path.abspath(self.data_dir) == default_data_dir:
+            return CACHE_FILE
+        name, ext = os.path.splitext(CACHE_FILE)
+        return f"{name}-{hashlib.sha1(os.path.abspath(self.data_dir).encode('utf-8')).hexdigest()[:12]}{ext}"
+    
+    def _merge_cache(self, cache, used_cache, prune=True):
+        """合并缓存: 本次用到的条目移到末尾（最近使用），超出上限时从最久未用的条目开始淘汰"""
+        merged = {h: text for h, text in cache.items() if h not in used_cache}
+        merged.update(used_cache)
+        excess = len(merged) - max(CACHE_MAX_ENTRIES, len(used_cache))
+        if prune and excess > 0:
+            merged = dict(list(merged.items())[excess:])
+        return merged
+    
     def _load_stopwords(self):
         """加载中文停用词表"""
-        stopwords = set([
-            "的", "了", "和", "是", "就", "都", "而", "及", "与", "等", "在", "这", 
-            "有", "以", "于", "之", "为", "对", "中", "下", "后", "由", "来", "到", 
-            "去", "上", "出", "要", "但", "从", "并", "也", "又", "或", "一个", "没有"
-        ])
-        return stopwords
+        return set(STOPWORDS)
     
     def clean_text(self, text):
         """清理文本 - 更健壮的实现"""
-        # 移除特殊字符和标点
-        text = re.sub(r'[^\w\s\u4e00-\u9fff]', '', text)  # 保留中文字符
-        
-        # 分词
+        return clean_text(text, self.stopwords)
+    
+    def _load_cache(self):
+        """读取 文本哈希 → cleaned_text 缓存，损坏时忽略"""
+        if not self.use_cache or not os.path.exists(self.cache_path):
+            return {}
         try:
-            words = jieba.cut(text)
-        except:
-            words = text.split()
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"预处理缓存读取失败，将重新分词: {str(e)}")
+            return {}
+    
+    def _save_cache(self, cache):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+    
+    def _create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(frozenset(self.stopwords),))
+    
+    def clean_texts(self, texts, executor=None):
+        """批量清理文本，条数较多时分块交给进程池并行处理
         
-        # 过滤停用词和单字
-        words = [word.strip() for word in words if word.strip()]
-        words = [word for word in words if word not in self.stopwords and len(word) > 1]
+        传入 executor 时复用已有进程池，否则临时创建。
+        """
+        if len(texts) < PARALLEL_MIN_ITEMS or self.workers <= 1:
+            return [self.clean_text(text) for text in texts]
         
-        return ' '.join(words)
-
+        chunks = [texts[i:i+CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+        logger.info(f"使用 {self.workers} 个进程并行预处理 {len(texts)} 条文本")
+        if executor is not None:
+            return [text for chunk in executor.map(_clean_chunk, chunks) for text in chunk]
+        with self._create_executor() as executor:
+            return [text for chunk in executor.map(_clean_chunk, chunks) for text in chunk]
+    
+    def preprocess_items(self, items, cache=None, executor=None):
+        """为素材填充 cleaned_text，命中缓存的条目不再分词；返回(本次用到的缓存条目, 重新分词条数)"""
+        cache = {} if cache is None else cache
+        texts = [build_model_text(item) for item in items]
+        hashes = [text_hash(text) for text in texts]
+        
+        missing = [i for i, h in enumerate(hashes) if h not in cache]
+        if missing:
+            cleaned = self.clean_texts([texts[i] for i in missing], executor)
+            for i, text in zip(missing, cleaned):
+                cache[hashes[i]] = text
+        
+        for item, h in zip(items, hashes):
+            item['cleaned_text'] = cache[h]
+        return {h: cache[h] for h in hashes}, len(missing)
+    
+    def iter_preprocessed(self, file_types=CORPUS_TYPES, chunk_size=STREAM_CHUNK_SIZE):
+        """流式加载并预处理素材，按批产出 (类别, 素材列表)
+        
+        素材文件逐条读取（支持 .jsonl 与 .json 数组），每次只有一批素材驻留内存；
+        进程池在整个流中复用。全部产出后才写回预处理缓存。
+        缺失的文件跳过；文件读取或解析出错时抛出 ValueError（此前的批次可能已产出），
+        调用方（如流式建索引）随之放弃，不会提交只含部分语料的索引。
+        """
+        cache = self._load_cache()
+        used_cache = {}
+        cleaned_count = 0
+        total = 0
+        failed = False
+        executor = None
+        
+        try:
+            for file_type in file_types:
+                file_path = find_corpus_file(self.data_dir, file_type)
+                if file_path is None:
+                    logger.warning(f"文件不存在: {os.path.join(self.data_dir, file_type)}.json")
+                    failed = True
+                    continue
+                
+                count = 0
+                try:
+                    for chunk in iter_batches(iter_corpus_file(file_path), chunk_size):
+                        if executor is None and len(chunk) >= PARALLEL_MIN_ITEMS and self.workers > 1:
+                            executor = self._create_executor()
+                        entries, cleaned = self.preprocess_items(chunk, cache, executor)
+                        used_cache.update(entries)
+                        cleaned_count += cleaned
+                        count += len(chunk)
+                        yield file_type, chunk
+                except (OSError, ValueError, KeyError) as e:
+                    # 前面的批次可能已交给调用方，跳过该文件继续会得到不完整的语料（如被提交为新索引）
+                    raise ValueError(f"处理文件 {file_path} 时出错（已读取 {count} 条）: {str(e)}") from e
+                total += count
+                logger.info(f"成功加载 {count} 条 {file_type} 数据")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        # 保留此前的条目（另一份语料或缺失的文件仍可复用），只按总量淘汰最久未用的条目；
+        # 本次有文件缺失时不淘汰
+        if self.use_cache and cleaned_count:
+            self._save_cache(self._merge_cache(cache, used_cache, prune=not failed))
+        logger.info(f"预处理完成: 共 {total} 条, 缓存命中 {total - cleaned_count} 条, 重新分词 {cleaned_count} 条")
+    
     def load_and_preprocess(self):
         """加载并预处理所有素材"""
         datasets = defaultdict(list)
-        file_types = ['quotes', 'examples', 'poems']
-        
-        for file_type in file_types:
-            file_path = os.path.join(self.data_dir, f"{file_type}.json")
-            if not os.path.exists(file_path):
-                logger.warning(f"文件不存在: {file_path}")
-                continue
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for item in data:
-                        # 创建模型输入文本
-                        text = f"{item['content']} [SEP] {' '.join(item['keywords'])}"
-                        if 'theme' in item:
-                            text += f" [SEP] {item['theme']}"
-                        
-                        # 添加清理后的文本
-                        item['cleaned_text'] = self.clean_text(text)
-                        datasets[file_type].append(item)
-                logger.info(f"成功加载 {len(data)} 条 {file_type} 数据")
-            except Exception as e:
-                logger.error(f"处理文件 {file_path} 时出错: {str(e)}")
-        
-        return datasets
\ No newline at end of file
+        for file_type, items in self.iter_preprocessed():
+            datasets[file_type].extend(items)
+        return datasets
@@ -1,21 +1,21 @@
-import json
 import os
+from .corpus_reader import CORPUS_TYPES, find_corpus_file, iter_corpus_file
 
-def load_dataset(data_type="all"):
+def _dataset_files(data_type, data_dir=None):
+    data_dir = data_dir or os.path.join(os.path.dirname(__file__), '../data')
+    for name in CORPUS_TYPES:
+        if data_type in [name, "all"]:
+            path = find_corpus_file(data_dir, name)
+            if path is None:
+                raise FileNotFoundError(f"素材文件不存在: {os.path.join(data_dir, name)}.json")
+            yield name, path
+
+def iter_dataset(data_type="all", data_dir=None):
+    """流式读取指定类型的素材，逐条产出(类别, 素材)"""
+    for name, path in _dataset_files(data_type, data_dir):
+        for item in iter_corpus_file(path):
+            yield name, item
+
+def load_dataset(data_type="all", data_dir=None):
     """加载指定类型的素材数据"""
-    data_dir = os.path.join(os.path.dirname(__file__), '../data')
-    datasets = {}
-    
-    if data_type in ["quotes", "all"]:
-        with open(os.path.join(data_dir, 'quotes.json'), 'r', encoding='utf-8') as f:
-            datasets['quotes'] = json.load(f)
-    
-    if data_type in ["examples", "all"]:
-        with open(os.path.join(data_dir, 'examples.json'), 'r', encoding='utf-8') as f:
-            datasets['examples'] = json.load(f)
-    
-    if data_type in ["poems", "all"]:
-        with open(os.path.join(data_dir, 'poems.json'), 'r', encoding='utf-8') as f:
-            datasets['poems'] = json.load(f)
-    
-    return datasets
\ No newline at end of file
+    return {name: list(iter_corpus_file(path)) for name, path in _dataset_files(data_type, data_dir)}
@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("EmbeddingStore")
+
+STORE_FILE = "embeddings.npy"
+MANIFEST_FILE = "embeddings_manifest.json"
+LEGACY_FILE = "embeddings.pt"
+SCALE_FILE = "embeddings_scale.npy"
+FORMAT_VERSION = 1
+# 每次构建写入 model_dir 下新的索引代目录，根目录清单记录当前代
+GENERATION_PREFIX = "index-"
+
+# 紧凑存储精度: float16 约减半内存，int8（每行对称缩放）约为四分之一
+# 归一化向量下余弦分数的最大偏差: float16 约1e-3，int8 约1e-2；
+# 开启精确重排时，只要真实top-k落在候选集中，返回结果与float32完全一致
+PRECISIONS = ("float32", "float16", "int8")
+
+
+def index_dir(model_dir="model"):
+    """当前索引所在的目录
+    
+    索引的全部文件（嵌入、元数据、行哈希、关键词词典、IVF索引）写在同一个索引代目录中，
+    根目录清单的原子替换是唯一的提交点，读取方要么看到完整的旧索引，要么看到完整的新索引。
+    旧版平铺布局（清单中没有 generation）以及索引代目录本身返回 model_dir。
+    """
+    manifest = load_manifest(model_dir)
+    if manifest is None or 'generation' not in manifest:
+        return model_dir
+    return os.path.join(model_dir, manifest['generation'])
+
+
+def has_embedding_index(model_dir):
+    """检查是否存在预计算嵌入（新格式或旧版embeddings.pt）"""
+    return (os.path.exists(os.path.join(index_dir(model_dir), STORE_FILE))
+            or os.path.exists(os.path.join(model_dir, LEGACY_FILE)))
+
+
+def normalize_rows(embeddings):
+    """按行L2归一化，返回连续的float32数组"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(embeddings / norms, dtype=np.float32)
+
+
+def quantize_rows(embeddings, precision):
+    """将归一化嵌入转换为紧凑精度，返回(数据, 每行缩放系数或None)"""
+    if precision == "float16":
+        return embeddings.astype(np.float16), None
+    if precision == "int8":
+        # 对称量化: 每行以最大绝对值映射到127
+        scale = np.abs(embeddings).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        data = np.clip(np.rint(embeddings / scale[:, None]), -127, 127).astype(np.int8)
+        return data, scale.astype(np.float32)
+    raise ValueError(f"不支持的存储精度: {precision}")
+
+
+def _save_array(path, array):
+    """先写临时文件再替换，避免读取方看到写了一半的文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class _NpyStreamWriter:
+    """逐块追加行的 .npy 写入器（行数事先未知）
+    
+    预留固定长度的文件头，关闭时写入最终形状并原子替换目标文件。
+    """
+    HEADER_BYTES = 128
+    
+    def __init__(self, path, dtype, dim):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.dim = dim
+        self.rows = 0
+        self.tmp_path = path + ".tmp"
+        self._file = open(self.tmp_path, 'wb')
+        self._file.write(b'\0' * self.HEADER_BYTES)
+    
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype)
+        self._file.write(rows.tobytes())
+        self.rows += rows.shape[0]
+    
+    def _header(self):
+        header = repr({'descr': np.lib.format.dtype_to_descr(self.dtype),
+                       'fortran_order': False, 'shape': (self.rows, self.dim)})
+        # 魔数(6) + 版本(2) + 头长度(2)，头部以空格补齐并以换行结尾
+        header_len = self.HEADER_BYTES - 10
+        header = header.ljust(header_len - 1) + '\n'
+        if len(header) != header_len:
+            raise ValueError(f"嵌入形状过大，无法写入: {(self.rows, self.dim)}")
+        return b'\x93NUMPY\x01\x00' + header_len.to_bytes(2, 'little') + header.encode('latin1')
+    
+    def close(self):
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+    
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class EmbeddingStoreWriter:
+    """分块写入嵌入存储: 每块归一化后追加到新索引代目录的 embeddings.npy（及紧凑副本）
+    
+    内存占用只与块大小相关，可用于流式构建超大规模索引；close() 最后写入根目录清单，
+    切换到新的索引代。同一索引的其他文件应写入 index_dir。
+    """
+    def __init__(self, model_dir="model", precision="float32"):
+        if precision not in PRECISIONS:
+            raise ValueError(f"不支持的存储精度: {precision}")
+        self.model_dir = model_dir
+        self.precision = precision
+        os.makedirs(model_dir, exist_ok=True)
+        self.index_dir = tempfile.mkdtemp(prefix=GENERATION_PREFIX, dir=model_dir)
+        self._store = None
+        self._compact = None
+        self._scales = []
+        self._manifest = None
+    
+    @property
+    def rows(self):
+        return self._store.rows if self._store is not None else 0
+    
+    def append(self, embeddings):
+        if hasattr(embeddings, 'detach'):
+            # torch张量（不为此导入torch）
+            embeddings = embeddings.detach().cpu().float().numpy()
+        embeddings = normalize_rows(embeddings)
+        if self._store is None:
+            dim = embeddings.shape[1]
+            self._store = _NpyStreamWriter(os.path.join(self.index_dir, STORE_FILE), np.float32, dim)
+            if self.precision != "float32":
+                dtype = np.float16 if self.precision == "float16" else np.int8
+                compact_path = os.path.join(self.index_dir, f"embeddings_{self.precision}.npy")
+                self._compact = _NpyStreamWriter(compact_path, dtype, dim)
+        
+        self._store.append(embeddings)
+        if self._compact is not None:
+            data, scale = quantize_rows(embeddings, self.precision)
+            self._compact.append(data)
+            if scale is not None:
+                self._scales.append(scale)
+    
+    def close(self):
+        """写入文件头与清单，返回 embeddings.npy 路径"""
+        self.finish()
+        return self.commit()
+    
+    def finish(self):
+        """写完嵌入文件（及紧凑副本）与索引代自身的清单，但暂不切换根目录清单
+        
+        根目录清单是索引的提交点: 调用方可在 finish() 与 commit() 之间向 index_dir 写入依赖嵌入的其他文件。
+        """
+        if self._store is None:
+            raise ValueError("没有写入任何嵌入")
+        self._store.close()
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'rows': int(self._store.rows),
+            'dim': int(self._store.dim),
+            'dtype': 'float32',
+            'normalized': True,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        
+        if self._compact is not None:
+            self._compact.close()
+            compact = {'precision': self.precision, 'file': os.path.basename(self._compact.path)}
+            if self._scales:
+                compact['scale_file'] = SCALE_FILE
+                _save_array(os.path.join(self.index_dir, SCALE_FILE), np.concatenate(self._scales))
+            manifest['compact'] = compact
+            ratio = self._compact.dtype.itemsize / np.dtype(np.float32).itemsize
+            logger.info(f"紧凑嵌入已保存: {compact['file']} ({ratio:.0%} 内存)")
+        _write_manifest(self.index_dir, manifest)
+        self._manifest = manifest
+    
+    def commit(self):
+        """原子替换根目录清单，切换到新的索引代，返回 embeddings.npy 路径
+        
+        保留上一代供仍在加载旧索引的读取方使用，更早的索引代随之删除。
+        """
+        manifest = self._manifest
+        previous = load_manifest(self.model_dir)
+        generation = os.path.basename(self.index_dir)
+        _write_manifest(self.model_dir, dict(manifest, generation=generation))
+        
+        keep = {generation, (previous or {}).get('generation')}
+        for name in os.listdir(self.model_dir):
+            if name.startswith(GENERATION_PREFIX) and name not in keep:
+                # Windows上仍被内存映射的文件无法删除，留待下次提交时清理
+                shutil.rmtree(os.path.join(self.model_dir, name), ignore_errors=True)
+        
+        logger.info(f"嵌入存储已保存: {self._store.path} ({manifest['rows']} 条, 维度: {manifest['dim']})")
+        return self._store.path
+    
+    def abort(self):
+        """放弃写入，删除新索引代目录，已有索引保持不变"""
+        for writer in (self._store, self._compact):
+            if writer is not None:
+                writer.abort()
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+
+def _write_manifest(directory, manifest):
+    """写入清单（原子替换）"""
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def save_embedding_store(embeddings, model_dir="model", precision="float32"):
+    """将嵌入向量归一化后写入新的索引代（embeddings.npy 及清单）
+    
+    precision 为 float16/int8 时额外写入紧凑副本；float32 文件始终保留，
+    用于精确重排和回退。当前索引的元数据（或旧版 metadata.json）一并带入新的索引代，
+    行哈希、关键词词典与IVF索引依赖旧嵌入，不再沿用。
+    """
+    from .metadata_store import METADATA_FILE, LEGACY_METADATA_FILE, save_metadata
+    
+    writer = EmbeddingStoreWriter(model_dir, precision=precision)
+    try:
+        writer.append(embeddings)
+        writer.finish()
+        metadata_path = os.path.join(index_dir(model_dir), METADATA_FILE)
+        legacy_path = os.path.join(model_dir, LEGACY_METADATA_FILE)
+        if os.path.exists(metadata_path):
+            shutil.copyfile(metadata_path, os.path.join(writer.index_dir, METADATA_FILE))
+        elif os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                save_metadata(os.path.join(writer.index_dir, METADATA_FILE), json.load(f))
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+def load_manifest(model_dir="model"):
+    """读取嵌入清单，不存在时返回None"""
+    manifest_path = os.path.join(model_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_embedding_store(model_dir="model"):
+    """以内存映射方式打开归一化嵌入，返回共享同一页缓存的 numpy 数组（可零拷贝转为CPU张量）
+    
+    model_dir 可以是模型目录或 index_dir() 返回的索引代目录。
+    """
+    directory = index_dir(model_dir)
+    store_path = os.path.join(directory, STORE_FILE)
+    if not os.path.exists(store_path):
+        return None
+    
+    manifest = load_manifest(directory)
+    if manifest is not None and manifest.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError(f"不支持的嵌入存储版本: {manifest['format_version']}")
+    
+    # copy-on-write映射: 只读访问时与其他进程共享页缓存，且可直接转为张量
+    array = np.load(store_path, mmap_mode='c')
+    if manifest is not None and tuple(array.shape) != (manifest['rows'], manifest['dim']):
+        raise ValueError(f"嵌入存储与清单不一致: {array.shape} != ({manifest['rows']}, {manifest['dim']})")
+    return array
+
+
+def load_compact_store(model_dir="model"):
+    """打开紧凑精度嵌入，返回(数据, 缩放系数或None, 精度)（numpy数组），不存在时返回None"""
+    directory = index_dir(model_dir)
+    manifest = load_manifest(directory)
+    if manifest is None or 'compact' not in manifest:
+        return None
+    compact = manifest['compact']
+    data = np.load(os.path.join(directory, compact['file']), mmap_mode='c')
+    scale = None
+    if 'scale_file' in compact:
+        scale = np.load(os.path.join(directory, compact['scale_file']))
+    return data, scale, compact['precision']
+
+
+def score_compact(query_embeddings, data, scale=None, block_rows=8192):
+    """直接在紧凑存储上计算点积分数
+    
+    按行分块转换为float32后做矩阵乘法，每次只展开一个块，
+    读取的内存带宽与紧凑格式一致。int8 存储需提供每行缩放系数。
+    查询与数据同为 numpy 数组或同为 torch 张量。
+    """
+    if isinstance(data, np.ndarray):
+        scores = np.empty((query_embeddings.shape[0], data.shape[0]), dtype=np.float32)
+        for start in range(0, data.shape[0], block_rows):
+            block = np.asarray(data[start:start + block_rows], dtype=np.float32)
+            scores[:, start:start + block.shape[0]] = query_embeddings @ block.T
+        if scale is not None:
+            scores *= scale[None, :]
+        return scores
+    
+    import torch
+    if data.is_cuda and data.dtype == torch.float16:
+        scores = torch.mm(query_embeddings.half(), data.t()).float()
+    else:
+        rows = data.shape[0]
+        scores = torch.empty(
+            (query_embeddings.shape[0], rows), dtype=torch.float32, device=query_embeddings.device
+        )
+        for start in range(0, rows, block_rows):
+            block = data[start:start + block_rows].to(device=query_embeddings.device, dtype=torch.float32)
+            scores[:, start:start + block.shape[0]] = torch.mm(query_embeddings, block.t())
+    if scale is not None:
+        scores.mul_(scale.unsqueeze(0))
+    return scores
+
+
+def convert_legacy_embeddings(model_dir="model", precision="float32"):
+    """一次性将旧版 embeddings.pt 转换为归一化的 embeddings.npy"""
+    import torch
+    legacy_path = os.path.join(model_dir, LEGACY_FILE)
+    if not os.path.exists(legacy_path):
+        raise FileNotFoundError(f"嵌入文件不存在: {legacy_path}")
+    embeddings = torch.load(legacy_path, map_location="cpu")
+    return save_embedding_store(embeddings, model_dir, precision=precision)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="将 embeddings.pt 转换为内存映射的归一化嵌入存储")
+    parser.add_argument("--model_dir", default="model", help="模型目录")
+    parser.add_argument("--precision", default="float32", choices=PRECISIONS, help="额外写入的紧凑存储精度")
+    args = parser.parse_args()
+    convert_legacy_embeddings(args.model_dir, precision=args.precision)
@@ -1,48 +1,128 @@
 import os
-import torch
+import time
+import threading
 from PyQt5.QtCore import QThread, pyqtSignal
-from .semantic_search import SemanticSearchEngine
-from .model_loader import ModelLoader
 
 class ModelLoaderThread(QThread):
     """后台加载模型的线程"""
     loaded = pyqtSignal(object, bool, bool)
     error = pyqtSignal(str)
     
-    def __init__(self, model_dir, use_fine_tuned):
+    def __init__(self, model_dir, use_fine_tuned, precision="fp32", backend="torch"):
         super().__init__()
         self.model_dir = model_dir
         self.use_fine_tuned = use_fine_tuned
+        self.precision = precision
+        self.backend = backend
     
     def run(self):
         try:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
+            # 延迟导入: torch 与 sentence-transformers 在后台线程中导入，窗口可立即显示
+            from .semantic_search import SemanticSearchEngine
+            from .embedding_store import has_embedding_index
+            
+            # onnx/snapshot 后端只在CPU上推理，不导入torch
+            device = "cpu"
+            if self.backend == "torch":
+                import torch
+                device = "cuda" if torch.cuda.is_available() else "cpu"
             engine = SemanticSearchEngine(
                 model_dir=self.model_dir,
                 use_fine_tuned=self.use_fine_tuned,
-                device=device
+                device=device,
+                precision=self.precision,
+                backend=self.backend
             )
             
+            # 预热，避免首次检索承担延迟初始化开销
+            engine.warm_up()
+            
             has_fine_tuned = os.path.exists(os.path.join(self.model_dir, "fine_tuned"))
-            has_embeddings = os.path.exists(os.path.join(self.model_dir, "embeddings.pt"))
+            has_embeddings = has_embedding_index(self.model_dir)
             
             self.loaded.emit(engine, has_fine_tuned, has_embeddings)
         except Exception as e:
             self.error.emit(str(e))
 
+class SearchThread(QThread):
+    """后台检索线程，结果通过信号返回，界面线程不会阻塞在推理上
+    
+    只保留最新提交的一条待执行查询: 尚未开始的旧查询被新查询直接取代；
+    已在执行的查询无法中断，其结果带有请求编号，界面据 latest_id 忽略过期结果。
+    """
+    results_ready = pyqtSignal(int, str, list, float)
+    error = pyqtSignal(int, str)
+    
+    def __init__(self, interface):
+        super().__init__()
+        self.interface = interface
+        self.latest_id = 0
+        self._pending = None
+        self._stopped = False
+        self._condition = threading.Condition()
+    
+    def submit(self, query, category="all", top_k=5, similarity_threshold=0.0, filters=None):
+        """提交查询并返回请求编号，未执行的旧查询被丢弃"""
+        with self._condition:
+            self.latest_id += 1
+            self._pending = (self.latest_id, query, category, top_k, similarity_threshold, filters)
+            self._condition.notify()
+            return self.latest_id
+    
+    def stop(self, timeout_ms=200):
+        """请求停止线程，最多等待 timeout_ms 毫秒，返回线程是否已结束
+        
+        正在执行的查询无法中断: 超时后线程在该查询结束时自行退出，其结果不再发出。
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        return self.wait(timeout_ms)
+    
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                request, self._pending = self._pending, None
+            
+            request_id, query, category, top_k, similarity_threshold, filters = request
+            start_time = time.time()
+            try:
+                results = self.interface.search(
+                    query, category=category, top_k=top_k,
+                    similarity_threshold=similarity_threshold, filters=filters
+                )
+            except Exception as e:
+                if not self._stopped:
+                    self.error.emit(request_id, str(e))
+                continue
+            if self._stopped:
+                return
+            self.results_ready.emit(request_id, query, results, time.time() - start_time)
+
 class GUIInterface:
-    def __init__(self, model_dir="model", use_fine_tuned=True):
+    def __init__(self, model_dir="model", use_fine_tuned=True, precision="fp32", backend="torch"):
         self.model_dir = model_dir
         self.use_fine_tuned = use_fine_tuned
+        self.precision = precision
+        self.backend = backend
         self.engine = None
         
     def load_model_async(self):
         """异步加载模型"""
-        self.loader_thread = ModelLoaderThread(self.model_dir, self.use_fine_tuned)
+        self.loader_thread = ModelLoaderThread(self.model_dir, self.use_fine_tuned, self.precision, self.backend)
         return self.loader_thread
     
-    def search(self, query, category="all", top_k=5, similarity_threshold=0.0):
-        """执行搜索"""
+    def search_async(self):
+        """创建后台检索线程"""
+        self.search_thread = SearchThread(self)
+        return self.search_thread
+    
+    def search(self, query, category="all", top_k=5, similarity_threshold=0.0, filters=None):
+        """执行搜索，filters 为可选的主题/关键词/来源过滤"""
         if not self.engine:
             return []
             
@@ -50,5 +130,6 @@ class GUIInterface:
             query, 
             top_k=top_k, 
             category=category,
-            similarity_threshold=similarity_threshold
+            similarity_threshold=similarity_threshold,
+            filters=filters
         )
\ No newline at end of file
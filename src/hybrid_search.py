@@ -0,0 +1,190 @@
+import time
+import logging
+import threading
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from .query_cache import normalize_query
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("HybridSearch")
+
+FUSIONS = ("rrf", "weighted")
+
+
+class HybridSearchEngine:
+    """混合检索: BM25词法召回 + 语义召回与重排，结果按RRF或加权分数融合
+    
+    语义部分（查询编码）在单独的编码线程中执行，每次查询有延迟预算:
+    超时或编码队列过深时直接返回词法结果，不阻塞调用方。
+    查询与某条素材的关键词/主题完全相同时，该素材必定进入结果。
+    """
+    def __init__(self, semantic_engine, lexical_engine=None, budget_ms=300, max_queue_depth=4,
+                 candidates=50, fusion="rrf", rrf_k=60, semantic_weight=0.7):
+        if fusion not in FUSIONS:
+            raise ValueError(f"不支持的融合方式: {fusion}，可选: {', '.join(FUSIONS)}")
+        if lexical_engine is None:
+            from .search_engine import MaterialSearchEngine
+            lexical_engine = MaterialSearchEngine()
+            lexical_engine.load_data()
+        
+        self.semantic = semantic_engine
+        self.lexical = lexical_engine
+        self.budget_ms = budget_ms
+        self.max_queue_depth = max_queue_depth
+        self.candidates = candidates
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.semantic_weight = semantic_weight
+        
+        # 编码线程及排队计数
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="HybridEncoder")
+        self._pending = 0
+        self._lock = threading.Lock()
+        
+        self.last_mode = None
+        self.lexical_fallbacks = 0
+        self._mapped_metadata = None
+        self._build_exact_terms()
+    
+    def _build_exact_terms(self):
+        """关键词/主题 → 词法文档号，用于保证精确命中"""
+        self.exact_terms = defaultdict(list)
+        for doc, (_, item) in enumerate(self.lexical.indexed_data):
+            for term in list(item['keywords']) + [item.get('theme', '')]:
+                if term:
+                    self.exact_terms[normalize_query(term)].append(doc)
+    
+    def _ensure_row_mapping(self):
+        """词法文档号 → 语义行号（-1 表示无对应行）；语义索引重新加载后自动重建
+        
+        两个索引在构建时都保存了行键（类别+正文的哈希），这里只在两个整数数组之间
+        排序与二分查找，不还原任何正文。
+        """
+        metadata = self.semantic.metadata
+        if metadata is self._mapped_metadata:
+            return
+        semantic_keys = np.asarray(metadata.row_keys)
+        lexical_keys = np.asarray(self.lexical.index.row_keys)
+        lexical_rows = np.full(len(lexical_keys), -1, dtype=np.int64)
+        if len(semantic_keys):
+            order = np.argsort(semantic_keys, kind='stable')
+            sorted_keys = semantic_keys[order]
+            positions = np.minimum(np.searchsorted(sorted_keys, lexical_keys), len(sorted_keys) - 1)
+            found = sorted_keys[positions] == lexical_keys
+            lexical_rows[found] = order[positions[found]]
+        self.lexical_rows = lexical_rows.tolist()
+        self._mapped_metadata = metadata
+    
+    def _run_semantic(self, query, top_k, category, extra_rows, filters):
+        try:
+            return self.semantic.score_candidates(query, top_k, category, extra_rows, filters)
+        finally:
+            with self._lock:
+                self._pending -= 1
+    
+    def _semantic_scores(self, query, top_k, category, extra_rows, filters, deadline):
+        """在延迟预算内取得语义分数，队列过深、超时或出错时返回None"""
+        with self._lock:
+            if self._pending >= self.max_queue_depth:
+                logger.info(f"编码队列已满 ({self._pending})，仅返回词法结果")
+                return None
+            self._pending += 1
+        
+        future = self._executor.submit(self._run_semantic, query, top_k, category, extra_rows, filters)
+        try:
+            # 超时后编码仍会在后台完成并写入查询缓存，下次相同查询可直接命中
+            return future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        except FutureTimeoutError:
+            logger.info("语义检索超出延迟预算，仅返回词法结果")
+        except Exception as e:
+            logger.error(f"语义检索出错: {str(e)}")
+        return None
+    
+    def search(self, query, top_k=5, category="all", similarity_threshold=0.0, budget_ms=None, filters=None):
+        """混合检索，budget_ms 为本次查询的延迟预算（毫秒），filters 同 SemanticSearchEngine.search"""
+        start_time = time.perf_counter()
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        deadline = start_time + budget_ms / 1000.0
+        self._ensure_row_mapping()
+        
+        categories = None
+        if category is not None and category != "all":
+            categories = {category} if isinstance(category, str) else set(category)
+        
+        # 词法召回（含关键词/主题精确命中）
+        lex_scores, lex_docs = self.lexical.index.search(query, top_k=self.candidates, categories=categories)
+        lex_docs = lex_docs.tolist()
+        lex_scores = lex_scores.tolist()
+        exact_docs = [
+            doc for doc in self.exact_terms.get(normalize_query(query), [])
+            if categories is None or self.lexical.indexed_data[doc][0] in categories
+        ]
+        if filters:
+            def allowed(doc):
+                return self.semantic.meta_matches(self.lexical.indexed_data[doc][1], filters)
+            kept = [i for i, doc in enumerate(lex_docs) if allowed(doc)]
+            lex_docs = [lex_docs[i] for i in kept]
+            lex_scores = [lex_scores[i] for i in kept]
+            exact_docs = [doc for doc in exact_docs if allowed(doc)]
+        
+        # 候选统一以语义行号为键（无对应行时使用词法文档号）
+        def key_of(doc):
+            row = self.lexical_rows[doc]
+            return ('row', row) if row >= 0 else ('doc', doc)
+        
+        candidates = defaultdict(dict)
+        for rank, (doc, score) in enumerate(zip(lex_docs, lex_scores)):
+            candidates[key_of(doc)].update({'doc': doc, 'lex_rank': rank, 'lex_score': score})
+        for doc in exact_docs:
+            candidates[key_of(doc)].update({'doc': doc, 'exact': True})
+        
+        # 语义召回，并对词法候选做语义重排
+        extra_rows = [key[1] for key in candidates if key[0] == 'row']
+        semantic_scores = self._semantic_scores(query, self.candidates, category, extra_rows, filters, deadline)
+        if semantic_scores is None:
+            self.last_mode = "lexical"
+            self.lexical_fallbacks += 1
+        else:
+            self.last_mode = "hybrid"
+            ranked = sorted(semantic_scores.items(), key=lambda x: x[1], reverse=True)
+            for rank, (row, score) in enumerate(ranked):
+                candidates[('row', row)].update({'sem_rank': rank, 'sem_score': score})
+        
+        max_lex = max(lex_scores) if lex_scores else 1.0
+        fused = []
+        for key, info in candidates.items():
+            # 仅被语义召回的候选需满足相似度阈值
+            if 'lex_rank' not in info and not info.get('exact') and info.get('sem_score', 0.0) < similarity_threshold:
+                continue
+            if self.fusion == "rrf":
+                score = sum(1.0 / (self.rrf_k + info[r] + 1) for r in ('lex_rank', 'sem_rank') if r in info)
+            else:
+                score = (self.semantic_weight * info.get('sem_score', 0.0)
+                         + (1 - self.semantic_weight) * info.get('lex_score', 0.0) / max_lex)
+            fused.append((info.get('exact', False), score, key, info))
+        
+        # 精确命中优先，其余按融合分数排序
+        fused.sort(key=lambda x: (x[0], x[1]), reverse=True)
+        
+        results = []
+        for _, score, key, info in fused[:top_k]:
+            if key[0] == 'row':
+                meta = self.semantic.metadata[key[1]]
+            else:
+                cat, item = self.lexical.indexed_data[info['doc']]
+                meta = dict(item, type=cat)
+            results.append(self.semantic.format_result(meta, score))
+        
+        # 每次查询的日志只在DEBUG级别输出
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"混合检索完成: 查询 '{query[:20]}...', 模式: {self.last_mode}, "
+                f"耗时: {time.perf_counter()-start_time:.4f}s, 结果: {len(results)}条"
+            )
+        return results
+    
+    def shutdown(self):
+        """关闭编码线程"""
+        self._executor.shutdown(wait=False)
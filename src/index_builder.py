@@ -0,0 +1,611 @@
+import os
+import json
+import time
+import shutil
+import queue
+import hashlib
+import logging
+import threading
+import numpy as np
+from .embedding_store import (
+    load_embedding_store, load_manifest, normalize_rows, index_dir, EmbeddingStoreWriter,
+    STORE_FILE, SCALE_FILE, PRECISIONS
+)
+from .ann_index import IVFIndex, ANN_MIN_ROWS, ANN_FILE
+from .query_cache import normalize_query
+from .metadata_store import MetadataWriter, save_metadata, METADATA_FILE, LEGACY_METADATA_FILE
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("IndexBuilder")
+
+HASHES_FILE = "index_hashes.json"
+TERM_EMBEDDINGS_FILE = "term_embeddings.npy"
+TERM_INDEX_FILE = "term_index.json"
+
+
+def item_hash(cleaned_text, fingerprint):
+    """素材内容哈希: 清理后文本 + 模型指纹，任一变化都需要重新编码"""
+    return hashlib.sha1(f"{fingerprint}\n{cleaned_text}".encode('utf-8')).hexdigest()
+
+
+def collect_items(datasets):
+    """按类别顺序收集待编码文本与元数据（同一类别占据连续行）"""
+    all_texts = []
+    metadata = []
+    for data_type, items in datasets.items():
+        for item in items:
+            all_texts.append(item['cleaned_text'])
+            metadata.append({
+                'type': data_type,
+                'content': item['content'],
+                'source': item.get('source', ''),
+                'keywords': item['keywords'],
+                'theme': item.get('theme', '')
+            })
+    return all_texts, metadata
+
+
+def _write_json(path, data, indent=None):
+    """先写临时文件再替换"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+class _JsonArrayWriter:
+    """逐条写入JSON数组（每行一条），写完后原子替换目标文件"""
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.count = 0
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        self._file.write('[')
+    
+    def extend(self, records):
+        for record in records:
+            self._file.write(',\n' if self.count else '\n')
+            self._file.write(json.dumps(record, ensure_ascii=False))
+            self.count += 1
+    
+    def close(self):
+        self._file.write('\n]')
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+    
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def _prefetch(iterable, depth=2):
+    """在后台线程中推进生成器，最多预取 depth 项，使预处理与编码流水线并行"""
+    buffer = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+    
+    def produce():
+        try:
+            for value in iterable:
+                if stop.is_set():
+                    return
+                buffer.put((value, None))
+        except BaseException as e:
+            buffer.put((done, e))
+            return
+        buffer.put((done, None))
+    
+    thread = threading.Thread(target=produce, daemon=True, name="IndexPrefetch")
+    thread.start()
+    try:
+        while True:
+            value, error = buffer.get()
+            if value is done:
+                if error is not None:
+                    raise error
+                return
+            yield value
+    finally:
+        # 提前退出时让生产者线程尽快结束
+        stop.set()
+        while thread.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                thread.join(timeout=0.1)
+
+
+def _remove_flat_layout(model_dir):
+    """切换到索引代目录后删除旧版平铺在 model_dir 下的索引文件（含 metadata.json），避免残留过期副本"""
+    names = [STORE_FILE, SCALE_FILE, METADATA_FILE, LEGACY_METADATA_FILE, HASHES_FILE,
+             TERM_EMBEDDINGS_FILE, TERM_INDEX_FILE, ANN_FILE]
+    names += [f"embeddings_{precision}.npy" for precision in PRECISIONS if precision != "float32"]
+    for name in names:
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                # Windows上仍被内存映射的文件无法删除，不影响新索引
+                logger.warning(f"无法删除旧索引文件 {path}: {e}")
+
+
+def load_previous_hashes(model_dir="model"):
+    """读取当前索引的行哈希，哈希与嵌入行数不一致时视为无效"""
+    directory = index_dir(model_dir)
+    hashes_path = os.path.join(directory, HASHES_FILE)
+    manifest = load_manifest(directory)
+    if not os.path.exists(hashes_path) or manifest is None:
+        return []
+    with open(hashes_path, 'r', encoding='utf-8') as f:
+        hashes = json.load(f)
+    if len(hashes) != manifest['rows']:
+        logger.warning("索引哈希与嵌入行数不一致，将全量重建")
+        return []
+    return hashes
+
+
+def encode_texts(model, texts, device, batch_size=128):
+    """分批编码文本，返回float32 numpy数组（每批编码后即移出GPU）"""
+    from tqdm import tqdm
+    embeddings = []
+    for i in tqdm(range(0, len(texts), batch_size), desc="生成嵌入"):
+        embeddings.append(model.encode(
+            texts[i:i+batch_size],
+            device=device,
+            show_progress_bar=False,
+            batch_size=batch_size
+        ))
+    return np.concatenate(embeddings, axis=0).astype(np.float32, copy=False)
+
+
+def collect_terms(metadata):
+    """收集语料中所有不重复的关键词与主题（规范化后）"""
+    terms = []
+    for meta in metadata:
+        terms.extend(meta['keywords'])
+        if meta.get('theme'):
+            terms.append(meta['theme'])
+    return list(dict.fromkeys(t for t in (normalize_query(t) for t in terms) if t))
+
+
+def load_term_dictionary(model_dir="model"):
+    """加载当前索引的关键词/主题嵌入词典，返回(词列表, 哈希列表, 嵌入数组, 编码模型指纹)，不存在时返回None"""
+    directory = index_dir(model_dir)
+    index_path = os.path.join(directory, TERM_INDEX_FILE)
+    embeddings_path = os.path.join(directory, TERM_EMBEDDINGS_FILE)
+    if not os.path.exists(index_path) or not os.path.exists(embeddings_path):
+        return None
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    embeddings = np.load(embeddings_path)
+    if len(index['terms']) != embeddings.shape[0]:
+        logger.warning("关键词词典与嵌入条数不一致，已忽略")
+        return None
+    return index['terms'], index['hashes'], embeddings, index.get('fingerprint')
+
+
+def build_term_dictionary(model, fingerprint, terms, model_dir="model", device="cpu",
+                          batch_size=128, full=False):
+    """预编码所有关键词与主题（collect_terms 的结果），单词查询可直接查表而无需编码器前向计算
+    
+    与素材嵌入相同，按 词 + 模型指纹 的哈希复用已有向量。返回值与 load_term_dictionary 相同，
+    其中的模型指纹供检索时确认词典与查询编码器一致。
+    """
+    hashes = [item_hash(term, fingerprint) for term in terms]
+    
+    previous = None if full else load_term_dictionary(model_dir)
+    old_rows = {h: row for row, h in enumerate(previous[1])} if previous else {}
+    missing = [term for term, h in zip(terms, hashes) if h not in old_rows]
+    
+    new_embeddings = encode_texts(model, missing, device, batch_size) if missing else None
+    new_rows = {term: row for row, term in enumerate(missing)}
+    
+    dim = new_embeddings.shape[1] if new_embeddings is not None else previous[2].shape[1]
+    embeddings = np.empty((len(terms), dim), dtype=np.float32)
+    for row, (term, h) in enumerate(zip(terms, hashes)):
+        if h in old_rows:
+            embeddings[row] = previous[2][old_rows[h]]
+        else:
+            embeddings[row] = new_embeddings[new_rows[term]]
+    logger.info(f"关键词词典: {len(terms)} 个, 新编码 {len(missing)} 个")
+    return terms, hashes, embeddings, fingerprint
+
+
+def save_term_dictionary(directory, terms, hashes, embeddings, fingerprint=None):
+    """写入关键词词典到索引目录（先写嵌入，词表及编码模型指纹最后写入）"""
+    embeddings_path = os.path.join(directory, TERM_EMBEDDINGS_FILE)
+    tmp_path = embeddings_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(embeddings, dtype=np.float32))
+    os.replace(tmp_path, embeddings_path)
+    _write_json(os.path.join(directory, TERM_INDEX_FILE), {'fingerprint': fingerprint, 'terms': terms, 'hashes': hashes})
+
+
+class IndexWriter:
+    """索引的唯一写入路径: 元数据、行哈希、嵌入存储、关键词词典及（大规模时）IVF索引
+    
+    append() 按块追加行（reuse_rows 为各行在旧索引中的行号，新行为-1），close() 写出全部文件。
+    所有文件写入新的索引代目录，根目录清单的切换是唯一的提交点: 提交前失败或进程中断时
+    读取方仍只看到完整的旧索引，不会出现新元数据与旧嵌入混用。precision 为 None 时沿用已有索引的紧凑精度。
+    
+    旧IVF索引与旧嵌入一致（previous_rows 行）时增量更新: 复用行沿用原来的簇，新行分配到
+    最近的已有簇，只有 IVFIndex.needs_retrain() 成立时才重新训练聚类中心。
+    """
+    def __init__(self, model_dir="model", precision=None, previous_rows=0):
+        previous_dir = index_dir(model_dir)
+        if precision is None:
+            manifest = load_manifest(previous_dir)
+            precision = manifest.get('compact', {}).get('precision', 'float32') if manifest else 'float32'
+        self.model_dir = model_dir
+        self.store = EmbeddingStoreWriter(model_dir, precision=precision)
+        self.index_dir = self.store.index_dir
+        try:
+            self.metadata = MetadataWriter(os.path.join(self.index_dir, METADATA_FILE))
+            self.hashes = _JsonArrayWriter(os.path.join(self.index_dir, HASHES_FILE))
+        except BaseException:
+            self.store.abort()
+            raise
+        
+        ann_index = IVFIndex.load(previous_dir) if previous_rows >= ANN_MIN_ROWS else None
+        self.ann_index = ann_index if ann_index is not None and ann_index.rows == previous_rows else None
+        self._old_assign = self.ann_index.assignments() if self.ann_index is not None else None
+        self._assign = []
+        self._added_rows = 0
+        self._added_score = 0.0
+    
+    @property
+    def rows(self):
+        return self.store.rows
+    
+    def append(self, metadata, hashes, embeddings, reuse_rows=None):
+        """追加一块行: 元数据、行哈希与float32嵌入（numpy数组）"""
+        self.store.append(embeddings)
+        self.metadata.extend(metadata)
+        self.hashes.extend(hashes)
+        if self.ann_index is None:
+            return
+        
+        if reuse_rows is None:
+            reuse_rows = np.full(len(hashes), -1, dtype=np.int64)
+        reused = reuse_rows >= 0
+        assign = np.empty(len(hashes), dtype=np.int32)
+        assign[reused] = self._old_assign[reuse_rows[reused]]
+        if not reused.all():
+            new_assign, scores = self.ann_index.assign(normalize_rows(embeddings[~reused]))
+            assign[~reused] = new_assign
+            self._added_rows += int((~reused).sum())
+            self._added_score += float(scores.sum())
+        self._assign.append(assign)
+    
+    def close(self, term_dictionary=None):
+        """写出全部文件并切换到新的索引代；失败时删除新索引代目录，已有索引保持不变"""
+        try:
+            if self.rows == 0:
+                raise ValueError("没有可索引的素材")
+            self.metadata.close()
+            self.hashes.close()
+            self.store.finish()
+            if term_dictionary is not None:
+                save_term_dictionary(self.index_dir, *term_dictionary)
+            self._write_ann_index()
+        except BaseException:
+            self.abort()
+            raise
+        self.store.commit()
+        _remove_flat_layout(self.model_dir)
+    
+    def abort(self):
+        # 先关闭文件句柄，再删除整个索引代目录
+        self.metadata.abort()
+        self.hashes.abort()
+        self.store.abort()
+    
+    def _write_ann_index(self):
+        """大规模语料更新IVF索引（增量分配或重新训练），规模低于阈值时不生成"""
+        if self.rows < ANN_MIN_ROWS:
+            return
+        
+        if self.ann_index is not None:
+            added_score = self._added_score / self._added_rows if self._added_rows else None
+            if not self.ann_index.needs_retrain(self.rows, self._added_rows, added_score):
+                index = self.ann_index.updated(np.concatenate(self._assign), self._added_rows)
+                index.save(self.index_dir)
+                logger.info(f"IVF索引增量更新: 新行 {self._added_rows} 条分配到已有的 {index.n_lists} 个簇")
+                return
+            logger.info("新增行过多、规模变化较大或分布漂移，重新训练IVF索引")
+        # 尚未提交，直接打开新索引代中刚写完的嵌入文件
+        embeddings = np.load(os.path.join(self.index_dir, STORE_FILE), mmap_mode='r')
+        IVFIndex.build(embeddings).save(self.index_dir)
+
+
+def write_index(model_dir, metadata, hashes, embeddings, precision=None, term_dictionary=None,
+                reuse_rows=None, previous_rows=0):
+    """一次写入完整索引（内存中的全部行），参数含义见 IndexWriter"""
+    writer = IndexWriter(model_dir, precision=precision, previous_rows=previous_rows)
+    try:
+        writer.append(metadata, hashes, embeddings, reuse_rows)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close(term_dictionary)
+
+
+def build_ann_index(model_dir="model", n_lists=None, chunk_rows=65536):
+    """为当前索引构建IVF索引，连同嵌入、元数据与关键词词典写入新的索引代后提交
+    
+    当前索引代保持不变，已打开它的读取方不会看到文件在其下变化；紧凑精度沿用当前索引。
+    """
+    previous_dir = index_dir(model_dir)
+    manifest = load_manifest(previous_dir)
+    embeddings = load_embedding_store(previous_dir)
+    if embeddings is None or manifest is None:
+        raise FileNotFoundError(f"嵌入存储不存在，请先训练或转换: {model_dir}")
+    precision = manifest.get('compact', {}).get('precision', 'float32')
+    
+    writer = EmbeddingStoreWriter(model_dir, precision=precision)
+    try:
+        for start in range(0, embeddings.shape[0], chunk_rows):
+            writer.append(embeddings[start:start + chunk_rows])
+        writer.finish()
+        
+        # 元数据、行哈希与关键词词典不依赖IVF索引，原样带入新的索引代
+        for name in (METADATA_FILE, HASHES_FILE, TERM_EMBEDDINGS_FILE, TERM_INDEX_FILE):
+            path = os.path.join(previous_dir, name)
+            if os.path.exists(path):
+                shutil.copyfile(path, os.path.join(writer.index_dir, name))
+        legacy_path = os.path.join(model_dir, LEGACY_METADATA_FILE)
+        if not os.path.exists(os.path.join(writer.index_dir, METADATA_FILE)) and os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                save_metadata(os.path.join(writer.index_dir, METADATA_FILE), json.load(f))
+        
+        index = IVFIndex.build(np.load(os.path.join(writer.index_dir, STORE_FILE), mmap_mode='r'), n_lists=n_lists)
+        if index.rows != manifest['rows']:
+            raise ValueError(f"IVF索引条数({index.rows})与清单条数({manifest['rows']})不一致")
+        index.save(writer.index_dir)
+    except BaseException:
+        writer.abort()
+        raise
+    # 提交后旧索引代可能被删除，先释放其内存映射
+    del embeddings
+    writer.commit()
+    _remove_flat_layout(model_dir)
+    return index
+
+
+def update_index(model, fingerprint, datasets, model_dir="model", device="cpu",
+                 precision=None, batch_size=128, full=False):
+    """增量更新嵌入索引: 只编码新增或变化的素材，删除的素材随之移除，返回统计信息"""
+    start_time = time.time()
+    all_texts, metadata = collect_items(datasets)
+    if not all_texts:
+        raise ValueError("没有可索引的素材")
+    hashes = [item_hash(text, fingerprint) for text in all_texts]
+    
+    # 旧索引中的行可按哈希直接复用
+    # 行哈希与旧嵌入取自同一索引代
+    previous_dir = index_dir(model_dir)
+    previous_hashes = [] if full else load_previous_hashes(previous_dir)
+    previous = {h: row for row, h in enumerate(previous_hashes)}
+    old_embeddings = load_embedding_store(previous_dir) if previous else None
+    reuse_rows = np.array([previous.get(h, -1) for h in hashes], dtype=np.int64)
+    reused = reuse_rows >= 0
+    
+    # 同一内容只编码一次
+    text_by_hash = dict(zip(hashes, all_texts))
+    missing = list(dict.fromkeys(h for h, ok in zip(hashes, reused) if not ok))
+    new_embeddings = encode_texts(model, [text_by_hash[h] for h in missing], device, batch_size) if missing else None
+    
+    dim = old_embeddings.shape[1] if old_embeddings is not None else new_embeddings.shape[1]
+    embeddings = np.empty((len(hashes), dim), dtype=np.float32)
+    if reused.any():
+        embeddings[reused] = old_embeddings[reuse_rows[reused]]
+    if missing:
+        encoded = {h: row for row, h in enumerate(missing)}
+        new_rows = [encoded[h] for h, ok in zip(hashes, reused) if not ok]
+        embeddings[~reused] = new_embeddings[new_rows]
+    
+    # 提交后旧索引代可能被删除，先释放其内存映射
+    del old_embeddings
+    term_dictionary = build_term_dictionary(
+        model, fingerprint, collect_terms(metadata), model_dir=model_dir, device=device, batch_size=batch_size, full=full
+    )
+    write_index(model_dir, metadata, hashes, embeddings, precision=precision, term_dictionary=term_dictionary,
+                reuse_rows=reuse_rows, previous_rows=len(previous_hashes))
+    
+    stats = {
+        'total': len(hashes),
+        'reused': int(reused.sum()),
+        'encoded': len(missing),
+        'removed': len(set(previous) - set(hashes)),
+        'elapsed': time.time() - start_time
+    }
+    logger.info(
+        f"索引更新完成: 共 {stats['total']} 条, 复用 {stats['reused']} 条, "
+        f"编码 {stats['encoded']} 条, 删除 {stats['removed']} 条, 耗时 {stats['elapsed']:.2f}s"
+    )
+    return stats
+
+
+def stream_index(model, fingerprint, chunks, model_dir="model", device="cpu",
+                 precision=None, batch_size=128, full=False, prefetch=2):
+    """流式构建嵌入索引: 预处理、编码与写盘按批流水线进行，内存占用与批大小相关
+    
+    chunks 为 (类别, 已预处理素材列表) 的可迭代对象（如 DataProcessor.iter_preprocessed()），
+    同一类别须连续产出。与 update_index 相同，哈希未变的素材直接复用旧索引中的向量。
+    """
+    start_time = time.time()
+    # 行哈希与旧嵌入取自同一索引代
+    previous_dir = index_dir(model_dir)
+    previous_hashes = [] if full else load_previous_hashes(previous_dir)
+    previous = {h: row for row, h in enumerate(previous_hashes)}
+    old_embeddings = load_embedding_store(previous_dir) if previous else None
+    
+    writer = IndexWriter(model_dir, precision=precision, previous_rows=len(previous_hashes))
+    terms = {}
+    seen = set()
+    reused_count = 0
+    encoded_count = 0
+    
+    try:
+        for data_type, items in _prefetch(chunks, depth=prefetch):
+            texts, metadata = collect_items({data_type: items})
+            hashes = [item_hash(text, fingerprint) for text in texts]
+            reuse_rows = np.array([previous.get(h, -1) for h in hashes], dtype=np.int64)
+            reused = reuse_rows >= 0
+            
+            missing = [i for i, ok in enumerate(reused) if not ok]
+            embeddings = None
+            if missing:
+                new_embeddings = encode_texts(model, [texts[i] for i in missing], device, batch_size)
+                embeddings = np.empty((len(hashes), new_embeddings.shape[1]), dtype=np.float32)
+                embeddings[~reused] = new_embeddings
+            if reused.any():
+                if embeddings is None:
+                    embeddings = np.empty((len(hashes), old_embeddings.shape[1]), dtype=np.float32)
+                embeddings[reused] = old_embeddings[reuse_rows[reused]]
+            
+            writer.append(metadata, hashes, embeddings, reuse_rows)
+            terms.update(dict.fromkeys(collect_terms(metadata)))
+            seen.update(hashes)
+            reused_count += int(reused.sum())
+            encoded_count += len(missing)
+            logger.info(f"已写入 {writer.rows} 条 (复用 {reused_count}, 编码 {encoded_count})")
+        
+        term_dictionary = build_term_dictionary(
+            model, fingerprint, list(terms), model_dir=model_dir, device=device, batch_size=batch_size, full=full
+        )
+    except BaseException:
+        writer.abort()
+        raise
+    
+    # 提交后旧索引代可能被删除，先释放其内存映射
+    del old_embeddings
+    writer.close(term_dictionary)
+    
+    stats = {
+        'total': writer.rows,
+        'reused': reused_count,
+        'encoded': encoded_count,
+        'removed': len(set(previous) - seen),
+        'elapsed': time.time() - start_time
+    }
+    logger.info(
+        f"流式索引构建完成: 共 {stats['total']} 条, 复用 {stats['reused']} 条, "
+        f"编码 {stats['encoded']} 条, 删除 {stats['removed']} 条, 耗时 {stats['elapsed']:.2f}s"
+    )
+    return stats
+
+
+class BackgroundIndexBuild(threading.Thread):
+    """后台构建素材索引的线程
+    
+    从 DataProcessor 输出分块编码全部素材，写入预先分配的嵌入矩阵，构建期间可通过
+    snapshot() 取得已编码部分用于检索；完成后写入磁盘并调用 on_finished 回调，
+    任一步骤失败时记录 error 并调用 on_failed(error)，不自动重试。finished 在回调之后才置位。
+    回调在构建线程中执行，只应记录状态；重新加载索引等替换检索状态的操作应由调用方在
+    自己的线程中根据 finished/error 完成（见 SemanticSearchEngine._ensure_index_build）。
+    """
+    def __init__(self, model, fingerprint, model_dir="model", device="cpu", batch_size=64,
+                 on_progress=None, on_finished=None, on_failed=None):
+        super().__init__(daemon=True)
+        self.model = model
+        self.fingerprint = fingerprint
+        self.model_dir = model_dir
+        self.device = device
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self.metadata = []
+        self.error = None
+        self.finished = False
+        self.done = 0
+        self.total = 0
+        self._embeddings = None
+        self._lock = threading.Lock()
+    
+    def progress(self):
+        """返回(已编码条数, 总条数)"""
+        with self._lock:
+            return self.done, self.total
+    
+    def snapshot(self):
+        """返回(已编码部分的嵌入视图, 全部元数据)，尚无数据时嵌入为None
+        
+        嵌入是预分配矩阵前 done 行的视图（不复制），元数据的前 len(嵌入) 条与之对应。
+        """
+        with self._lock:
+            if self._embeddings is None or self.done == 0:
+                return None, self.metadata
+            return self._embeddings[:self.done], self.metadata
+    
+    def run(self):
+        from .data_processor import DataProcessor
+        start_time = time.time()
+        try:
+            all_texts, metadata = collect_items(DataProcessor().load_and_preprocess())
+            with self._lock:
+                self.metadata = metadata
+                self.total = len(all_texts)
+            if not all_texts:
+                # 空语料不写索引，避免留下零行的嵌入文件
+                raise ValueError("没有可索引的素材，请检查数据目录")
+            logger.info(f"开始后台构建素材索引: {self.total} 条")
+            
+            for i in range(0, len(all_texts), self.batch_size):
+                batch_emb = self.model.encode(
+                    all_texts[i:i+self.batch_size],
+                    device=self.device,
+                    show_progress_bar=False,
+                    batch_size=self.batch_size
+                )
+                if self._embeddings is None:
+                    # 第一批确定维度后一次性分配，之后原地写入
+                    self._embeddings = np.empty((self.total, batch_emb.shape[1]), dtype=np.float32)
+                self._embeddings[i:i + batch_emb.shape[0]] = batch_emb
+                with self._lock:
+                    self.done += batch_emb.shape[0]
+                if self.on_progress is not None:
+                    self.on_progress(self.done, self.total)
+            
+            embeddings = self._embeddings
+            hashes = [item_hash(text, self.fingerprint) for text in all_texts]
+            term_dictionary = build_term_dictionary(
+                self.model, self.fingerprint, collect_terms(metadata),
+                model_dir=self.model_dir, device=self.device, batch_size=self.batch_size
+            )
+            write_index(self.model_dir, metadata, hashes, embeddings, term_dictionary=term_dictionary)
+            logger.info(f"后台索引构建完成: {self.total} 条, 耗时 {time.time()-start_time:.2f}s")
+            if self.on_finished is not None:
+                self.on_finished()
+        except Exception as e:
+            logger.exception(f"后台索引构建失败: {str(e)}")
+            self.error = e
+            if self.on_failed is not None:
+                self.on_failed(e)
+        finally:
+            self.finished = True
+
+
+if __name__ == "__main__":
+    import argparse
+    from .data_processor import DataProcessor
+    from .model_loader import ModelLoader
+    
+    parser = argparse.ArgumentParser(description="增量更新素材嵌入索引")
+    parser.add_argument("--model_dir", default="model", help="模型目录")
+    parser.add_argument("--precision", default=None, choices=("float32", "float16", "int8"), help="紧凑存储精度，默认沿用已有索引")
+    parser.add_argument("--batch_size", type=int, default=128, help="编码批大小")
+    parser.add_argument("--full", action="store_true", help="忽略已有索引，全量重新编码")
+    args = parser.parse_args()
+    
+    model_loader = ModelLoader(args.model_dir)
+    model, device = model_loader.load_model(use_fine_tuned=True)
+    stream_index(
+        model, model_loader.fingerprint, DataProcessor().iter_preprocessed(),
+        model_dir=args.model_dir, device=device,
+        precision=args.precision, batch_size=args.batch_size, full=args.full
+    )
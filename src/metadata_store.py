@@ -0,0 +1,326 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+import logging
+from array import array
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("MetadataStore")
+
+METADATA_FILE = "metadata.bin"
+LEGACY_METADATA_FILE = "metadata.json"
+FORMAT_VERSION = 1
+MAGIC = b'CAMETA\x01\x00'
+ALIGN = 8
+
+# 紧凑元数据格式（小端）:
+#   魔数(8) + 头长度(uint32) + JSON头(行数、类别名、各数组的 dtype/偏移/长度)
+#   之后为按8字节对齐的列数组:
+#     type_codes       uint8[N]     类别编码
+#     content_offsets  int64[N+1]   正文在 content_heap 中的字节区间
+#     source_ids       int32[N]     来源在字符串表中的编号（-1 为空）
+#     theme_ids        int32[N]     主题编号（-1 为空）
+#     keyword_offsets  int64[N+1]   每行关键词在 keyword_ids 中的区间
+#     keyword_ids      int32[K]     关键词编号
+#     string_offsets   int64[S+1]   字符串表（来源/主题/关键词去重共享）
+#     string_heap      uint8[]
+#     row_keys         uint64[N]    行键（类别+正文的哈希，可选，旧文件没有）
+#     content_heap     uint8[]      UTF-8 正文
+# 每行固定开销约30字节（另加正文与每个关键词4字节），只有返回的top-k行才还原为字典。
+
+
+def _aligned(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def row_key(type_name, content):
+    """素材行键: 类别+正文的64位哈希，用于在语义索引与BM25索引之间对齐同一条素材"""
+    digest = hashlib.blake2b(f"{type_name}\t{content}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class MetadataWriter:
+    """逐条追加元数据并写出紧凑格式
+    
+    来源/主题/关键词在写入时去重编号；指定 path 时正文先写入临时堆文件，
+    内存中只保留定长列，可用于流式构建。
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.tmp_path = path + ".tmp" if path else None
+        self._heap = open(self.tmp_path + ".heap", 'w+b') if path else io.BytesIO()
+        self._heap_size = 0
+        self.type_names = {}
+        self.strings = {}
+        self.type_codes = array('B')
+        self.content_offsets = array('q', [0])
+        self.source_ids = array('i')
+        self.theme_ids = array('i')
+        self.keyword_offsets = array('q', [0])
+        self.keyword_ids = array('i')
+        self.row_keys = array('Q')
+    
+    def __len__(self):
+        return len(self.type_codes)
+    
+    def _intern(self, value):
+        if not value:
+            return -1
+        if value not in self.strings:
+            self.strings[value] = len(self.strings)
+        return self.strings[value]
+    
+    def append(self, record):
+        code = self.type_names.setdefault(record['type'], len(self.type_names))
+        if code > 255:
+            raise ValueError("素材类别过多（最多256种）")
+        self.type_codes.append(code)
+        
+        content = record['content'].encode('utf-8')
+        self._heap.write(content)
+        self._heap_size += len(content)
+        self.content_offsets.append(self._heap_size)
+        
+        self.source_ids.append(self._intern(record.get('source', '')))
+        self.theme_ids.append(self._intern(record.get('theme', '')))
+        self.keyword_ids.extend(self._intern(k) for k in record.get('keywords', []) if k)
+        self.keyword_offsets.append(len(self.keyword_ids))
+        self.row_keys.append(row_key(record['type'], record['content']))
+    
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+    
+    def _write(self, f):
+        string_heap = bytearray()
+        string_offsets = array('q', [0])
+        for value in self.strings:  # 插入顺序即编号
+            string_heap += value.encode('utf-8')
+            string_offsets.append(len(string_heap))
+        
+        columns = [
+            ('type_codes', '|u1', self.type_codes),
+            ('content_offsets', '<i8', self.content_offsets),
+            ('source_ids', '<i4', self.source_ids),
+            ('theme_ids', '<i4', self.theme_ids),
+            ('keyword_offsets', '<i8', self.keyword_offsets),
+            ('keyword_ids', '<i4', self.keyword_ids),
+            ('string_offsets', '<i8', string_offsets),
+            ('string_heap', '|u1', string_heap),
+            ('row_keys', '<u8', self.row_keys),
+        ]
+        layout = {}
+        offset = 0
+        for name, dtype, data in columns:
+            nbytes = len(data) * (data.itemsize if isinstance(data, array) else 1)
+            layout[name] = [dtype, offset, nbytes // np.dtype(dtype).itemsize]
+            offset = _aligned(offset + nbytes)
+        layout['content_heap'] = ['|u1', offset, self._heap_size]
+        
+        header = json.dumps({
+            'format_version': FORMAT_VERSION,
+            'rows': len(self),
+            'type_names': list(self.type_names),
+            'arrays': layout
+        }, ensure_ascii=False).encode('utf-8')
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(4, 'little'))
+        f.write(header)
+        written = len(MAGIC) + 4 + len(header)
+        f.write(b'\0' * (_aligned(written) - written))
+        
+        for name, dtype, data in columns:
+            data = bytes(data) if isinstance(data, bytearray) else data.tobytes()
+            f.write(data)
+            f.write(b'\0' * (_aligned(len(data)) - len(data)))
+        self._heap.seek(0)
+        shutil.copyfileobj(self._heap, f)
+    
+    def to_bytes(self):
+        f = io.BytesIO()
+        self._write(f)
+        return f.getvalue()
+    
+    def close(self):
+        """写入目标文件（先写临时文件再替换）"""
+        with open(self.tmp_path, 'wb') as f:
+            self._write(f)
+        self._heap.close()
+        os.remove(self.tmp_path + ".heap")
+        os.replace(self.tmp_path, self.path)
+    
+    def abort(self):
+        self._heap.close()
+        for path in (self.tmp_path + ".heap", self.tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class MetadataStore:
+    """只读的紧凑元数据: 按列存储，按行号取出时才还原为字典
+    
+    支持 len()、下标访问（返回与旧版 metadata.json 相同结构的字典）及迭代。
+    """
+    def __init__(self, buffer):
+        buffer = np.asarray(buffer, dtype=np.uint8)
+        if buffer[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError("不是有效的元数据文件")
+        header_len = int.from_bytes(buffer[8:12].tobytes(), 'little')
+        header = json.loads(buffer[12:12 + header_len].tobytes().decode('utf-8'))
+        if header['format_version'] > FORMAT_VERSION:
+            raise ValueError(f"不支持的元数据版本: {header['format_version']}")
+        
+        data_start = _aligned(12 + header_len)
+        arrays = {}
+        for name, (dtype, offset, count) in header['arrays'].items():
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype)
+        
+        self.rows = header['rows']
+        self.type_names = header['type_names']
+        self.type_codes = arrays['type_codes']
+        self.content_offsets = arrays['content_offsets']
+        self.source_ids = arrays['source_ids']
+        self.theme_ids = arrays['theme_ids']
+        self.keyword_offsets = arrays['keyword_offsets']
+        self.keyword_ids = arrays['keyword_ids']
+        self.content_heap = arrays['content_heap']
+        self._row_keys = arrays.get('row_keys')
+        # 字符串表为去重后的来源/主题/关键词，数量与词表相当，直接解码
+        heap = arrays['string_heap']
+        offsets = arrays['string_offsets'].tolist()
+        self.strings = [heap[s:e].tobytes().decode('utf-8') for s, e in zip(offsets[:-1], offsets[1:])]
+    
+    @classmethod
+    def load(cls, path):
+        """一次读入整个文件，无需逐条解析"""
+        return cls(np.fromfile(path, dtype=np.uint8))
+    
+    @classmethod
+    def from_records(cls, records):
+        """由字典列表构建（用于旧版 metadata.json）"""
+        writer = MetadataWriter()
+        writer.extend(records)
+        return cls(np.frombuffer(writer.to_bytes(), dtype=np.uint8))
+    
+    def __len__(self):
+        return self.rows
+    
+    def _string(self, string_id):
+        return self.strings[string_id] if string_id >= 0 else ''
+    
+    def type_name(self, row):
+        return self.type_names[self.type_codes[row]]
+    
+    def content(self, row):
+        start, end = self.content_offsets[row], self.content_offsets[row + 1]
+        return self.content_heap[start:end].tobytes().decode('utf-8')
+    
+    @property
+    def row_keys(self):
+        """每行的行键（uint64数组）；旧文件没有该列时按正文计算一次"""
+        if self._row_keys is None:
+            logger.info("元数据中没有行键，临时计算（重新构建索引后可省去）")
+            self._row_keys = np.fromiter(
+                (row_key(self.type_name(row), self.content(row)) for row in range(self.rows)),
+                dtype=np.uint64, count=self.rows
+            )
+        return self._row_keys
+    
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.rows
+        if not 0 <= row < self.rows:
+            raise IndexError(f"元数据行号越界: {row}")
+        start, end = self.keyword_offsets[row], self.keyword_offsets[row + 1]
+        return {
+            'type': self.type_name(row),
+            'content': self.content(row),
+            'source': self._string(self.source_ids[row]),
+            'keywords': [self.strings[i] for i in self.keyword_ids[start:end].tolist()],
+            'theme': self._string(self.theme_ids[row])
+        }
+    
+    def __iter__(self):
+        for row in range(self.rows):
+            yield self[row]
+    
+    def rows_by_value(self, field):
+        """字段取值 → 有序行号数组（field 为 'theme'、'keywords' 或 'source'），直接在列上分组"""
+        if field == 'keywords':
+            ids = self.keyword_ids
+            rows = np.repeat(np.arange(self.rows, dtype=np.int32), np.diff(self.keyword_offsets))
+        elif field in ('theme', 'source'):
+            ids = self.theme_ids if field == 'theme' else self.source_ids
+            rows = np.arange(self.rows, dtype=np.int32)
+        else:
+            raise ValueError(f"不支持的元数据字段: {field}")
+        
+        valid = ids >= 0
+        ids, rows = ids[valid], rows[valid]
+        order = np.argsort(ids, kind='stable')
+        ids, rows = ids[order], rows[order]
+        values, starts = np.unique(ids, return_index=True)
+        ends = np.append(starts[1:], len(ids))
+        return {
+            self.strings[value]: np.unique(rows[start:end])
+            for value, start, end in zip(values.tolist(), starts.tolist(), ends.tolist())
+        }
+
+
+def save_metadata(path, records):
+    """将字典列表写为紧凑元数据文件"""
+    writer = MetadataWriter(path)
+    try:
+        writer.extend(records)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def load_metadata(model_dir="model"):
+    """加载当前索引的元数据，返回 MetadataStore；只有旧版 metadata.json 时在内存中转换，都不存在时返回None
+    
+    model_dir 可以是模型目录或 index_dir() 返回的索引代目录。
+    """
+    from .embedding_store import index_dir
+    directory = index_dir(model_dir)
+    path = os.path.join(directory, METADATA_FILE)
+    if os.path.exists(path):
+        return MetadataStore.load(path)
+    
+    legacy_path = os.path.join(directory, LEGACY_METADATA_FILE)
+    if os.path.exists(legacy_path):
+        logger.info(f"使用旧版元数据 {legacy_path}，可运行 python -m src.metadata_store 转换为紧凑格式")
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            return MetadataStore.from_records(json.load(f))
+    return None
+
+
+def convert_legacy_metadata(model_dir="model"):
+    """一次性将旧版 metadata.json 转换为当前索引目录中的 metadata.bin"""
+    from .embedding_store import index_dir
+    directory = index_dir(model_dir)
+    legacy_path = os.path.join(directory, LEGACY_METADATA_FILE)
+    if not os.path.exists(legacy_path):
+        raise FileNotFoundError(f"元数据文件不存在: {legacy_path}")
+    with open(legacy_path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    path = os.path.join(directory, METADATA_FILE)
+    save_metadata(path, records)
+    logger.info(f"元数据已转换: {path} ({len(records)} 条, {os.path.getsize(path) / 1024:.1f} KB)")
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="将 metadata.json 转换为紧凑二进制元数据")
+    parser.add_argument("--model_dir", default="model", help="模型目录")
+    args = parser.parse_args()
+    convert_legacy_metadata(args.model_dir)
@@ -1,8 +1,9 @@
 import os
-import torch
-from sentence_transformers import SentenceTransformer
+import random
+import hashlib
 import logging
 import warnings
+from .metadata_store import load_metadata
 
 # 忽略transformers的某些警告
 warnings.filterwarnings("ignore", message="Some weights of the model checkpoint.*")
@@ -11,34 +12,175 @@ warnings.filterwarnings("ignore", message="Some weights of the model checkpoint.
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("ModelLoader")
 
+# 推理精度: fp32 全精度 / bf16 自动混合精度 / int8 线性层动态量化（仅CPU）
+PRECISIONS = ("fp32", "bf16", "int8")
+
+# 自检时使用的默认样本（语料元数据不可用时）
+DEFAULT_CHECK_TEXTS = [
+    "坚持", "爱国", "挫折", "科技创新", "自强不息",
+    "天行健，君子以自强不息", "纸上得来终觉浅，绝知此事要躬行", "航天精神与民族复兴"
+]
+
 class ModelLoader:
     def __init__(self, model_dir="model"):
         self.model_dir = model_dir
         self.pretrained_path = os.path.join(model_dir, "pretrained")
         self.fine_tuned_path = os.path.join(model_dir, "fine_tuned")
+        self.onnx_path = os.path.join(model_dir, "onnx")
+        self.model_path = None
+        self.fingerprint = None
+        self.precision = "fp32"
+        self.precision_report = None
+        
+    def load_model(self, use_fine_tuned=True, device=None, precision="fp32", self_check=True, check_tolerance=0.98,
+                   backend="torch"):
+        """加载模型并自动选择设备
         
-    def load_model(self, use_fine_tuned=True, device=None):
-        """加载模型并自动选择设备"""
+        precision 可选 fp32/bf16/int8。非fp32模式默认在语料样本上与fp32嵌入
+        做自检，最小余弦相似度低于 check_tolerance 时回退到fp32。
+        backend="onnx" 时使用导出的ONNX编码器在CPU上推理。
+        """
+        if backend == "onnx":
+            return self.load_onnx_model(), "cpu"
+        if backend != "torch":
+            raise ValueError(f"不支持的推理后端: {backend}")
+        # 只有 torch 后端导入 torch，onnx/snapshot 后端的启动路径不加载 torch
+        import torch
         if device is None:
             device = "cuda" if torch.cuda.is_available() else "cpu"
+        if precision not in PRECISIONS:
+            raise ValueError(f"不支持的推理精度: {precision}，可选: {', '.join(PRECISIONS)}")
+        
+        # 延迟导入: sentence-transformers 会连带导入 transformers，耗时较长
+        from sentence_transformers import SentenceTransformer
         
         # 优先加载微调模型
         if use_fine_tuned and os.path.exists(self.fine_tuned_path):
             logger.info(f"加载微调模型: {self.fine_tuned_path}")
             model = SentenceTransformer(self.fine_tuned_path, device=device)
+            self.model_path = self.fine_tuned_path
         elif os.path.exists(self.pretrained_path):
             logger.info(f"加载预训练模型: {self.pretrained_path}")
             model = SentenceTransformer(self.pretrained_path, device=device)
+            self.model_path = self.pretrained_path
         else:
             raise FileNotFoundError(f"未找到模型文件，请检查目录: {self.pretrained_path}")
         
         # 优化模型
         model = self.optimize_model(model, device)
         
+        # 切换推理精度
+        self.precision = "fp32"
+        self.precision_report = None
+        if precision != "fp32":
+            model = self.apply_precision(model, precision, device, self_check, check_tolerance)
+        
+        # 记录模型指纹，供查询缓存等判断模型是否变化（不同精度的嵌入不可混用）
+        self.fingerprint = self.compute_fingerprint(self.model_path)
+        if self.precision != "fp32":
+            self.fingerprint = f"{self.fingerprint}-{self.precision}"
+        
         return model, device
     
+    def _sample_check_texts(self, sample_size=32):
+        """从语料元数据中抽取自检样本"""
+        metadata = load_metadata(self.model_dir)
+        if metadata is None or len(metadata) == 0:
+            return DEFAULT_CHECK_TEXTS
+        rows = random.Random(0).sample(range(len(metadata)), min(sample_size, len(metadata)))
+        return [metadata.content(row) for row in rows]
+    
+    def apply_precision(self, model, precision, device, self_check=True, check_tolerance=0.98):
+        """将fp32模型切换到指定推理精度，自检不通过时返回原模型"""
+        import torch
+        import torch.nn.functional as F
+        if precision == "int8" and device != "cpu":
+            logger.warning("int8动态量化仅支持CPU，使用fp32")
+            return model
+        
+        texts = self._sample_check_texts() if self_check else None
+        if texts:
+            reference = model.encode(texts, convert_to_tensor=True, show_progress_bar=False).float()
+        
+        if precision == "bf16":
+            converted = self._enable_autocast(model, device)
+        else:
+            # 线性层动态量化，保留原模型以便自检失败时回退
+            converted = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        
+        if texts:
+            embeddings = converted.encode(texts, convert_to_tensor=True, show_progress_bar=False).float()
+            cos = F.cosine_similarity(embeddings, reference, dim=1)
+            self.precision_report = {
+                'precision': precision,
+                'samples': len(texts),
+                'mean_cosine': float(cos.mean()),
+                'min_cosine': float(cos.min())
+            }
+            logger.info(f"{precision} 自检: 与fp32嵌入的平均余弦相似度 {cos.mean():.5f}, 最小 {cos.min():.5f}")
+            if cos.min() < check_tolerance:
+                logger.warning(f"{precision} 自检未通过 (最小余弦相似度 < {check_tolerance})，回退到fp32")
+                if precision == "bf16":
+                    del converted.forward
+                return model
+        
+        self.precision = precision
+        logger.info(f"已启用 {precision} 推理")
+        return converted
+    
+    def _enable_autocast(self, model, device):
+        """在模型前向计算外包裹bf16自动混合精度，输出嵌入转回float32"""
+        import torch
+        forward = model.forward
+        device_type = "cuda" if device.startswith("cuda") else "cpu"
+        
+        def autocast_forward(features, **kwargs):
+            with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+                out = forward(features, **kwargs)
+            out['sentence_embedding'] = out['sentence_embedding'].float()
+            return out
+        
+        model.forward = autocast_forward
+        return model
+    
+    def load_onnx_model(self):
+        """加载ONNX查询编码器（需先运行 python -m src.onnx_encoder 导出）"""
+        from .onnx_encoder import ONNXEncoder
+        if not os.path.exists(self.onnx_path):
+            raise FileNotFoundError(f"未找到ONNX模型，请先运行 python -m src.onnx_encoder 导出: {self.onnx_path}")
+        logger.info(f"加载ONNX编码器: {self.onnx_path}")
+        model = ONNXEncoder(self.onnx_path)
+        self.model_path = self.onnx_path
+        self.precision = "fp32"
+        self.precision_report = None
+        self.fingerprint = f"{self.compute_fingerprint(self.onnx_path)}-onnx"
+        return model
+    
+    def load_snapshot_model(self, snapshot):
+        """从快照包加载ONNX查询编码器（python -m src.snapshot 生成），不读取模型目录"""
+        from .onnx_encoder import ONNXEncoder
+        logger.info(f"从快照加载ONNX编码器: {snapshot.path}")
+        model = ONNXEncoder(files=snapshot.encoder_files())
+        self.model_path = snapshot.path
+        self.precision = "fp32"
+        self.precision_report = None
+        self.fingerprint = snapshot.fingerprint
+        return model
+    
+    @staticmethod
+    def compute_fingerprint(model_path):
+        """根据模型目录路径及权重/配置文件的大小和修改时间计算模型指纹"""
+        digest = hashlib.sha1(os.path.abspath(model_path).encode('utf-8'))
+        for name in sorted(os.listdir(model_path)):
+            file_path = os.path.join(model_path, name)
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+        return digest.hexdigest()[:16]
+    
     def optimize_model(self, model, device):
         """优化模型性能 - 检索优化版"""
+        import torch
 
         # 启用TF32支持（如果可用）
         if device == "cuda":
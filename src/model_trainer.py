@@ -1,12 +1,16 @@
 import os
-import json
+import math
+import time
 import torch
 import logging,shutil
 import numpy as np
-from torch.utils.data import Dataset, DataLoader
-from sentence_transformers import losses, InputExample
+from contextlib import nullcontext
+from torch.utils.data import Dataset, DataLoader, Sampler
+from sentence_transformers import losses, InputExample, util
 from .data_processor import DataProcessor
 from .model_loader import ModelLoader
+from .index_builder import update_index
+from .retrieval_evaluator import RetrievalEvaluator
 from tqdm import tqdm
 from datetime import datetime
 
@@ -25,6 +29,8 @@ class MaterialDataset(Dataset):
     """自定义素材数据集，适配Sentence-BERT训练格式"""
     def __init__(self, datasets):
         self.samples = []
+        # 每个样本的字符数（中文近似等于token数），供按长度分桶
+        self.lengths = []
         
         # 为每个素材创建InputExample对象
         for data_type, items in datasets.items():
@@ -40,6 +46,7 @@ class MaterialDataset(Dataset):
                     texts=[item['cleaned_text'], item['cleaned_text']],  # 两个相同的文本
                     label=1.0  # 固定标签值
                 ))
+                self.lengths.append(len(item['cleaned_text']))
     
     def __len__(self):
         return len(self.samples)
@@ -47,8 +54,248 @@ class MaterialDataset(Dataset):
     def __getitem__(self, idx):
         return self.samples[idx]
 
-def train_model(epochs=3, batch_size=16, use_cuda=True, iteration=1, total_iterations=3):
-    """训练模型的主函数 - 支持多次迭代训练"""
+class LengthBucketBatchSampler(Sampler):
+    """按文本长度分桶的批采样器
+    
+    每个epoch先打乱全部样本，在每 batch_size*bucket_multiplier 个样本的窗口内按长度排序后
+    切分批次，最后打乱批次顺序：批内长度相近、填充少，批次之间仍然随机。
+    """
+    def __init__(self, lengths, batch_size, bucket_multiplier=50, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.window = batch_size * max(1, bucket_multiplier)
+        self.seed = seed
+        self.epoch = 0
+    
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+        order = rng.permutation(len(self.lengths))
+        batches = []
+        for start in range(0, len(order), self.window):
+            window = order[start:start + self.window]
+            window = window[np.argsort(self.lengths[window], kind='stable')]
+            batches.extend(window[i:i + self.batch_size] for i in range(0, len(window), self.batch_size))
+        for i in rng.permutation(len(batches)):
+            yield batches[i].tolist()
+    
+    def __len__(self):
+        full, rest = divmod(len(self.lengths), self.window)
+        return full * math.ceil(self.window / self.batch_size) + math.ceil(rest / self.batch_size)
+
+class DynamicPaddingCollator:
+    """将一批 InputExample 分词为只填充到批内最长样本的特征，并统计真实/填充后的token数"""
+    def __init__(self, model):
+        self.model = model
+    
+    def __call__(self, examples):
+        columns = zip(*(example.texts for example in examples))
+        features = [self.model.tokenize(list(texts)) for texts in columns]
+        tokens = sum(int(f['attention_mask'].sum()) for f in features)
+        padded = sum(f['attention_mask'].numel() for f in features)
+        return features, tokens, padded
+
+def _autocast_settings(amp, device):
+    """混合精度配置: 返回(autocast上下文工厂, GradScaler或None)
+    
+    amp 为 None/bf16/fp16。fp16 需要损失缩放（仅CUDA）；CPU只支持bf16，
+    不支持bf16的GPU自动改用fp16。
+    """
+    if amp is None:
+        return nullcontext, None
+    if amp not in ("bf16", "fp16"):
+        raise ValueError(f"不支持的混合精度: {amp}，可选: bf16, fp16")
+    device_type = "cuda" if device.startswith("cuda") else "cpu"
+    if amp == "fp16" and device_type == "cpu":
+        logger.warning("CPU不支持fp16自动混合精度，改用bf16")
+        amp = "bf16"
+    if amp == "bf16" and device_type == "cuda" and not torch.cuda.is_bf16_supported():
+        logger.warning("当前GPU不支持bf16，改用fp16（带损失缩放）")
+        amp = "fp16"
+    
+    dtype = torch.bfloat16 if amp == "bf16" else torch.float16
+    scaler = torch.amp.GradScaler("cuda") if amp == "fp16" else None
+    logger.info(f"启用{amp}自动混合精度{'（动态损失缩放）' if scaler else ''}")
+    return (lambda: torch.autocast(device_type=device_type, dtype=dtype)), scaler
+
+def _save_checkpoint(model, checkpoint_path, epoch, limit=3):
+    """保存第 epoch 轮的检查点，只保留最近 limit 个"""
+    path = os.path.join(checkpoint_path, f"epoch_{epoch}")
+    model.save(path)
+    checkpoints = sorted(
+        (name for name in os.listdir(checkpoint_path) if name.startswith("epoch_")),
+        key=lambda name: int(name.split("_")[1])
+    )
+    for name in checkpoints[:-limit]:
+        shutil.rmtree(os.path.join(checkpoint_path, name), ignore_errors=True)
+
+def fit_model(model, dataset, epochs, batch_size, device, lr=2e-5, warmup_steps=100, amp=None,
+              accumulation_steps=1, mini_batch_size=None, bucket_multiplier=50, max_grad_norm=1.0,
+              weight_decay=0.01, checkpoint_path=None, checkpoint_epochs=5, seed=0,
+              evaluator=None, eval_steps=None, patience=None, min_delta=1e-4):
+    """面向吞吐的训练循环（MultipleNegativesRankingLoss）
+    
+    - 按长度分桶采样 + 动态填充，减少填充token
+    - amp=bf16/fp16 自动混合精度，fp16 使用动态损失缩放
+    - accumulation_steps 个批次累积一次梯度，优化器的有效批大小与显存解耦
+    - mini_batch_size 小于 batch_size 时使用 CachedMultipleNegativesRankingLoss（GradCache），
+      批内负样本数仍为 batch_size，而显存只与 mini_batch_size 相关
+    - 提供 evaluator（RetrievalEvaluator）时，训练前及每 eval_steps 次参数更新（默认每个epoch末）
+      评估一次；连续 patience 次提升不足 min_delta 即提前停止，结束时恢复得分最高的权重
+    
+    返回 {'epochs': 每个epoch的统计（损失、token吞吐、填充比例）, 'evaluations': 各次评估,
+          'best_score': 最高得分, 'best_step': 对应的更新步数, 'stopped_early': 是否提前停止}。
+    """
+    sampler = LengthBucketBatchSampler(dataset.lengths, batch_size, bucket_multiplier, seed=seed)
+    dataloader = DataLoader(dataset, batch_sampler=sampler, collate_fn=DynamicPaddingCollator(model))
+    
+    cached = mini_batch_size is not None and mini_batch_size < batch_size
+    if cached:
+        train_loss = losses.CachedMultipleNegativesRankingLoss(model=model, mini_batch_size=mini_batch_size)
+    else:
+        train_loss = losses.MultipleNegativesRankingLoss(model=model)
+    autocast, scaler = _autocast_settings(amp, device)
+    
+    # 与 sentence-transformers 默认设置一致: AdamW，偏置与LayerNorm不做权重衰减，warmup后余弦衰减
+    from transformers import get_cosine_schedule_with_warmup
+    no_decay = ("bias", "LayerNorm.bias", "LayerNorm.weight")
+    params = list(train_loss.named_parameters())
+    optimizer = torch.optim.AdamW([
+        {'params': [p for n, p in params if not any(nd in n for nd in no_decay)], 'weight_decay': weight_decay},
+        {'params': [p for n, p in params if any(nd in n for nd in no_decay)], 'weight_decay': 0.0}
+    ], lr=lr)
+    steps_per_epoch = math.ceil(len(dataloader) / accumulation_steps)
+    scheduler = get_cosine_schedule_with_warmup(optimizer, min(warmup_steps, steps_per_epoch), steps_per_epoch * epochs)
+    logger.info(
+        f"训练配置: 批大小 {batch_size}, 梯度累积 {accumulation_steps} 步（有效批大小 {batch_size * accumulation_steps}）, "
+        f"{'GradCache 子批 ' + str(mini_batch_size) + ', ' if cached else ''}每轮 {steps_per_epoch} 次更新"
+    )
+    
+    history = {'epochs': [], 'evaluations': [], 'best_score': None, 'best_step': 0, 'stopped_early': False}
+    best_state = None
+    stale_evaluations = 0
+    eval_seconds = 0.0
+    
+    def evaluate(step):
+        """评估并记录；得分提升时在CPU上保存一份权重，返回是否应提前停止"""
+        nonlocal best_state, stale_evaluations, eval_seconds
+        start_time = time.perf_counter()
+        metrics = evaluator(model)
+        model.train()  # encode 会切换到 eval 模式
+        metrics.update(step=step, elapsed_s=time.perf_counter() - start_time)
+        eval_seconds += metrics['elapsed_s']
+        history['evaluations'].append(metrics)
+        
+        if history['best_score'] is None or metrics['score'] > history['best_score'] + min_delta:
+            history['best_score'] = metrics['score']
+            history['best_step'] = step
+            best_state = {name: value.detach().to("cpu", copy=True) for name, value in model.state_dict().items()}
+            stale_evaluations = 0
+        else:
+            stale_evaluations += 1
+        scores = ", ".join(f"{name} {value:.4f}" for name, value in metrics.items() if '@' in name)
+        logger.info(
+            f"检索评估 (第 {step} 步): {scores} | 最佳 {history['best_score']:.4f} "
+            f"(第 {history['best_step']} 步), 耗时 {metrics['elapsed_s']:.1f}s"
+        )
+        return patience is not None and stale_evaluations >= patience
+    
+    step = 0
+    stop = evaluator is not None and evaluate(step)
+    model.train()
+    for epoch in range(1, epochs + 1):
+        if stop:
+            break
+        start_time = time.perf_counter()
+        eval_seconds = 0.0
+        tokens = padded = batches = 0
+        loss_sum = torch.zeros((), device=device)
+        optimizer.zero_grad(set_to_none=True)
+        
+        for i, (features, batch_tokens, batch_padded) in enumerate(tqdm(dataloader, desc=f"Epoch {epoch}/{epochs}")):
+            features = [util.batch_to_device(f, device) for f in features]
+            with autocast():
+                loss = train_loss(features, None) / accumulation_steps
+                # GradCache 在反向传播时重新前向子批，需处于同一 autocast 上下文
+                if cached:
+                    (scaler.scale(loss) if scaler else loss).backward()
+            if not cached:
+                (scaler.scale(loss) if scaler else loss).backward()
+            loss_sum += loss.detach() * accumulation_steps  # 累加为张量，避免每步同步设备
+            tokens += batch_tokens
+            padded += batch_padded
+            batches += 1
+            
+            if (i + 1) % accumulation_steps == 0 or i + 1 == len(dataloader):
+                if scaler is not None:
+                    scaler.unscale_(optimizer)
+                torch.nn.utils.clip_grad_norm_(train_loss.parameters(), max_grad_norm)
+                if scaler is not None:
+                    scaler.step(optimizer)
+                    scaler.update()
+                else:
+                    optimizer.step()
+                scheduler.step()
+                optimizer.zero_grad(set_to_none=True)
+                step += 1
+                if evaluator is not None and eval_steps and step % eval_steps == 0:
+                    stop = evaluate(step)
+                    if stop:
+                        break
+        
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        # 吞吐只统计训练时间，不含轮内的检索评估
+        elapsed = time.perf_counter() - start_time - eval_seconds
+        stats = {
+            'epoch': epoch,
+            'loss': loss_sum.item() / max(batches, 1),
+            'tokens_per_s': tokens / elapsed,
+            'padded_tokens_per_s': padded / elapsed,
+            'padding_ratio': 1 - tokens / max(padded, 1),
+            'elapsed_s': elapsed
+        }
+        history['epochs'].append(stats)
+        logger.info(
+            f"Epoch {epoch}/{epochs}: 损失 {stats['loss']:.4f}, {stats['tokens_per_s']:.0f} tokens/s "
+            f"(含填充 {stats['padded_tokens_per_s']:.0f}/s, 填充占比 {stats['padding_ratio']:.1%}), 耗时 {elapsed:.1f}s"
+        )
+        
+        if evaluator is not None and not eval_steps and not stop:
+            stop = evaluate(step)
+        if stop:
+            history['stopped_early'] = True
+            logger.info(f"检索指标已连续 {patience} 次评估未提升，提前停止（第 {epoch} 轮，第 {step} 步）")
+        
+        if checkpoint_path and checkpoint_epochs and epoch % checkpoint_epochs == 0 and epoch < epochs and not stop:
+            _save_checkpoint(model, checkpoint_path, epoch)
+    
+    if best_state is not None and history['best_step'] != step:
+        logger.info(f"恢复检索得分最高的权重（第 {history['best_step']} 步, {history['best_score']:.4f}）")
+        model.load_state_dict(best_state)
+    model.eval()
+    return history
+
+def build_final_index(model, model_loader, datasets, device, index_precision="float32"):
+    """按微调后模型的指纹全量重建素材索引（元数据、嵌入、哈希）"""
+    model.to(device)
+    fingerprint = ModelLoader.compute_fingerprint(model_loader.fine_tuned_path)
+    stats = update_index(
+        model, fingerprint, datasets,
+        model_dir="model", device=device,
+        precision=index_precision, full=True
+    )
+    logger.info(f"训练完成! 保存嵌入向量: {stats['total']} 条")
+    return stats
+
+def train_model(epochs=3, batch_size=16, use_cuda=True, iteration=1, total_iterations=3, index_precision="float32",
+                amp=None, accumulation_steps=1, mini_batch_size=None, bucket_multiplier=50,
+                evaluator=None, eval_steps=None, patience=None, build_index=True):
+    """训练模型的主函数 - 支持多次迭代训练，返回(模型, fit_model 的训练记录)
+    
+    amp/accumulation_steps/mini_batch_size/bucket_multiplier 及 evaluator/eval_steps/patience 见 fit_model。
+    build_index=False 时最后一次迭代不重建索引（由调用方在选出最佳迭代后重建）。
+    """
     # 确定设备
     device = "cuda" if use_cuda and torch.cuda.is_available() else "cpu"
     logger.info(f"使用设备: {device}")
@@ -71,118 +318,73 @@ def train_model(epochs=3, batch_size=16, use_cuda=True, iteration=1, total_itera
         logger.info("加载预训练模型")
         model, device = model_loader.load_model(use_fine_tuned=False, device=device)
     
-    # 训练配置
-    train_dataloader = DataLoader(dataset, shuffle=True, batch_size=batch_size)
-    
-    # 使用更适合无监督/自监督任务的损失函数
-    train_loss = losses.MultipleNegativesRankingLoss(model=model)
-    
     # 微调模型
     logger.info(f"开始微调模型 (迭代 #{iteration}/{total_iterations})")
-    
-    # 禁用AMP - 避免精度问题
-    use_amp = False
-    
-    try:
-        model.fit(
-            train_objectives=[(train_dataloader, train_loss)],
-            epochs=epochs,
-            steps_per_epoch=len(train_dataloader),
-            warmup_steps=min(100, len(train_dataloader)),
-            output_path=f"model/temp_iter{iteration}",
-            show_progress_bar=True,
-            checkpoint_path=f"model/checkpoints_iter{iteration}",
-            checkpoint_save_steps=min(100, len(train_dataloader)),
-            checkpoint_save_total_limit=3,
-            use_amp=use_amp,
-            optimizer_params={'lr': 2e-5 * (0.8 ** (iteration-1))},  # 逐步降低学习率
-            scheduler='warmupcosine'
-        )
-    except TypeError as e:
-        # 兼容模式
-        model.fit(
-            train_objectives=[(train_dataloader, train_loss)],
-            epochs=epochs,
-            warmup_steps=min(100, len(train_dataloader)),
-            output_path=f"model/temp_iter{iteration}",
-            show_progress_bar=True,
-            checkpoint_path=f"model/checkpoints_iter{iteration}",
-            checkpoint_save_steps=min(100, len(train_dataloader)),
-            checkpoint_save_total_limit=3,
-            use_amp=use_amp,
-            optimizer_params={'lr': 2e-5 * (0.8 ** (iteration-1))},
-            scheduler='warmupcosine'
-        )
+    history = fit_model(
+        model, dataset,
+        epochs=epochs,
+        batch_size=batch_size,
+        device=device,
+        lr=2e-5 * (0.8 ** (iteration-1)),  # 逐步降低学习率
+        warmup_steps=100,
+        amp=amp,
+        accumulation_steps=accumulation_steps,
+        mini_batch_size=mini_batch_size,
+        bucket_multiplier=bucket_multiplier,
+        checkpoint_path=f"model/checkpoints_iter{iteration}",
+        seed=iteration,
+        evaluator=evaluator,
+        eval_steps=eval_steps,
+        patience=patience
+    )
     
     # 保存微调后的模型
     model_loader.save_model(model)
     
     # 如果是最后一次迭代，生成并保存嵌入向量
-    if iteration == total_iterations:
+    if build_index and iteration == total_iterations:
         logger.info("最后一次迭代，生成素材嵌入向量...")
-        
-        # 收集所有清理后的文本
-        all_texts = []
-        metadata = []
-        for data_type, items in datasets.items():
-            for item in items:
-                all_texts.append(item['cleaned_text'])
-                metadata.append({
-                    'type': data_type,
-                    'content': item['content'],
-                    'source': item.get('source', ''),
-                    'keywords': item['keywords'],
-                    'theme': item.get('theme', '')
-                })
-        
-        # 分批编码以减少内存使用
-        embeddings = []
-        batch_size_emb = 128
-        
-        # 确保模型在正确设备上
-        model.to(device)
-        
-        # 禁用梯度计算以节省内存
-        with torch.no_grad():
-            for i in tqdm(range(0, len(all_texts), batch_size_emb), desc="生成嵌入"):
-                batch = all_texts[i:i+batch_size_emb]
-                batch_emb = model.encode(
-                    batch, 
-                    convert_to_tensor=True, 
-                    device=device,
-                    show_progress_bar=False,
-                    batch_size=batch_size_emb
-                )
-                embeddings.append(batch_emb.cpu())  # 移到CPU以节省GPU内存
-        
-        # 合并所有嵌入
-        embeddings = torch.cat(embeddings, dim=0)
-        torch.save(embeddings, "model/embeddings.pt")
-        
-        # 保存元数据
-        with open("model/metadata.json", 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"训练完成! 保存嵌入向量: {embeddings.shape[0]} 条, 维度: {embeddings.shape[1]}")
+        build_final_index(model, model_loader, datasets, device, index_precision)
     
     logger.info(f"迭代 #{iteration} 完成! 模型已保存到 model/fine_tuned")
-    return model
+    return model, history
 
-def iterative_training(total_iterations=3, epochs_per_iter=3, batch_size=16):
-    """执行多次迭代训练"""
-    best_model = None
+def iterative_training(total_iterations=3, epochs_per_iter=3, batch_size=16, index_precision="float32",
+                       amp=None, accumulation_steps=1, mini_batch_size=None, bucket_multiplier=50,
+                       evaluate=True, eval_steps=None, patience=3, min_delta=1e-4):
+    """执行多次迭代训练
+    
+    evaluate=True 时用 RetrievalEvaluator 在训练中评估（见 fit_model），某次迭代未能
+    提升检索得分即停止后续迭代；最终选用得分最高的迭代（而非最后一次）并据此重建索引。
+    """
+    datasets = None
+    evaluator = None
+    if evaluate:
+        datasets = DataProcessor().load_and_preprocess()
+        evaluator = RetrievalEvaluator(datasets)
+    best_iteration = None
+    best_score = None
     
     for i in range(1, total_iterations+1):
         logger.info(f"\n{'='*40}")
         logger.info(f"开始训练迭代 #{i}/{total_iterations}")
         logger.info(f"{'='*40}")
         
-        model = train_model(
+        model, history = train_model(
             epochs=epochs_per_iter,
             batch_size=batch_size,
             use_cuda=True,
             iteration=i,
-            total_iterations=total_iterations
+            total_iterations=total_iterations,
+            index_precision=index_precision,
+            amp=amp,
+            accumulation_steps=accumulation_steps,
+            mini_batch_size=mini_batch_size,
+            bucket_multiplier=bucket_multiplier,
+            evaluator=evaluator,
+            eval_steps=eval_steps,
+            patience=patience,
+            build_index=evaluator is None
         )
         
         # 保存当前迭代的模型副本
@@ -192,17 +394,50 @@ def iterative_training(total_iterations=3, epochs_per_iter=3, batch_size=16):
             dirs_exist_ok=True
         )
         
-        # 评估当前模型（可选）
-        # accuracy = evaluate_model(model)
-        # if best_model is None or accuracy > best_accuracy:
-        #     best_model = model
-        #     best_accuracy = accuracy
-    
-    logger.info(f"所有 {total_iterations} 次迭代训练完成!")
-    # 使用最后一次训练的模型作为最终模型
+        if evaluator is None:
+            continue
+        score = history['best_score']
+        if best_score is None or score > best_score + min_delta:
+            best_iteration, best_score = i, score
+            logger.info(f"迭代 #{i} 检索得分 {score:.4f}（当前最佳）")
+        else:
+            logger.info(f"迭代 #{i} 检索得分 {score:.4f} 未超过最佳 {best_score:.4f}（迭代 #{best_iteration}），停止后续迭代")
+            break
+    
+    if evaluator is None:
+        logger.info(f"所有 {total_iterations} 次迭代训练完成!")
+        # 使用最后一次训练的模型作为最终模型
+        return model
+    
+    # 选用检索得分最高的迭代作为最终模型，并据此重建素材索引
+    logger.info(f"训练完成! 选用迭代 #{best_iteration}（{evaluator.main_metric} = {best_score:.4f}）")
+    best_path = f"model/fine_tuned_iter{best_iteration}"
+    model_loader = ModelLoader()
+    if best_iteration != i:
+        shutil.rmtree(model_loader.fine_tuned_path, ignore_errors=True)
+        shutil.copytree(best_path, model_loader.fine_tuned_path)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model, device = model_loader.load_model(use_fine_tuned=True, device=device)
+    else:
+        device = str(model.device)
+    build_final_index(model, model_loader, datasets, device, index_precision)
     return model
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="微调素材检索模型")
+    parser.add_argument("--iterations", type=int, default=5, help="迭代次数")
+    parser.add_argument("--epochs", type=int, default=30, help="每次迭代的epoch数")
+    parser.add_argument("--batch_size", type=int, default=32, help="批大小（MultipleNegativesRankingLoss 的批内负样本数）")
+    parser.add_argument("--amp", default=None, choices=("bf16", "fp16"), help="自动混合精度（fp16 使用损失缩放）")
+    parser.add_argument("--accumulation_steps", type=int, default=1, help="梯度累积步数")
+    parser.add_argument("--mini_batch_size", type=int, default=None, help="GradCache 子批大小，小于批大小时启用")
+    parser.add_argument("--bucket_multiplier", type=int, default=50, help="长度分桶窗口（批大小的倍数）")
+    parser.add_argument("--no-eval", action="store_true", help="关闭训练中的检索评估与提前停止")
+    parser.add_argument("--eval_steps", type=int, default=None, help="每多少次参数更新评估一次，默认每个epoch末")
+    parser.add_argument("--patience", type=int, default=3, help="检索指标连续多少次评估未提升即停止")
+    args = parser.parse_args()
+    
     try:
         # 设置环境变量
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -210,9 +445,16 @@ if __name__ == "__main__":
         
         # 执行多次迭代训练
         iterative_training(
-            total_iterations=5,  # 训练10次
-            epochs_per_iter=30,   # 每次20个epoch
-            batch_size=32        # 批处理大小32
+            total_iterations=args.iterations,
+            epochs_per_iter=args.epochs,
+            batch_size=args.batch_size,
+            amp=args.amp,
+            accumulation_steps=args.accumulation_steps,
+            mini_batch_size=args.mini_batch_size,
+            bucket_multiplier=args.bucket_multiplier,
+            evaluate=not args.no_eval,
+            eval_steps=args.eval_steps,
+            patience=args.patience
         )
     except Exception as e:
         logger.exception(f"训练过程中发生严重错误: {str(e)}")
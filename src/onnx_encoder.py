@@ -0,0 +1,233 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("ONNXEncoder")
+
+ONNX_DIR = "onnx"
+RAW_MODEL_FILE = "encoder.onnx"
+OPTIMIZED_MODEL_FILE = "encoder.opt.onnx"
+POOLING_CONFIG = os.path.join("1_Pooling", "config.json")
+# 独立加载编码器所需的文件（除ONNX图外）
+ENCODER_FILES = ("tokenizer.json", "sentence_bert_config.json", "modules.json", POOLING_CONFIG)
+# _pool 实现的池化方式
+POOLING_MODES = (
+    "pooling_mode_cls_token", "pooling_mode_max_tokens",
+    "pooling_mode_mean_tokens", "pooling_mode_mean_sqrt_len_tokens"
+)
+
+
+def _check_pooling(pooling):
+    """校验池化配置只启用了 _pool 支持的方式，否则抛出ValueError"""
+    enabled = [key for key, value in pooling.items() if key.startswith("pooling_mode_") and value]
+    unsupported = [key for key in enabled if key not in POOLING_MODES]
+    if unsupported:
+        raise ValueError(f"ONNX编码器不支持的池化方式: {', '.join(unsupported)}（支持: {', '.join(POOLING_MODES)}）")
+    if not enabled:
+        raise ValueError(f"池化配置未启用任何池化方式（支持: {', '.join(POOLING_MODES)}）")
+
+
+def _pool(hidden, attention_mask, pooling):
+    """按 1_Pooling/config.json 的配置对 token 向量池化（顺序与 sentence-transformers 一致）"""
+    mask = attention_mask[:, :, None].astype(np.float32)
+    parts = []
+    if pooling.get('pooling_mode_cls_token'):
+        parts.append(hidden[:, 0])
+    if pooling.get('pooling_mode_max_tokens'):
+        parts.append(np.where(mask > 0, hidden, -1e9).max(axis=1))
+    if pooling.get('pooling_mode_mean_tokens') or pooling.get('pooling_mode_mean_sqrt_len_tokens'):
+        sums = (hidden * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        if pooling.get('pooling_mode_mean_tokens'):
+            parts.append(sums / counts)
+        if pooling.get('pooling_mode_mean_sqrt_len_tokens'):
+            parts.append(sums / np.sqrt(counts))
+    return np.concatenate(parts, axis=1)
+
+
+class ONNXEncoder:
+    """基于 onnxruntime 的查询编码器，encode 接口与 SentenceTransformer 保持一致
+    
+    不依赖 sentence-transformers/transformers，只加载导出的ONNX图与 tokenizer.json，
+    在CPU上运行。
+    """
+    def __init__(self, onnx_dir=None, intra_op_threads=None, files=None):
+        """files 为 文件名 → 内容(bytes 或 memoryview) 的映射（如快照包中的编码器），提供时不读取 onnx_dir"""
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        self.onnx_dir = onnx_dir
+        if files is not None:
+            model = files.get(OPTIMIZED_MODEL_FILE) or files[RAW_MODEL_FILE]
+            
+            def read_json(name):
+                return json.loads(str(files[name.replace(os.sep, "/")], 'utf-8'))
+        else:
+            model = os.path.join(onnx_dir, OPTIMIZED_MODEL_FILE)
+            if not os.path.exists(model):
+                model = os.path.join(onnx_dir, RAW_MODEL_FILE)
+            
+            def read_json(name):
+                with open(os.path.join(onnx_dir, name), 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        
+        self.pooling = read_json(POOLING_CONFIG)
+        _check_pooling(self.pooling)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if isinstance(model, memoryview):
+            # onnxruntime 的 Python 接口只接受路径或 bytes，此处的临时副本无法避免；
+            # 权重在建会话时已复制进会话自身的张量，副本随后即被释放，不会常驻内存
+            model = model.tobytes()
+        self.session = ort.InferenceSession(model, options, providers=["CPUExecutionProvider"])
+        del model
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        
+        self.max_seq_length = read_json("sentence_bert_config.json").get('max_seq_length', 512)
+        self.normalize = any(m['type'].endswith("Normalize") for m in read_json("modules.json"))
+        
+        if files is not None:
+            self.tokenizer = Tokenizer.from_str(str(files["tokenizer.json"], 'utf-8'))
+        else:
+            self.tokenizer = Tokenizer.from_file(os.path.join(onnx_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]")
+        self.tokenizer.enable_padding(pad_id=pad_id if pad_id is not None else 0, pad_token="[PAD]")
+    
+    def tokenize(self, texts):
+        """分词并填充为一个批次，返回ONNX图的输入"""
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        return {name: value for name, value in feeds.items() if name in self.input_names}
+    
+    def encode_features(self, feeds):
+        """对 tokenize 的结果做前向计算与池化，返回float32嵌入"""
+        hidden = self.session.run(None, feeds)[0]
+        embeddings = _pool(hidden, feeds['attention_mask'], self.pooling)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+    
+    def _encode_batch(self, texts):
+        return self.encode_features(self.tokenize(texts))
+    
+    def encode(self, sentences, batch_size=32, convert_to_tensor=False, show_progress_bar=False,
+               device=None, **kwargs):
+        """编码文本，参数与 SentenceTransformer.encode 对齐（device 仅支持CPU，忽略）"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        
+        # 按长度排序后分批，减少填充
+        order = np.argsort([-len(t) for t in texts], kind='stable')
+        embeddings = np.empty((len(texts), 0), dtype=np.float32)
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            chunks.append(self._encode_batch([texts[i] for i in order[start:start + batch_size]]))
+        if chunks:
+            embeddings = np.empty((len(texts), chunks[0].shape[1]), dtype=np.float32)
+            embeddings[order] = np.concatenate(chunks, axis=0)
+        
+        if single:
+            embeddings = embeddings[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embeddings)
+        return embeddings
+    
+    def eval(self):
+        return self
+    
+    def to(self, device):
+        return self
+
+
+def export_onnx(model_path="model/fine_tuned", output_dir=None, opset=17, check_texts=None):
+    """将 SentenceTransformer 模型（transformer + pooling）导出为ONNX，并做图优化
+    
+    导出后用样本文本对比PyTorch与onnxruntime的嵌入，记录最大误差。
+    """
+    import torch
+    import onnxruntime as ort
+    from sentence_transformers import SentenceTransformer
+    
+    # 导出前先校验池化方式，避免导出完成后才在编码时失败
+    with open(os.path.join(model_path, POOLING_CONFIG), 'r', encoding='utf-8') as f:
+        _check_pooling(json.load(f))
+    
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.normpath(model_path)), ONNX_DIR)
+    os.makedirs(os.path.join(output_dir, os.path.dirname(POOLING_CONFIG)), exist_ok=True)
+    
+    model = SentenceTransformer(model_path, device="cpu")
+    model.eval()
+    transformer = model[0]
+    
+    class _HiddenStates(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+        
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.auto_model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+    
+    dummy = transformer.tokenizer(["作文素材检索", "坚持"], padding=True, return_tensors="pt")
+    raw_path = os.path.join(output_dir, RAW_MODEL_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ("input_ids", "attention_mask", "token_type_ids")}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStates(transformer.auto_model),
+            (dummy['input_ids'], dummy['attention_mask'], dummy['token_type_ids']),
+            raw_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    logger.info(f"ONNX模型已导出: {raw_path}")
+    
+    # 离线图优化（算子融合等），保存为与硬件无关的优化图
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = os.path.join(output_dir, OPTIMIZED_MODEL_FILE)
+    ort.InferenceSession(raw_path, options, providers=["CPUExecutionProvider"])
+    logger.info(f"ONNX图优化完成: {options.optimized_model_filepath}")
+    
+    # 复制分词器与池化配置，使ONNX目录可独立加载
+    transformer.tokenizer.save_pretrained(output_dir)
+    for name in ENCODER_FILES[1:]:
+        shutil.copyfile(os.path.join(model_path, name), os.path.join(output_dir, name))
+    
+    # 数值一致性检查
+    texts = check_texts or ["坚持", "爱国", "挫折", "天行健，君子以自强不息", "航天精神与民族复兴"]
+    reference = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    embeddings = ONNXEncoder(output_dir).encode(texts)
+    max_error = float(np.abs(embeddings - reference).max())
+    logger.info(f"ONNX与PyTorch嵌入最大绝对误差: {max_error:.2e}")
+    if max_error > 1e-3:
+        logger.warning("ONNX嵌入与PyTorch差异较大，请检查导出配置")
+    return output_dir
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="导出ONNX查询编码器")
+    parser.add_argument("--model_path", default="model/fine_tuned", help="SentenceTransformer模型目录")
+    parser.add_argument("--output_dir", default=None, help="输出目录，默认 model/onnx")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset版本")
+    args = parser.parse_args()
+    export_onnx(args.model_path, args.output_dir, opset=args.opset)
@@ -0,0 +1,79 @@
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """规范化查询文本: 全半角统一、去除首尾空白并合并连续空白"""
+    query = unicodedata.normalize('NFKC', query)
+    return ' '.join(query.split())
+
+
+class QueryEmbeddingCache:
+    """线程安全的有界LRU缓存，缓存查询文本到嵌入向量的映射
+
+    缓存键由规范化后的查询文本与模型指纹组成。当检测到模型指纹变化时
+    （即ModelLoader加载了不同的模型目录），缓存自动失效。
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def _check_fingerprint(self, fingerprint):
+        """模型指纹变化时清空缓存（需持有锁）"""
+        if fingerprint != self._fingerprint:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._fingerprint = fingerprint
+    
+    def get(self, query, fingerprint):
+        """查询缓存，未命中返回None"""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            embedding = self._entries.get(query)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return embedding
+    
+    def put(self, query, fingerprint, embedding):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._entries[query] = embedding
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """清空缓存（保留统计计数）"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """返回命中/未命中/淘汰统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,73 @@
+import random
+import logging
+import torch
+from .index_builder import collect_items
+from .query_cache import normalize_query
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("RetrievalEvaluator")
+
+
+class RetrievalEvaluator:
+    """训练过程中的检索评估: 以关键词/主题为查询，含相同关键词/主题的素材为相关结果
+    
+    从语料中抽取至多 max_corpus 条素材作为检索库（与索引相同，使用清理后文本），
+    在其上选取至少有 min_relevant 条相关素材的关键词/主题作为查询，计算
+    recall@k 与 MRR@k。评估只需编码一次检索库和查询，可在训练中每N步运行。
+    """
+    def __init__(self, datasets, max_corpus=2000, max_queries=300, min_relevant=2, ks=(1, 5, 10),
+                 main_metric="mrr@10", batch_size=128, seed=0):
+        texts, metadata = collect_items(datasets)
+        rng = random.Random(seed)
+        rows = sorted(rng.sample(range(len(texts)), min(max_corpus, len(texts))))
+        self.corpus = [texts[row] for row in rows]
+        
+        relevant = {}
+        for doc, row in enumerate(rows):
+            meta = metadata[row]
+            for term in meta['keywords'] + [meta['theme']]:
+                term = normalize_query(term)
+                if term:
+                    relevant.setdefault(term, set()).add(doc)
+        candidates = sorted(term for term, docs in relevant.items() if len(docs) >= min_relevant)
+        self.queries = rng.sample(candidates, min(max_queries, len(candidates)))
+        self.relevant = [relevant[query] for query in self.queries]
+        
+        self.ks = tuple(sorted(ks))
+        metric_names = [f"{name}@{k}" for name in ("recall", "mrr") for k in self.ks]
+        if main_metric not in metric_names:
+            raise ValueError(f"不支持的主指标: {main_metric}，可选: {', '.join(metric_names)}")
+        self.main_metric = main_metric
+        self.batch_size = batch_size
+        logger.info(f"检索评估集: {len(self.corpus)} 条素材, {len(self.queries)} 个查询")
+    
+    def __len__(self):
+        return len(self.queries)
+    
+    def _encode(self, model, texts):
+        return model.encode(texts, batch_size=self.batch_size, convert_to_tensor=True,
+                            normalize_embeddings=True, show_progress_bar=False).float()
+    
+    def __call__(self, model):
+        """评估模型，返回 {'recall@k': ..., 'mrr@k': ..., 'score': 主指标}"""
+        if not self.queries:
+            return {'score': 0.0}
+        with torch.no_grad():
+            corpus_embeddings = self._encode(model, self.corpus)
+            query_embeddings = self._encode(model, self.queries)
+            max_k = min(self.ks[-1], len(self.corpus))
+            top_indices = torch.topk(query_embeddings @ corpus_embeddings.t(), k=max_k, dim=1).indices.tolist()
+        
+        metrics = {f"recall@{k}": 0.0 for k in self.ks}
+        metrics.update({f"mrr@{k}": 0.0 for k in self.ks})
+        for ranked, relevant in zip(top_indices, self.relevant):
+            hits = [doc in relevant for doc in ranked]
+            first_hit = hits.index(True) + 1 if True in hits else None
+            for k in self.ks:
+                metrics[f"recall@{k}"] += sum(hits[:k]) / len(relevant)
+                if first_hit is not None and first_hit <= k:
+                    metrics[f"mrr@{k}"] += 1.0 / first_hit
+        metrics = {name: value / len(self.queries) for name, value in metrics.items()}
+        metrics['score'] = metrics[self.main_metric]
+        return metrics
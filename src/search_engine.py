@@ -1,61 +1,252 @@
 import os
-import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+import numpy as np
+import jieba
+from .metadata_store import row_key
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("MaterialSearch")
+
+INDEX_FILE = "bm25_index.npz"
+# 2: 增加 row_keys（与语义索引元数据相同的行键）
+FORMAT_VERSION = 2
+
+_NON_WORD = re.compile(r'[^\w\u4e00-\u9fff]+')
+_CJK_RUN = re.compile(r'[\u4e00-\u9fff]{2,}')
+
+# 检索结果、混合检索的精确命中与过滤用到的素材字段，其余字段加载后即丢弃
+RESULT_FIELDS = ('content', 'source', 'keywords', 'theme')
+
+# 字级bigram加前缀，与jieba切出的双字词区分
+BIGRAM_PREFIX = "#"
+
+
+def tokenize(text):
+    """jieba搜索引擎模式分词 + 汉字bigram，用于建索引和查询"""
+    text = _NON_WORD.sub(' ', text.lower())
+    tokens = [w for w in (w.strip() for w in jieba.cut_for_search(text)) if w]
+    # 字级bigram弥补分词粒度不一致（如"自强不息"与"自强"）
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(BIGRAM_PREFIX + run[i:i+2] for i in range(len(run) - 1))
+    return tokens
+
+
+def corpus_signature(texts, doc_types):
+    """语料签名，用于判断磁盘上的索引是否过期"""
+    digest = hashlib.sha1()
+    for text, doc_type in zip(texts, doc_types):
+        digest.update(f"{doc_type}\t{text}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class BM25Index:
+    """BM25倒排索引
+    
+    倒排表按CSR格式紧凑存储: offsets[t]:offsets[t+1] 为词t的文档号与预计算的
+    BM25权重（idf * 词频饱和项），查询时只需累加权重并做部分选择取top-k。
+    """
+    def __init__(self, vocab, offsets, docs, impacts, doc_types, type_names, signature="", row_keys=None):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.impacts = impacts
+        self.doc_types = doc_types
+        self.type_names = type_names
+        self.type_codes = {name: code for code, name in enumerate(type_names)}
+        self.signature = signature
+        self.row_keys = row_keys
+    
+    @property
+    def size(self):
+        return int(self.doc_types.shape[0])
+    
+    @classmethod
+    def build(cls, texts, doc_types, k1=1.5, b=0.75, signature="", row_keys=None):
+        """从文本构建索引，row_keys 为每条文档的行键（metadata_store.row_key），用于与语义索引对齐"""
+        start_time = time.time()
+        vocab = {}
+        postings = []
+        doc_lens = np.zeros(len(texts), dtype=np.float32)
+        
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lens[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                term_id = vocab.setdefault(term, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc, tf))
+        
+        avgdl = float(doc_lens.mean()) if len(texts) else 0.0
+        n_docs = len(texts)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in postings], out=offsets[1:])
+        docs = np.empty(offsets[-1], dtype=np.int32)
+        impacts = np.empty(offsets[-1], dtype=np.float32)
+        
+        for term_id, plist in enumerate(postings):
+            start, end = offsets[term_id], offsets[term_id + 1]
+            plist_docs = np.fromiter((d for d, _ in plist), dtype=np.int32, count=len(plist))
+            tf = np.fromiter((t for _, t in plist), dtype=np.float32, count=len(plist))
+            idf = np.log(1.0 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            norm = k1 * (1.0 - b + b * doc_lens[plist_docs] / max(avgdl, 1e-9))
+            docs[start:end] = plist_docs
+            impacts[start:end] = idf * tf * (k1 + 1.0) / (tf + norm)
+        
+        type_names = list(dict.fromkeys(doc_types))
+        codes = {name: code for code, name in enumerate(type_names)}
+        # int32 类别编码，类别数不受限（int8 超过127种时会溢出回绕）
+        type_array = np.array([codes[t] for t in doc_types], dtype=np.int32)
+        
+        logger.info(f"BM25索引构建完成: {n_docs} 条, 词表 {len(vocab)}, 耗时 {time.time()-start_time:.2f}s")
+        row_keys = np.asarray(row_keys if row_keys is not None else [], dtype=np.uint64)
+        return cls(vocab, offsets, docs, impacts, type_array, type_names, signature, row_keys)
+    
+    def save(self, path):
+        """保存到版本化的索引文件（原子替换）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        header = {
+            'format_version': FORMAT_VERSION,
+            'type_names': self.type_names,
+            'signature': self.signature
+        }
+        terms = np.array(sorted(self.vocab, key=self.vocab.get))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                header=np.array(json.dumps(header, ensure_ascii=False)),
+                terms=terms,
+                offsets=self.offsets,
+                docs=self.docs,
+                impacts=self.impacts,
+                doc_types=self.doc_types,
+                row_keys=self.row_keys
+            )
+        os.replace(tmp_path, path)
+        logger.info(f"BM25索引已保存: {path}")
+    
+    @classmethod
+    def load(cls, path):
+        """加载索引，不存在或版本不兼容时返回None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            header = json.loads(str(data['header']))
+            if header.get('format_version') != FORMAT_VERSION:
+                logger.warning(f"BM25索引版本不兼容: {header.get('format_version')}，将重新构建")
+                return None
+            vocab = {term: term_id for term_id, term in enumerate(data['terms'].tolist())}
+            return cls(
+                vocab, data['offsets'], data['docs'], data['impacts'], data['doc_types'],
+                header['type_names'], header.get('signature', ''), data['row_keys']
+            )
+    
+    def search(self, query, top_k=5, categories=None):
+        """检索，返回(分数, 文档号)，按分数降序；categories 为类别名集合时只保留这些类别"""
+        term_counts = Counter(tokenize(query))
+        doc_lists = []
+        impact_lists = []
+        for term, qtf in term_counts.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            doc_lists.append(self.docs[start:end])
+            impact_lists.append(self.impacts[start:end] * qtf)
+        
+        if not doc_lists:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32)
+        
+        # 只在命中的文档上累加各词的BM25权重，耗时与倒排表长度相关而与语料规模无关
+        candidates, inverse = np.unique(np.concatenate(doc_lists), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(impact_lists)).astype(np.float32)
+        
+        if categories is not None:
+            codes = [self.type_codes[c] for c in categories if c in self.type_codes]
+            keep = np.isin(self.doc_types[candidates], codes)
+            candidates, scores = candidates[keep], scores[keep]
+            if candidates.shape[0] == 0:
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32)
+        
+        # 部分选择取top-k，避免对全部候选排序
+        k = min(top_k, candidates.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return scores[top], candidates[top]
+
 
 class MaterialSearchEngine:
-    def __init__(self):
-        self.vectorizer_path = os.path.join(os.path.dirname(__file__), 'model/tfidf_vectorizer.pkl')
-        self.vectorizer = self._load_vectorizer()
-        self.datasets = {}
-        self.indexed_data = {}
-        
-    def _load_vectorizer(self):
-        """加载预训练的TF-IDF向量化器"""
-        if os.path.exists(self.vectorizer_path):
-            return joblib.load(self.vectorizer_path)
-        else:
-            return TfidfVectorizer(analyzer='word', ngram_range=(1, 2), min_df=0.01)
+    """基于jieba分词与BM25的词法检索引擎（不依赖Transformer）"""
+    def __init__(self, model_dir=None, data_dir=None):
+        if model_dir is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            model_dir = os.path.join(base_dir, 'model')
+        self.index_path = os.path.join(model_dir, INDEX_FILE)
+        self.data_dir = data_dir
+        self.index = None
+        self.indexed_data = []
+        # 服务端与GUI线程可能同时触发首次加载，只加载一次
+        self._load_lock = threading.Lock()
     
     def load_data(self):
-        """加载并预处理数据"""
-        from .date_loader import load_dataset
-        self.datasets = load_dataset()
+        """流式加载素材，磁盘索引与语料一致时直接复用，否则重新构建
         
-        # 合并所有文本用于训练TF-IDF
+        每条素材只保留检索结果与过滤所需的字段（RESULT_FIELDS）。
+        """
+        with self._load_lock:
+            self._load()
+    
+    def _load(self):
+        from .date_loader import iter_dataset
         all_texts = []
-        for category, items in self.datasets.items():
-            for item in items:
-                text = f"{item['content']} {' '.join(item['keywords'])} {item.get('theme', '')}"
-                all_texts.append(text)
-                self.indexed_data[len(all_texts)-1] = (category, item)
-        
-        # 训练或加载向量器
-        if not os.path.exists(self.vectorizer_path):
-            self.vectorizer.fit(all_texts)
-            joblib.dump(self.vectorizer, self.vectorizer_path)
+        doc_types = []
+        indexed_data = []
+        for category, item in iter_dataset(data_dir=self.data_dir):
+            all_texts.append(f"{item['content']} {' '.join(item['keywords'])} {item.get('theme', '')}")
+            doc_types.append(category)
+            indexed_data.append((category, {field: item[field] for field in RESULT_FIELDS if field in item}))
         
-        self.tfidf_matrix = self.vectorizer.transform(all_texts)
+        signature = corpus_signature(all_texts, doc_types)
+        index = BM25Index.load(self.index_path)
+        if index is None or index.signature != signature:
+            row_keys = [row_key(category, item['content']) for category, item in indexed_data]
+            index = BM25Index.build(all_texts, doc_types, signature=signature, row_keys=row_keys)
+            index.save(self.index_path)
+        else:
+            logger.info(f"加载BM25索引: {index.size} 条")
+        # 索引最后赋值: 其他线程以 index 非空判断加载已完成
+        self.indexed_data = indexed_data
+        self.index = index
     
     def search(self, query, top_k=5, category="all"):
-        """执行素材检索"""
-        query_vec = self.vectorizer.transform([query])
-        cos_similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
+        """执行素材检索（未调用 load_data 时先加载，并发的首次检索只加载一次）"""
+        if self.index is None:
+            with self._load_lock:
+                if self.index is None:
+                    self._load()
+        categories = None
+        if category is not None and category != "all":
+            categories = {category} if isinstance(category, str) else set(category)
         
-        # 获取最相关结果
-        related_indices = cos_similarities.argsort()[-top_k:][::-1]
+        top_scores, top_docs = self.index.search(query, top_k=top_k, categories=categories)
         
         results = []
-        for idx in related_indices:
+        for score, idx in zip(top_scores.tolist(), top_docs.tolist()):
             cat, item = self.indexed_data[idx]
-            if category != "all" and cat != category:
-                continue
             results.append({
                 'type': cat.capitalize(),
                 'content': item['content'],
                 'source': item.get('source', ''),
                 'tags': item['keywords'],
-                'score': round(cos_similarities[idx], 3)
+                'score': round(score, 3)
             })
         
-        return results
\ No newline at end of file
+        return results
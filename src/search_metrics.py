@@ -0,0 +1,120 @@
+import time
+import threading
+from bisect import bisect_left
+
+# 检索各阶段（秒）；total 为一次 search/search_batch 调用的总耗时
+# filter_resolve 为解析主题/关键词/来源过滤得到行掩码，filter_scan 为在分数上应用类别与行掩码
+STAGES = ("tokenize", "encode", "filter_resolve", "matmul", "filter_scan", "topk", "rescore", "ann", "assemble", "total")
+COUNTERS = ("queries", "batches", "cache_hits", "term_hits", "encoded", "empty_results")
+# Prometheus 直方图桶上界（秒）
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class RollingHistogram:
+    """累计分桶计数（供Prometheus导出）+ 最近 window 个样本的环形缓冲（求分位数）
+    
+    observe 只做一次二分查找和几次赋值，分位数在读取统计时才排序计算。
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS, window=1024):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._recent = [0.0] * window
+    
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self._recent[self.count % len(self._recent)] = value
+        self.count += 1
+        self.sum += value
+    
+    def summary(self):
+        """最近窗口内的分位数（毫秒）及累计均值"""
+        if self.count == 0:
+            return {'count': 0}
+        recent = sorted(self._recent[:min(self.count, len(self._recent))])
+        
+        def quantile(q):
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 3)
+        
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count * 1000, 3),
+            'p50_ms': quantile(0.5),
+            'p90_ms': quantile(0.9),
+            'p99_ms': quantile(0.99),
+            'max_ms': round(recent[-1] * 1000, 3)
+        }
+
+
+class SearchMetrics:
+    """检索路径的分阶段计时与计数
+    
+    用法: start = metrics.clock(); ...; start = metrics.lap('encode', start)
+    enabled=False 时 clock/lap/increment 均直接返回，不读取时钟。
+    sync 为可选的同步函数（如 torch.cuda.synchronize），用于让异步设备上的
+    阶段耗时落在正确的阶段；只在启用时调用。
+    """
+    def __init__(self, enabled=True, window=1024, sync=None):
+        self.enabled = enabled
+        self.window = window
+        self.sync = sync
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.stages = {name: RollingHistogram(window=self.window) for name in STAGES}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.started = time.time()
+    
+    def clock(self):
+        return time.perf_counter() if self.enabled else 0.0
+    
+    def lap(self, stage, start):
+        """记录 start 至今的耗时并返回当前时间，作为下一阶段的起点"""
+        if not self.enabled:
+            return 0.0
+        if self.sync is not None:
+            self.sync()
+        now = time.perf_counter()
+        with self._lock:
+            self.stages[stage].observe(now - start)
+        return now
+    
+    def increment(self, name, value=1):
+        if self.enabled and value:
+            with self._lock:
+                self.counters[name] += value
+    
+    def stats(self):
+        """计数与各阶段耗时统计（只包含有样本的阶段）"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'uptime_s': round(time.time() - self.started, 1),
+                'counters': dict(self.counters),
+                'stages': {name: hist.summary() for name, hist in self.stages.items() if hist.count}
+            }
+    
+    def prometheus(self, prefix="composition_search"):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        with self._lock:
+            for name in COUNTERS:
+                metric = f"{prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {self.counters[name]}")
+            
+            metric = f"{prefix}_stage_seconds"
+            lines.append(f"# HELP {metric} 检索各阶段耗时")
+            lines.append(f"# TYPE {metric} histogram")
+            for stage, hist in self.stages.items():
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {hist.sum:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
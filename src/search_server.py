@@ -0,0 +1,238 @@
+import math
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("SearchServer")
+
+MAX_TOP_K = 100
+CATEGORIES = ("all", "quotes", "examples", "poems")
+
+
+class BatchingSearchWorker(threading.Thread):
+    """专用检索线程: 将并发请求在短时间窗口内合并，一次批量编码
+    
+    第一个请求到达后最多再等待 max_wait_ms 毫秒或凑满 max_batch_size 条，
+    然后按 (top_k, 类别, 阈值, 过滤条件) 分组调用 search_batch。
+    所有模型调用都在本线程中执行，检索引擎无需额外加锁。
+    """
+    def __init__(self, engine, max_batch_size=32, max_wait_ms=5.0):
+        super().__init__(daemon=True, name="SearchWorker")
+        self.engine = engine
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._requests = queue.Queue()
+        self._stopped = threading.Event()
+        self.batches = 0
+        self.requests = 0
+    
+    def submit(self, query, top_k=5, category="all", similarity_threshold=0.0, filters=None):
+        """提交一条检索请求，返回 concurrent.futures.Future"""
+        future = Future()
+        self._requests.put((future, query, (top_k, category, similarity_threshold, filters)))
+        return future
+    
+    def stop(self):
+        self._stopped.set()
+        self._requests.put(None)
+    
+    def _collect_batch(self):
+        """阻塞等待第一个请求，再在时间窗口内收集后续请求"""
+        first = self._requests.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._stopped.set()
+                break
+            batch.append(request)
+        return batch
+    
+    def _run_batch(self, batch):
+        groups = {}
+        for position, request in enumerate(batch):
+            top_k, category, threshold, filters = request[2]
+            key = (top_k, category, threshold, repr(sorted(filters.items())) if filters else None)
+            groups.setdefault(key, []).append(position)
+        
+        # 参数不同的请求分组打分，但整批查询只编码一次，各组取对应的行
+        embeddings = None
+        if len(groups) > 1 and self.engine.embeddings is not None:
+            try:
+                embeddings = self.engine.encode_queries([request[1] for request in batch])
+            except Exception:
+                logger.exception("批量编码失败，将按组重试")
+        
+        for positions in groups.values():
+            requests = [batch[position] for position in positions]
+            top_k, category, threshold, filters = requests[0][2]
+            try:
+                results = self.engine.search_batch(
+                    [request[1] for request in requests], top_k=top_k, category=category,
+                    similarity_threshold=threshold, filters=filters,
+                    query_embeddings=None if embeddings is None else embeddings[positions]
+                )
+            except Exception as e:
+                for future, _, _ in requests:
+                    future.set_exception(e)
+                continue
+            for (future, _, _), result in zip(requests, results):
+                future.set_result(result)
+    
+    def run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                break
+            # 已被取消的请求（客户端断开）不再参与计算
+            batch = [request for request in batch if request[0].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            self._run_batch(batch)
+        
+        # 退出前让尚未处理的请求失败，避免调用方一直等待
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None and request[0].set_running_or_notify_cancel():
+                request[0].set_exception(RuntimeError("检索服务已停止"))
+    
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'queue_depth': self._requests.qsize()
+        }
+
+
+def _parse_request(params):
+    """校验请求参数，非法时抛出 ValueError"""
+    query = str(params.get('query') or params.get('q') or '').strip()
+    if not query:
+        raise ValueError("缺少查询内容 query")
+    try:
+        top_k = int(params.get('top_k', 5))
+    except (TypeError, ValueError):
+        raise ValueError("top_k 须为整数")
+    if not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f"top_k 须在 1-{MAX_TOP_K} 之间")
+    category = params.get('category', 'all')
+    if not isinstance(category, str) or category not in CATEGORIES:
+        raise ValueError(f"不支持的类型: {category}，可选: {', '.join(CATEGORIES)}")
+    try:
+        threshold = float(params.get('similarity_threshold', 0.0))
+    except (TypeError, ValueError):
+        raise ValueError("similarity_threshold 须为数字")
+    if not math.isfinite(threshold):
+        raise ValueError("similarity_threshold 须为有限数值")
+    filters = params.get('filters')
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError("filters 须为JSON对象")
+    for field, values in (filters or {}).items():
+        # 字段名由引擎校验；这里只保证取值类型，避免非法取值在引擎内部才出错（返回500）
+        if field == 'op':
+            if not isinstance(values, str):
+                raise ValueError("filters.op 须为字符串 and/or")
+        elif not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"filters.{field} 须为字符串列表")
+    return query, top_k, category, threshold, filters
+
+
+def create_app(engine, max_batch_size=32, max_wait_ms=5.0):
+    """创建 aiohttp 应用: POST /search（JSON）、GET /search?q=...、GET /health、GET /metrics"""
+    from aiohttp import web
+    
+    worker = BatchingSearchWorker(engine, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    
+    async def search(request):
+        start_time = time.perf_counter()
+        try:
+            params = await request.json() if request.method == 'POST' else dict(request.query)
+            if not isinstance(params, dict):
+                raise ValueError("请求体须为JSON对象")
+            query, top_k, category, threshold, filters = _parse_request(params)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        
+        future = worker.submit(query, top_k, category, threshold, filters)
+        try:
+            results = await asyncio.wrap_future(future)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            logger.exception("检索失败")
+            return web.json_response({'error': f"检索失败: {str(e)}"}, status=500)
+        
+        return web.json_response({
+            'query': query,
+            'results': results,
+            'elapsed_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        })
+    
+    async def health(request):
+        return web.json_response({
+            'status': 'ok',
+            'rows': len(engine.metadata),
+            'precision': engine.precision,
+            'worker': worker.stats(),
+            'search': engine.stats()
+        })
+    
+    async def metrics(request):
+        # Prometheus 文本格式，批处理统计以 gauge/counter 附加在检索统计之后
+        stats = worker.stats()
+        lines = [
+            engine.prometheus_metrics().rstrip("\n"),
+            "# TYPE composition_search_worker_batches_total counter",
+            f"composition_search_worker_batches_total {stats['batches']}",
+            "# TYPE composition_search_worker_queue_depth gauge",
+            f"composition_search_worker_queue_depth {stats['queue_depth']}",
+        ]
+        return web.Response(text="\n".join(lines) + "\n",
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+    
+    async def on_startup(app):
+        worker.start()
+    
+    async def on_cleanup(app):
+        worker.stop()
+        await asyncio.get_running_loop().run_in_executor(None, worker.join, 5.0)
+    
+    app = web.Application()
+    app['worker'] = worker
+    app.router.add_post('/search', search)
+    app.router.add_get('/search', search)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def run_server(engine, host="127.0.0.1", port=8000, max_batch_size=32, max_wait_ms=5.0):
+    """启动HTTP检索服务（阻塞直到退出）"""
+    from aiohttp import web
+    
+    app = create_app(engine, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    logger.info(f"检索服务已启动: http://{host}:{port} (批大小上限 {max_batch_size}, 等待 {max_wait_ms}ms)")
+    web.run_app(app, host=host, port=port, print=None)
@@ -1,173 +1,802 @@
 import os
-import json
-import torch
 import numpy as np
-from sentence_transformers import util
 from .model_loader import ModelLoader
+from .query_cache import QueryEmbeddingCache, normalize_query
+from .embedding_store import (
+    load_embedding_store, load_compact_store, score_compact, index_dir, STORE_FILE, LEGACY_FILE
+)
+from .ann_index import IVFIndex, ANN_MIN_ROWS
+from .metadata_store import MetadataStore, load_metadata, METADATA_FILE
+from .index_builder import load_term_dictionary
+from .snapshot import Snapshot, snapshot_path
+from .search_metrics import SearchMetrics
+from .array_ops import NumpyOps, TorchOps
 import logging
+import threading
 import time
+from itertools import islice
+from collections import OrderedDict
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("SemanticSearch")
 
+# filters 参数支持的字段 → 元数据字段
+FILTER_FIELDS = {'themes': 'theme', 'keywords': 'keywords', 'sources': 'source'}
+# 后台索引构建失败后的重试间隔（秒），每次失败翻倍，不超过上限
+INDEX_BUILD_RETRY_S = 60
+INDEX_BUILD_RETRY_MAX_S = 3600
+
 class SemanticSearchEngine:
-    def __init__(self, model_dir="model", use_fine_tuned=True, device=None):
+    def __init__(self, model_dir="model", use_fine_tuned=True, device=None, cache_size=1024,
+                 index_precision=None, rescore_factor=4, ann_nprobe=8, ann_min_rows=ANN_MIN_ROWS,
+                 precision="fp32", backend="torch", metrics=True):
         self.model_dir = model_dir
         self.use_fine_tuned = use_fine_tuned
         self.device = device
+        self.precision = precision
+        self.backend = backend
+        
+        # 嵌入存储精度（None 表示使用索引中的紧凑副本，若存在）
+        # 紧凑精度下先取 top_k*rescore_factor 个候选再用float32精确重排，0 表示不重排
+        self.index_precision = index_precision
+        self.rescore_factor = rescore_factor
+        self.emb_scale = None
+        self.exact_embeddings = None
+        
+        # 近似最近邻索引: 语料少于 ann_min_rows 时使用精确搜索
+        self.ann_nprobe = ann_nprobe
+        self.ann_min_rows = ann_min_rows
+        self.ann_index = None
+        
+        # 无预计算嵌入时在后台构建的索引（连续失败次数用于退避重试）
+        self.index_build = None
+        self.index_build_failures = 0
+        self.index_build_retry_at = None
+        # 构建结果在查询线程中应用（重新加载索引或记录失败），每次构建只应用一次
+        self._index_build_lock = threading.Lock()
+        self._applied_build = None
+        
+        # 查询嵌入缓存（cache_size=0 表示禁用）
+        self.query_cache = QueryEmbeddingCache(max_size=cache_size)
+        
+        # 各加载阶段耗时（秒），供 --startup-profile 报告
+        self.load_timings = {}
+        
+        # backend="snapshot": 编码器与索引都从 model/snapshot.bin 内存映射加载
+        self.snapshot = None
         
         # 加载模型
+        start_time = time.perf_counter()
         self.model_loader = ModelLoader(model_dir)
-        self.model, self.device = self.model_loader.load_model(
-            use_fine_tuned=use_fine_tuned, 
-            device=device
-        )
-        logger.info(f"模型加载完成! 设备: {self.device}")
+        if backend == "snapshot":
+            path = snapshot_path(model_dir)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"未找到快照文件，请先运行 python -m src.snapshot 生成: {path}")
+            self.snapshot = Snapshot(path)
+            self.model, self.device = self.model_loader.load_snapshot_model(self.snapshot), "cpu"
+        else:
+            self.model, self.device = self.model_loader.load_model(
+                use_fine_tuned=use_fine_tuned, 
+                device=device,
+                precision=precision,
+                backend=backend
+            )
+        self.precision = self.model_loader.precision
+        logger.info(f"模型加载完成! 设备: {self.device}, 推理精度: {self.precision}, 后端: {self.backend}")
+        self.load_timings['model'] = time.perf_counter() - start_time
+        
+        # 打分运算: torch 后端使用张量（可在GPU上），onnx/snapshot 后端只用 numpy，不导入torch
+        self.ops = TorchOps(self.device) if backend == "torch" else NumpyOps()
+        
+        # 分阶段计时与计数（metrics=False 或运行时置 self.metrics.enabled=False 关闭）
+        # CUDA 上为使耗时落在正确阶段，计时前同步设备
+        self.metrics = SearchMetrics(enabled=metrics, sync=self.ops.sync)
         
         # 加载预计算嵌入
+        start_time = time.perf_counter()
         self.embeddings = self._load_embeddings()
         
         # 加载元数据
         self.metadata = self._load_metadata()
         
-        # 预计算嵌入范数以加速相似度计算
+        # 嵌入已按行L2归一化，余弦相似度即为点积
         if self.embeddings is not None:
-            self.emb_norms = torch.norm(self.embeddings, dim=1, keepdim=True)
             logger.info(f"嵌入向量加载完成: {self.embeddings.shape[0]} 条, 维度: {self.embeddings.shape[1]}")
         else:
             logger.warning("未找到预计算嵌入，将使用实时编码")
+        
+        # 构建类别索引（类型列 + 连续行区间）及主题/关键词/来源过滤索引
+        self._build_category_index(self.embeddings)
+        self._build_filter_index()
+        
+        # 大规模语料加载IVF索引
+        self._load_ann_index()
+        
+        # 关键词/主题嵌入词典，单词查询直接查表
+        self.term_hits = 0
+        self._load_term_dictionary()
+        self.load_timings['index'] = time.perf_counter() - start_time
     
-    def _load_embeddings(self):
-        """加载嵌入向量，自动处理设备"""
-        embeddings_path = os.path.join(self.model_dir, "embeddings.pt")
-        if not os.path.exists(embeddings_path):
-            logger.warning(f"嵌入文件不存在: {embeddings_path}")
-            return None
+    def warm_up(self, text="作文素材"):
+        """预热: 执行一次编码与全量打分，触发模型的延迟初始化并将嵌入页载入内存
         
+        不经过查询缓存，返回耗时（秒）。
+        """
+        start_time = time.perf_counter()
+        query_embeddings = self.ops.float32(self._model_encode([text]))
+        if self.embeddings is not None:
+            self._category_topk(self.ops.to(query_embeddings, self.embeddings), None, 1)
+        self.load_timings['warm_up'] = time.perf_counter() - start_time
+        # 预热样本不计入检索统计
+        self.metrics.reset()
+        logger.info(f"预热完成，耗时 {self.load_timings['warm_up']:.2f}s")
+        return self.load_timings['warm_up']
+    
+    def _load_term_dictionary(self):
+        """加载索引构建时预编码的关键词/主题嵌入"""
+        if self.snapshot is not None:
+            dictionary = self.snapshot.term_dictionary()
+        else:
+            dictionary = load_term_dictionary(self.index_dir)
+        if dictionary is None:
+            self.term_dictionary = ({}, None)
+            return
+        terms, _, embeddings, fingerprint = dictionary
+        # 查表须与编码查询等价: 词典由其他模型或精度（如fp32构建、bf16/int8/ONNX检索）编码时不使用
+        if fingerprint != self.model_loader.fingerprint:
+            logger.info(f"关键词词典的模型指纹({fingerprint})与当前编码器({self.model_loader.fingerprint})不一致，单词查询改用编码器")
+            self.term_dictionary = ({}, None)
+            return
+        # 词表与嵌入整体替换，避免并发查询读到不一致的组合
+        self.term_dictionary = (
+            {term: row for row, term in enumerate(terms)},
+            self.ops.to_device(self.ops.asarray(embeddings))
+        )
+        logger.info(f"关键词词典加载完成: {len(terms)} 个")
+    
+    def _load_embeddings(self):
+        """加载归一化嵌入向量: 优先内存映射 embeddings.npy，回退到 embeddings.pt"""
         # 测量加载时间
         start_time = time.time()
         
-        # 加载并转换设备
-        embeddings = torch.load(embeddings_path, map_location=self.device)
+        # 索引目录只解析一次，嵌入、元数据、IVF索引与关键词词典都取自同一索引代
+        self.index_dir = index_dir(self.model_dir)
+        store_path = os.path.join(self.index_dir, STORE_FILE)
+        legacy_path = os.path.join(self.model_dir, LEGACY_FILE)
+        compact = None
+        if self.snapshot is not None:
+            # 快照中的各段都是同一内存映射上的视图，无需解析
+            embeddings = self.snapshot.array("index/embeddings")
+            source = self.snapshot.path
+            if self.index_precision != "float32":
+                compact = self.snapshot.compact()
+                if compact is not None and self.index_precision not in (None, compact[2]):
+                    logger.warning(f"快照中没有 {self.index_precision} 精度的紧凑副本，使用 {compact[2]}")
+        elif os.path.exists(store_path):
+            # 内存映射打开，启动时无需读取整个矩阵
+            embeddings = load_embedding_store(self.index_dir)
+            source = store_path
+            if self.index_precision != "float32":
+                compact = load_compact_store(self.index_dir)
+                if compact is not None and self.index_precision not in (None, compact[2]):
+                    logger.warning(f"索引中没有 {self.index_precision} 精度的紧凑副本，使用 {compact[2]}")
+        elif os.path.exists(legacy_path):
+            logger.warning(f"使用旧版嵌入文件 {legacy_path}，可运行 python -m src.embedding_store 转换以加快启动")
+            # 旧版 .pt 文件只能用 torch 读取
+            import torch
+            embeddings = torch.load(legacy_path, map_location="cpu").float().numpy()
+            embeddings = np.asarray(NumpyOps().normalize(embeddings), dtype=np.float32)
+            source = legacy_path
+        else:
+            logger.warning(f"嵌入文件不存在: {store_path}")
+            return None
+        
+        # float32 矩阵（留在CPU内存映射上）保留为精确重排的数据源
+        ops = self.ops
+        embeddings = ops.asarray(embeddings)
+        self.exact_embeddings = embeddings
+        self.index_precision = "float32"
+        if compact is not None:
+            data, scale, self.index_precision = compact
+            embeddings, self.emb_scale = ops.asarray(data), None if scale is None else ops.asarray(scale)
+            source = f"{source} ({self.index_precision})"
         
         # 确保嵌入向量在正确设备上
-        if self.device.startswith("cuda") and embeddings.device.type == "cpu":
-            embeddings = embeddings.to(self.device)
+        if self.device.startswith("cuda"):
+            embeddings = ops.to_device(embeddings)
+            if self.emb_scale is not None:
+                self.emb_scale = ops.to_device(self.emb_scale)
         
-        logger.info(f"嵌入加载完成: 耗时 {time.time()-start_time:.2f}s")
+        logger.info(f"嵌入加载完成: {source}, 耗时 {time.time()-start_time:.2f}s")
         return embeddings
     
     def _load_metadata(self):
-        """加载元数据"""
-        metadata_path = os.path.join(self.model_dir, "metadata.json")
-        if not os.path.exists(metadata_path):
-            logger.warning(f"元数据文件不存在: {metadata_path}")
-            return []
+        """加载元数据（紧凑二进制格式，按需还原单行）"""
+        if self.snapshot is not None:
+            return MetadataStore(self.snapshot.array("index/metadata"))
+        metadata = load_metadata(self.index_dir)
+        if metadata is None:
+            logger.warning(f"元数据文件不存在: {os.path.join(self.index_dir, METADATA_FILE)}")
+            return MetadataStore.from_records([])
+        logger.info(f"加载元数据: {len(metadata)} 条")
+        return metadata
+    
+    def _build_category_index(self, embeddings):
+        """构建类别索引: 类型编码列直接取自元数据，并记录每个类别的连续行区间"""
+        codes = self.metadata.type_codes.astype(np.int64)
+        
+        # 类型编码列，用于任意类别组合的掩码过滤
+        self.category_codes = {t: code for code, t in enumerate(self.metadata.type_names)}
+        self.type_codes = self.ops.to(self.ops.asarray(codes), embeddings)
         
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-            logger.info(f"加载元数据: {len(metadata)} 条")
-            return metadata
+        # 训练器按类别顺序写入素材，因此每个类别通常占据一段连续行
+        ranges = {}
+        fragmented = set()
+        for t, code in self.category_codes.items():
+            rows = np.flatnonzero(codes == code)
+            if len(rows) == 0:
+                continue
+            start, end = int(rows[0]), int(rows[-1]) + 1
+            if end - start == len(rows):
+                ranges[t] = (start, end)
+            else:
+                fragmented.add(t)
+        self.category_ranges = ranges
+        
+        if embeddings is not None and len(codes) != embeddings.shape[0]:
+            # 行错位会返回其他素材的文本，宁可拒绝加载
+            raise ValueError(f"元数据条数({len(codes)})与嵌入条数({embeddings.shape[0]})不一致，请重新构建索引")
+        if fragmented:
+            logger.info(f"以下类别非连续存储，将使用掩码过滤: {sorted(fragmented)}")
+        logger.info(f"类别索引构建完成: {dict((t, end - start) for t, (start, end) in self.category_ranges.items())}")
     
-    def search(self, query, top_k=5, category="all", similarity_threshold=0.3):
-        """语义搜索素材 - 使用预计算嵌入"""
-        start_time = time.time()
+    def _build_filter_index(self):
+        """构建主题/关键词/来源 → 有序行号数组的倒排索引（直接在元数据的编号列上分组）"""
+        self.filter_index = {
+            field: self.metadata.rows_by_value(meta_field) for field, meta_field in FILTER_FIELDS.items()
+        }
+        self._filter_masks = OrderedDict()
+    
+    def _resolve_filters(self, filters, max_cached=64):
+        """将 filters 转换为行掩码，返回None表示不过滤
         
-        if self.embeddings is None:
-            # 如果没有预计算嵌入，回退到实时编码
-            return self._realtime_search(query, top_k, category, similarity_threshold)
+        filters 形如 {'themes': [...], 'keywords': [...], 'sources': [...], 'op': 'and'}。
+        同一字段内的多个取值为"或"，不同字段之间按 op（and/or）组合。
+        """
+        if not filters:
+            return None
+        unknown = set(filters) - set(FILTER_FIELDS) - {'op'}
+        if unknown:
+            raise ValueError(f"不支持的过滤字段: {sorted(unknown)}，可选: {sorted(FILTER_FIELDS)}")
+        op = filters.get('op', 'and').lower()
+        if op not in ('and', 'or'):
+            raise ValueError(f"不支持的过滤组合方式: {op}")
         
-        # 编码查询
-        query_embedding = self.model.encode(
-            query, 
-            convert_to_tensor=True, 
-            device=self.device,
-            show_progress_bar=False
-        )
+        conditions = []
+        for field in FILTER_FIELDS:
+            values = filters.get(field)
+            if values:
+                conditions.append((field, tuple(sorted({values} if isinstance(values, str) else set(values)))))
+        if not conditions:
+            return None
         
-        # 确保查询嵌入在正确设备上
-        if self.embeddings.device != query_embedding.device:
-            query_embedding = query_embedding.to(self.embeddings.device)
+        key = (op, tuple(conditions))
+        if key in self._filter_masks:
+            self._filter_masks.move_to_end(key)
+            return self._filter_masks[key]
         
-        # 使用优化的余弦相似度计算
-        query_norm = torch.norm(query_embedding, keepdim=True)
-        dot_products = torch.mm(query_embedding.unsqueeze(0), self.embeddings.t()).squeeze(0)
-        cos_scores = dot_products / (query_norm * self.emb_norms.squeeze(1))
+        combined = None
+        for field, values in conditions:
+            field_mask = np.zeros(len(self.metadata), dtype=bool)
+            for value in values:
+                rows = self.filter_index[field].get(value)
+                if rows is not None:
+                    field_mask[rows] = True
+            if combined is None:
+                combined = field_mask
+            elif op == 'and':
+                combined &= field_mask
+            else:
+                combined |= field_mask
         
-        # 获取最相关结果
-        top_scores, top_indices = torch.topk(cos_scores, k=min(top_k * 3, len(cos_scores)))
+        mask = self.ops.to(self.ops.asarray(combined), self.type_codes)
+        self._filter_masks[key] = mask
+        while len(self._filter_masks) > max_cached:
+            self._filter_masks.popitem(last=False)
+        return mask
+    
+    def meta_matches(self, meta, filters):
+        """逐条判断元数据是否满足 filters（用于没有行索引的实时检索及混合检索的词法候选）"""
+        op = filters.get('op', 'and').lower()
+        matches = []
+        for field, meta_field in FILTER_FIELDS.items():
+            values = filters.get(field)
+            if not values:
+                continue
+            values = {values} if isinstance(values, str) else set(values)
+            meta_values = meta.get(meta_field) or []
+            meta_values = [meta_values] if isinstance(meta_values, str) else meta_values
+            matches.append(any(v in values for v in meta_values))
+        if not matches:
+            return True
+        return all(matches) if op == 'and' else any(matches)
+    
+    def _load_ann_index(self):
+        """加载近似最近邻索引（仅当语料规模超过阈值且索引与嵌入一致时启用）"""
+        if self.embeddings is None or self.embeddings.shape[0] < self.ann_min_rows:
+            return
+        index = self.snapshot.ann_index() if self.snapshot is not None else IVFIndex.load(self.index_dir)
+        if index is None:
+            logger.info("未找到IVF索引，使用精确搜索（可运行 python -m src.ann_index 构建）")
+            return
+        if index.rows != self.embeddings.shape[0]:
+            logger.warning(f"IVF索引条数({index.rows})与嵌入条数不一致，已忽略，请重新构建")
+            return
+        # ann_index 最后赋值: 并发查询以其非空判断IVF检索所需的数据已就绪
+        self._ann_matrix = self.ops.numpy(self.exact_embeddings)
+        self._ann_masks = {}
+        self.ann_index = index
+        logger.info(f"IVF索引加载完成: {index.n_lists} 个簇, nprobe={self.ann_nprobe}")
+    
+    def _ann_topk(self, query_embeddings, categories, top_k, row_mask=None):
+        """使用IVF索引检索，类别与过滤条件作为候选行预过滤"""
+        if row_mask is not None:
+            row_mask = self.ops.numpy(row_mask)
+        if categories is not None:
+            key = frozenset(categories)
+            if key not in self._ann_masks:
+                codes = [self.category_codes[c] for c in categories if c in self.category_codes]
+                self._ann_masks[key] = np.isin(self.ops.numpy(self.type_codes), codes)
+            row_mask = self._ann_masks[key] if row_mask is None else row_mask & self._ann_masks[key]
+        
+        queries = self.ops.numpy(self.ops.float32(query_embeddings))
+        top_scores, top_indices = [], []
+        for query in queries:
+            scores, rows = self.ann_index.search(
+                self._ann_matrix, query, top_k, nprobe=self.ann_nprobe, row_mask=row_mask
+            )
+            top_scores.append(scores)
+            top_indices.append(rows)
+        return top_scores, top_indices
+    
+    def _resolve_categories(self, category):
+        """将类别参数规范化为类别集合，返回None表示全部类别"""
+        if category is None:
+            return None
+        if isinstance(category, str):
+            categories = {category}
+        else:
+            categories = set(category)
+        if not categories or "all" in categories:
+            return None
+        return categories
+    
+    def _cosine_scores(self, query_embeddings, start=0, end=None):
+        """计算Q个归一化查询与[start, end)行嵌入的余弦相似度，返回Q×N矩阵"""
+        embeddings = self.embeddings[start:end]
+        if self.index_precision == "float32":
+            return self.ops.mm(query_embeddings, embeddings)
+        # 紧凑存储: 直接在float16/int8数据上分块打分
+        scale = self.emb_scale[start:end] if self.emb_scale is not None else None
+        return score_compact(query_embeddings, embeddings, scale)
+    
+    def _category_topk(self, query_embeddings, categories, top_k, row_mask=None):
+        """在类别及行掩码过滤之后批量取top-k，返回每个查询的(分数, 全局行号)"""
+        query_embeddings = self.ops.normalize(query_embeddings)
+        
+        # 大规模语料: IVF近似检索，直接在float32嵌入上打分，无需重排
+        if self.ann_index is not None:
+            start = self.metrics.clock()
+            result = self._ann_topk(query_embeddings, categories, top_k, row_mask)
+            self.metrics.lap('ann', start)
+            return result
+        
+        # 紧凑存储时先多取候选，再用float32精确重排
+        rescore = self.index_precision != "float32" and self.rescore_factor > 0
+        k = top_k * self.rescore_factor if rescore else top_k
+        top_scores, top_indices = self._filtered_topk(query_embeddings, categories, k, row_mask)
+        
+        if rescore and top_indices.shape[1] > 0:
+            start = self.metrics.clock()
+            top_scores, top_indices = self._exact_rescore(query_embeddings, top_indices, top_k)
+            self.metrics.lap('rescore', start)
+        return top_scores, top_indices
+    
+    def _filtered_topk(self, query_embeddings, categories, top_k, row_mask=None):
+        """按类别过滤后取top-k: 单一连续类别只打分子矩阵，其余情况使用类型掩码
+        
+        row_mask（主题/关键词/来源过滤）在top-k之前作用于分数，保证结果数量。
+        """
+        metrics = self.metrics
+        clock = metrics.clock()
+        
+        # 单一类别且连续存储: 只对该类别的子矩阵打分
+        if categories is not None and len(categories) == 1:
+            name = next(iter(categories))
+            if name in self.category_ranges:
+                start, end = self.category_ranges[name]
+                cos_scores = self._cosine_scores(query_embeddings, start, end)
+                clock = metrics.lap('matmul', clock)
+                candidates = end - start
+                if row_mask is not None:
+                    sub_mask = row_mask[start:end]
+                    candidates = int(sub_mask.sum())
+                    cos_scores = self.ops.masked_fill(cos_scores, sub_mask)
+                    clock = metrics.lap('filter_scan', clock)
+                top_scores, top_indices = self.ops.topk(cos_scores, min(top_k, candidates))
+                metrics.lap('topk', clock)
+                return top_scores, top_indices + start
+        
+        cos_scores = self._cosine_scores(query_embeddings)
+        clock = metrics.lap('matmul', clock)
+        candidates = cos_scores.shape[1]
+        
+        # 任意类别组合: 在top-k之前用类型掩码屏蔽其他类别
+        mask = row_mask
+        if categories is not None:
+            codes = [self.category_codes[c] for c in categories if c in self.category_codes]
+            type_mask = self.ops.isin(self.type_codes, codes)
+            mask = type_mask if mask is None else mask & type_mask
+        if mask is not None:
+            candidates = int(mask.sum())
+            cos_scores = self.ops.masked_fill(cos_scores, mask)
+            clock = metrics.lap('filter_scan', clock)
+        
+        result = self.ops.topk(cos_scores, min(top_k, candidates))
+        metrics.lap('topk', clock)
+        return result
+    
+    def _exact_rescore(self, query_embeddings, candidate_indices, top_k):
+        """用float32嵌入对候选行精确重排，只读取候选所在的行"""
+        ops = self.ops
+        rows = ops.take_rows(self.exact_embeddings, candidate_indices, query_embeddings)
+        exact_scores = ops.batched_dot(rows, query_embeddings)
         
+        top_scores, order = ops.topk(exact_scores, min(top_k, exact_scores.shape[1]))
+        return top_scores, ops.gather(candidate_indices, order)
+    
+    def _collect_results(self, top_scores, top_indices, similarity_threshold):
+        """将单个查询的top-k分数与行号转换为结果列表"""
         results = []
-        for score, idx in zip(top_scores, top_indices):
+        for score, idx in zip(top_scores.tolist(), top_indices.tolist()):
+            # 分数降序排列，低于阈值即可停止
             if score < similarity_threshold:
-                continue
-                
-            meta = self.metadata[idx]
-            if category != "all" and meta['type'] != category:
-                continue
-                
-            results.append({
-                'type': meta['type'].capitalize(),
-                'content': meta['content'],
-                'source': meta.get('source', ''),
-                'tags': meta['keywords'],
-                'score': float(score)
-            })
-            
-            if len(results) >= top_k:
                 break
+            results.append(self.format_result(self.metadata[idx], score))
+        return results
+    
+    def _encode_queries(self, queries):
+        """编码查询列表，优先使用缓存，未命中的查询合并为一次前向编码"""
+        fingerprint = self.model_loader.fingerprint
+        queries = [normalize_query(q) for q in queries]
+        
+        # 命中关键词/主题词典的查询无需编码
+        term_rows, term_embeddings = self.term_dictionary
+        embeddings = []
+        term_hits = 0
+        for q in queries:
+            row = term_rows.get(q)
+            if row is not None:
+                term_hits += 1
+                embeddings.append(term_embeddings[row])
+            else:
+                embeddings.append(self.query_cache.get(q, fingerprint))
+        self.term_hits += term_hits
+        
+        # 同一批次中重复的未命中查询只编码一次
+        missing = list(dict.fromkeys(q for q, emb in zip(queries, embeddings) if emb is None))
+        self.metrics.increment('term_hits', term_hits)
+        self.metrics.increment('cache_hits', len(queries) - term_hits - sum(emb is None for emb in embeddings))
+        self.metrics.increment('encoded', len(missing))
+        if missing:
+            encoded = self._model_encode(missing)
+            encoded_map = {}
+            for q, emb in zip(missing, encoded):
+                # 复制单行，缓存不引用整个批次
+                emb = self.ops.clone(emb)
+                encoded_map[q] = emb
+                self.query_cache.put(q, fingerprint, emb)
+            embeddings = [encoded_map[q] if emb is None else emb for q, emb in zip(queries, embeddings)]
         
-        logger.info(f"搜索完成: 查询 '{query[:20]}...', 耗时: {time.time()-start_time:.4f}s, 结果: {len(results)}条")
+        return self.ops.stack(embeddings)
+    
+    def _model_encode(self, texts):
+        """一次前向编码 texts；启用统计时拆为分词与编码器前向两步分别计时"""
+        if not self.metrics.enabled:
+            return self.model.encode(
+                texts,
+                convert_to_tensor=self.ops.tensors,
+                device=self.device,
+                show_progress_bar=False,
+                batch_size=len(texts)
+            )
+        
+        start = self.metrics.clock()
+        features = self.model.tokenize(texts)
+        start = self.metrics.lap('tokenize', start)
+        with self.ops.no_grad():
+            if hasattr(self.model, 'encode_features'):
+                # ONNX编码器
+                embeddings = self.ops.asarray(self.model.encode_features(features))
+            else:
+                features = {name: self.ops.to_device(value) if hasattr(value, 'to') else value
+                            for name, value in features.items()}
+                embeddings = self.model(features)['sentence_embedding']
+        self.metrics.lap('encode', start)
+        return embeddings
+    
+    def stats(self):
+        """检索统计: 计数、各阶段耗时分位数及查询缓存命中情况"""
+        stats = self.metrics.stats()
+        stats['cache'] = self.cache_stats()
+        return stats
+    
+    def prometheus_metrics(self, prefix="composition_search"):
+        """以Prometheus文本格式导出检索统计"""
+        return self.metrics.prometheus(prefix)
+    
+    def cache_stats(self):
+        """查询嵌入缓存与关键词词典的命中统计"""
+        stats = self.query_cache.stats()
+        stats['term_hits'] = self.term_hits
+        return stats
+    
+    def format_result(self, meta, score):
+        """将元数据转换为检索结果"""
+        return {
+            'type': meta['type'].capitalize(),
+            'content': meta['content'],
+            'source': meta.get('source', ''),
+            'tags': meta['keywords'],
+            'score': float(score)
+        }
+    
+    def search(self, query, top_k=5, category="all", similarity_threshold=0.3, filters=None):
+        """语义搜索素材 - 使用预计算嵌入
+        
+        filters: 可选的主题/关键词/来源过滤，如 {'themes': ['爱国'], 'keywords': ['坚持'], 'op': 'and'}
+        """
+        if self.embeddings is None:
+            # 如果没有预计算嵌入，回退到实时编码
+            return self._realtime_search(query, top_k, category, similarity_threshold, filters)
+        
+        metrics = self.metrics
+        start_time = metrics.clock()
+        
+        # 编码查询（命中缓存时跳过编码器）
+        query_embeddings = self._encode_queries([query])
+        
+        # 确保查询嵌入在正确设备上
+        query_embeddings = self.ops.to(query_embeddings, self.embeddings)
+        
+        # 先按类别与过滤条件屏蔽再取top-k，保证结果数量
+        categories = self._resolve_categories(category)
+        clock = metrics.clock()
+        row_mask = self._resolve_filters(filters)
+        if row_mask is not None:
+            metrics.lap('filter_resolve', clock)
+        top_scores, top_indices = self._category_topk(query_embeddings, categories, top_k, row_mask)
+        clock = metrics.clock()
+        results = self._collect_results(top_scores[0], top_indices[0], similarity_threshold)
+        metrics.lap('assemble', clock)
+        
+        metrics.increment('queries')
+        if not results:
+            metrics.increment('empty_results')
+        metrics.lap('total', start_time)
+        # 每次查询的日志只在DEBUG级别输出，避免高并发时的格式化与I/O开销
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"搜索完成: 查询 '{query[:20]}...', 结果: {len(results)}条")
         return results
     
-    def _realtime_search(self, query, top_k=5, category="all", similarity_threshold=0.3):
-        """实时编码搜索 - 当没有预计算嵌入时使用"""
-        logger.warning("使用实时编码搜索，性能可能较低")
+    def score_candidates(self, query, top_k=5, category="all", extra_rows=(), filters=None):
+        """返回 {行号: 余弦分数}: 语义top-k，外加对 extra_rows（如词法召回的候选）的精确打分
+        
+        供混合检索做语义重排；没有预计算嵌入时返回空字典。
+        """
+        if self.embeddings is None:
+            return {}
+        
+        query_embeddings = self._encode_queries([query])
+        query_embeddings = self.ops.to(query_embeddings, self.embeddings)
+        
+        categories = self._resolve_categories(category)
+        row_mask = self._resolve_filters(filters)
+        top_scores, top_indices = self._category_topk(query_embeddings, categories, top_k, row_mask)
+        scores = dict(zip(top_indices[0].tolist(), top_scores[0].tolist()))
+        
+        extra_rows = [row for row in extra_rows if row not in scores]
+        if row_mask is not None:
+            extra_rows = [row for row in extra_rows if row_mask[row]]
+        if extra_rows:
+            query_embedding = self.ops.normalize(query_embeddings)[0]
+            rows = self.ops.take_rows(self.exact_embeddings, np.asarray(extra_rows, dtype=np.int64), query_embedding)
+            extra_scores = rows @ query_embedding
+            scores.update(zip(extra_rows, extra_scores.tolist()))
+        return scores
+    
+    def encode_queries(self, queries):
+        """编码查询（经关键词词典与查询缓存），返回Q×D张量，可传给 search_batch(query_embeddings=...)"""
+        return self._encode_queries(list(queries))
+    
+    def search_batch(self, queries, top_k=5, category="all", similarity_threshold=0.3, filters=None,
+                     query_embeddings=None):
+        """批量语义搜索 - 一次前向编码全部查询，单次Q×N矩阵乘法打分
+        
+        query_embeddings: 可选，encode_queries 的结果（与 queries 逐行对应），传入时跳过编码，
+        用于同一批查询按不同参数分组打分时只编码一次。
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        if query_embeddings is not None and len(query_embeddings) != len(queries):
+            raise ValueError(f"query_embeddings 行数({len(query_embeddings)})与查询数({len(queries)})不一致")
+        
+        if self.embeddings is None:
+            # 实时编码模式下逐条回退
+            return [self._realtime_search(q, top_k, category, similarity_threshold, filters) for q in queries]
+        
+        metrics = self.metrics
+        start_time = metrics.clock()
+        
+        # 一次填充批次编码所有未命中缓存的查询
+        if query_embeddings is None:
+            query_embeddings = self._encode_queries(queries)
+        
+        query_embeddings = self.ops.to(query_embeddings, self.embeddings)
+        
+        # 批量打分与批量top-k
+        categories = self._resolve_categories(category)
+        clock = metrics.clock()
+        row_mask = self._resolve_filters(filters)
+        if row_mask is not None:
+            metrics.lap('filter_resolve', clock)
+        top_scores, top_indices = self._category_topk(query_embeddings, categories, top_k, row_mask)
+        
+        clock = metrics.clock()
+        batch_results = [
+            self._collect_results(top_scores[i], top_indices[i], similarity_threshold)
+            for i in range(len(queries))
+        ]
+        metrics.lap('assemble', clock)
+        
+        metrics.increment('batches')
+        metrics.increment('queries', len(queries))
+        metrics.increment('empty_results', sum(not results for results in batch_results))
+        metrics.lap('total', start_time)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"批量搜索完成: {len(queries)} 条查询")
+        return batch_results
+    
+    def _reload_index(self):
+        """后台构建完成后重新加载磁盘上的索引，之后的查询走预计算嵌入路径
+        
+        在查询线程中调用（见 _ensure_index_build）；此前 embeddings 为None，其他查询只走
+        实时编码路径，不读取这里逐项替换的状态。
+        """
+        embeddings = self._load_embeddings()
+        self.metadata = self._load_metadata()
+        self._build_category_index(embeddings)
+        self._build_filter_index()
+        # 最后替换嵌入，search 以此判断是否切换到预计算路径
+        self.embeddings = embeddings
+        self._load_ann_index()
+        self._load_term_dictionary()
+        # 构建成功后清除失败计数，之后的失败重新从最短间隔开始退避
+        self.index_build_failures = 0
+        self.index_build_retry_at = None
+        logger.info("已切换到新构建的素材索引")
+    
+    def _report_build_progress(self, done, total):
+        """后台构建进度日志（约每10%输出一次）"""
+        step = max(1, total // 10)
+        if done == total or done // step != (done - 1) // step:
+            logger.info(f"素材索引构建进度: {done}/{total} ({done / max(total, 1):.0%})")
+    
+    def build_progress(self):
+        """后台索引构建进度，未在构建时返回None"""
+        if self.index_build is None:
+            return None
+        done, total = self.index_build.progress()
+        progress = {'done': done, 'total': total, 'finished': self.index_build.finished}
+        if self.index_build.error is not None:
+            progress['error'] = str(self.index_build.error)
+        return progress
+    
+    def _index_build_failed(self, error):
+        """记录构建失败，按失败次数指数退避下一次重试"""
+        self.index_build_failures += 1
+        delay = min(INDEX_BUILD_RETRY_S * 2 ** (self.index_build_failures - 1), INDEX_BUILD_RETRY_MAX_S)
+        self.index_build_retry_at = time.time() + delay
+        logger.error(f"素材索引构建失败（第 {self.index_build_failures} 次），{delay}s 内不再重试: {error}")
+    
+    def _ensure_index_build(self):
+        """首次需要时启动后台索引构建，并在当前（查询）线程中应用已结束构建的结果
+        
+        构建线程只记录结果（finished/error），重新加载索引与失败退避都在持有 _index_build_lock
+        的查询线程中完成，构建线程不会在其他查询读取时替换引擎状态，并发查询也只启动一次构建。
+        构建失败后不会在每次查询时重新开始（那样每次查询都会重新预处理和编码全部语料），
+        而是在退避间隔内直接报告失败原因，间隔过后才重试一次。
+        """
+        with self._index_build_lock:
+            build = self.index_build
+            if build is not None and build.finished and build is not self._applied_build:
+                self._applied_build = build
+                if build.error is None:
+                    try:
+                        self._reload_index()
+                    except Exception as e:
+                        logger.exception(f"加载新构建的素材索引失败: {str(e)}")
+                        build.error = e
+                if build.error is not None:
+                    self._index_build_failed(build.error)
+            
+            failed = build is not None and build.finished and build.error is not None
+            if failed:
+                remaining = self.index_build_retry_at - time.time()
+                if remaining > 0:
+                    raise RuntimeError(f"素材索引构建失败: {build.error}（{remaining:.0f}s 后重试）")
+                logger.info(f"重试后台索引构建（已失败 {self.index_build_failures} 次）")
+            if build is None or failed:
+                from .index_builder import BackgroundIndexBuild
+                self.index_build = BackgroundIndexBuild(
+                    self.model, self.model_loader.fingerprint,
+                    model_dir=self.model_dir, device=self.device,
+                    on_progress=self._report_build_progress
+                )
+                self.index_build.start()
+            return self.index_build
+    
+    def _realtime_search(self, query, top_k=5, category="all", similarity_threshold=0.3, filters=None):
+        """实时编码搜索 - 当没有预计算嵌入时使用
+        
+        首次调用时在后台构建并持久化素材嵌入；构建期间基于已编码的部分检索。
+        """
         start_time = time.time()
+        build = self._ensure_index_build()
+        embeddings, metadata = build.snapshot()
+        done, total = build.progress()
+        
+        if build.finished and build.error is None and self.embeddings is not None:
+            return self.search(query, top_k, category, similarity_threshold, filters)
+        if build.finished and build.error is not None:
+            raise RuntimeError(f"素材索引构建失败: {build.error}")
+        logger.warning(f"素材索引构建中 ({done}/{total})，结果仅基于已编码部分")
+        if embeddings is None:
+            return []
         
         # 编码查询
-        query_embedding = self.model.encode(
-            query, 
-            convert_to_tensor=True, 
-            device=self.device,
-            show_progress_bar=False
-        )
+        query_embeddings = self._encode_queries([query])
         
-        # 实时编码所有素材
-        all_texts = [item['cleaned_text'] for item in self.metadata]
-        embeddings = self.model.encode(
-            all_texts, 
-            convert_to_tensor=True, 
-            device=self.device,
-            show_progress_bar=False
-        )
+        # 计算相似度（1×N）
+        ops = self.ops
+        embeddings = ops.normalize(ops.to(ops.asarray(embeddings), query_embeddings))
+        cos_scores = ops.mm(ops.normalize(query_embeddings), embeddings)
         
-        # 计算相似度
-        cos_scores = util.cos_sim(query_embedding, embeddings)[0]
+        # 在top-k之前屏蔽其他类别及不满足过滤条件的素材
+        categories = self._resolve_categories(category)
+        if filters:
+            self._resolve_filters(filters)  # 校验过滤字段
+        candidates = cos_scores.shape[1]
+        if categories is not None or filters:
+            mask = np.array(
+                [(categories is None or meta['type'] in categories)
+                 and (not filters or self.meta_matches(meta, filters))
+                 for meta in islice(metadata, candidates)],
+                dtype=bool
+            )
+            candidates = int(mask.sum())
+            cos_scores = ops.masked_fill(cos_scores, ops.to(ops.asarray(mask), cos_scores))
         
         # 获取最相关结果
-        top_results = torch.topk(cos_scores, k=min(top_k * 3, len(cos_scores)))
+        top_scores, top_indices = ops.topk(cos_scores, min(top_k, candidates))
         
         results = []
-        for score, idx in zip(top_results.values, top_results.indices):
+        for score, idx in zip(top_scores[0].tolist(), top_indices[0].tolist()):
             if score < similarity_threshold:
-                continue
-                
-            meta = self.metadata[idx]
-            if category != "all" and meta['type'] != category:
-                continue
-                
-            results.append({
-                'type': meta['type'].capitalize(),
-                'content': meta['content'],
-                'source': meta.get('source', ''),
-                'tags': meta['keywords'],
-                'score': float(score)
-            })
-            
-            if len(results) >= top_k:
                 break
+            results.append(self.format_result(metadata[idx], score))
         
         logger.info(f"实时搜索完成: 耗时 {time.time()-start_time:.4f}s, 结果: {len(results)}条")
         return results
\ No newline at end of file
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+from .ann_index import IVFIndex
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("Snapshot")
+
+SNAPSHOT_FILE = "snapshot.bin"
+FORMAT_VERSION = 1
+MAGIC = b'CASNAP\x01\x00'
+# 各段按64字节（缓存行）对齐，内存映射后可直接作为数组使用
+ALIGN = 64
+COPY_ROWS = 65536
+
+# 快照包格式（小端）:
+#   魔数(8) + 头长度(uint32) + JSON头(模型指纹、行数、各段的 dtype/偏移/形状)
+#   之后为按64字节对齐的各段:
+#     encoder/<文件名>       uint8[]       ONNX图、tokenizer.json 及池化等配置
+#     index/embeddings       float32[N,D]  L2归一化嵌入
+#     index/compact          float16/int8  紧凑副本（可选）
+#     index/compact_scale    float32[N]    int8 每行缩放系数（可选）
+#     index/metadata         uint8[]       metadata.bin 原样嵌入
+#     index/terms            uint8[]       关键词词表（JSON，可选）
+#     index/term_embeddings  float32[T,D]  关键词嵌入（可选，由快照中的ONNX编码器编码）
+#     index/ann_*            IVF索引数组（可选）
+# 打开时只解析JSON头，其余各段都是对同一内存映射的零拷贝视图。
+
+
+def _aligned(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+class SnapshotWriter:
+    """收集各段后一次写出快照包（先写临时文件再替换）
+    
+    数组按行分块写入，内存映射的大矩阵不会被整体读入内存。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.sections = []
+    
+    def add_array(self, name, array):
+        array = np.asarray(array)
+        self.sections.append((name, array.dtype.newbyteorder('<').str, list(array.shape), array))
+    
+    def add_bytes(self, name, data):
+        self.add_array(name, np.frombuffer(bytes(data), dtype=np.uint8))
+    
+    def add_file(self, name, path):
+        # 空文件无法内存映射
+        data = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+        self.add_array(name, data)
+    
+    def close(self, **info):
+        """写出快照，info 中的字段一并写入JSON头"""
+        layout = {}
+        offset = 0
+        for name, dtype, shape, array in self.sections:
+            layout[name] = [dtype, offset, shape]
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps(dict(info, format_version=FORMAT_VERSION, sections=layout),
+                            ensure_ascii=False).encode('utf-8')
+        
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(MAGIC)
+                f.write(len(header).to_bytes(4, 'little'))
+                f.write(header)
+                written = len(MAGIC) + 4 + len(header)
+                f.write(b'\0' * (_aligned(written) - written))
+                for name, dtype, shape, array in self.sections:
+                    array = array.astype(dtype, copy=False)
+                    rows = array.reshape(array.shape[0], -1) if array.ndim > 1 else array
+                    for start in range(0, max(len(rows), 1), COPY_ROWS):
+                        f.write(np.ascontiguousarray(rows[start:start + COPY_ROWS]).tobytes())
+                    f.write(b'\0' * (_aligned(array.nbytes) - array.nbytes))
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.path
+
+
+class Snapshot:
+    """只读打开快照包: 整个文件做一次 copy-on-write 内存映射，各段为零拷贝视图"""
+    def __init__(self, path):
+        self.path = path
+        self._buffer = np.memmap(path, dtype=np.uint8, mode='c')
+        if self._buffer[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError(f"不是有效的快照文件: {path}")
+        header_len = int.from_bytes(self._buffer[8:12].tobytes(), 'little')
+        self.header = json.loads(self._buffer[12:12 + header_len].tobytes().decode('utf-8'))
+        if self.header['format_version'] > FORMAT_VERSION:
+            raise ValueError(f"不支持的快照版本: {self.header['format_version']}")
+        self._data_start = _aligned(12 + header_len)
+        self.sections = self.header['sections']
+        self.fingerprint = self.header['fingerprint']
+    
+    def __contains__(self, name):
+        return name in self.sections
+    
+    def array(self, name):
+        """返回某段的数组视图（不复制）"""
+        dtype, offset, shape = self.sections[name]
+        dtype = np.dtype(dtype)
+        start = self._data_start + offset
+        count = int(np.prod(shape, dtype=np.int64))
+        return self._buffer[start:start + count * dtype.itemsize].view(dtype).reshape(shape)
+    
+    def read_bytes(self, name):
+        return self.array(name).tobytes()
+    
+    def encoder_files(self):
+        """编码器文件名 → 内容（内存映射上的 memoryview，不复制），供 ONNXEncoder(files=...) 使用"""
+        prefix = "encoder/"
+        return {name[len(prefix):]: memoryview(self.array(name)) for name in self.sections if name.startswith(prefix)}
+    
+    def compact(self):
+        """紧凑副本: 返回(数据数组, 缩放系数数组或None, 精度)，不存在时返回None"""
+        if "index/compact" not in self:
+            return None
+        scale = self.array("index/compact_scale") if "index/compact_scale" in self else None
+        return self.array("index/compact"), scale, self.header['compact_precision']
+    
+    def term_dictionary(self):
+        """关键词词典: 返回(词列表, None, 嵌入数组, 编码模型指纹)，不存在时返回None"""
+        if "index/terms" not in self:
+            return None
+        terms = json.loads(self.read_bytes("index/terms").decode('utf-8'))
+        return terms, None, self.array("index/term_embeddings"), self.header.get('term_fingerprint')
+    
+    def ann_index(self):
+        if "index/ann_centroids" not in self:
+            return None
+        return IVFIndex(*(self.array(f"index/ann_{name}") for name in ("centroids", "offsets", "list_rows")))
+
+
+def snapshot_path(model_dir="model"):
+    return os.path.join(model_dir, SNAPSHOT_FILE)
+
+
+def compile_snapshot(model_dir="model", output=None, onnx_dir=None):
+    """将ONNX编码器、分词器、归一化嵌入及紧凑元数据打包为单个快照文件
+    
+    需要已导出的ONNX编码器（python -m src.onnx_encoder）和已构建的嵌入索引。
+    """
+    # 只在打包时需要；Snapshot 读取只依赖 numpy，检索进程无需导入这些模块
+    from .onnx_encoder import ONNX_DIR, RAW_MODEL_FILE, OPTIMIZED_MODEL_FILE, ENCODER_FILES
+    from .embedding_store import STORE_FILE, load_manifest, index_dir
+    from .metadata_store import METADATA_FILE, LEGACY_METADATA_FILE, MetadataWriter
+    from .index_builder import load_term_dictionary
+    from .model_loader import ModelLoader
+    from .onnx_encoder import ONNXEncoder
+    
+    start_time = time.time()
+    onnx_dir = onnx_dir or os.path.join(model_dir, ONNX_DIR)
+    if not os.path.exists(onnx_dir):
+        raise FileNotFoundError(f"未找到ONNX模型，请先运行 python -m src.onnx_encoder 导出: {onnx_dir}")
+    # 索引目录只解析一次，打包的各部分取自同一索引代
+    directory = index_dir(model_dir)
+    store_path = os.path.join(directory, STORE_FILE)
+    if not os.path.exists(store_path):
+        raise FileNotFoundError(f"嵌入文件不存在，请先运行 python -m src.index_builder 构建索引: {store_path}")
+    
+    output = output or snapshot_path(model_dir)
+    writer = SnapshotWriter(output)
+    
+    # 编码器: 优化后的ONNX图（不存在时使用原始图）及独立加载所需的文件
+    model_file = OPTIMIZED_MODEL_FILE if os.path.exists(os.path.join(onnx_dir, OPTIMIZED_MODEL_FILE)) else RAW_MODEL_FILE
+    for name in (model_file,) + ENCODER_FILES:
+        writer.add_file(f"encoder/{name.replace(os.sep, '/')}", os.path.join(onnx_dir, name))
+    
+    # 嵌入及紧凑副本
+    embeddings = np.load(store_path, mmap_mode='r')
+    writer.add_array("index/embeddings", embeddings)
+    info = {}
+    manifest = load_manifest(directory)
+    if manifest is not None and 'compact' in manifest:
+        compact = manifest['compact']
+        writer.add_array("index/compact", np.load(os.path.join(directory, compact['file']), mmap_mode='r'))
+        if 'scale_file' in compact:
+            writer.add_array("index/compact_scale", np.load(os.path.join(directory, compact['scale_file'])))
+        info['compact_precision'] = compact['precision']
+    
+    # 元数据: metadata.bin 原样嵌入，只有旧版JSON时先转换
+    metadata_path = os.path.join(directory, METADATA_FILE)
+    legacy_path = os.path.join(directory, LEGACY_METADATA_FILE)
+    if os.path.exists(metadata_path):
+        writer.add_file("index/metadata", metadata_path)
+    elif os.path.exists(legacy_path):
+        metadata = MetadataWriter()
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            metadata.extend(json.load(f))
+        writer.add_bytes("index/metadata", metadata.to_bytes())
+    else:
+        raise FileNotFoundError(f"元数据文件不存在: {metadata_path}")
+    
+    # 与 backend="onnx" 一致，查询缓存可共用
+    fingerprint = f"{ModelLoader.compute_fingerprint(onnx_dir)}-onnx"
+    
+    # 关键词词典用快照中的ONNX编码器重新编码，使查表与编码查询等价
+    dictionary = load_term_dictionary(directory)
+    if dictionary is not None:
+        terms = dictionary[0]
+        term_embeddings = ONNXEncoder(onnx_dir).encode(terms, batch_size=128) if terms else dictionary[2]
+        writer.add_bytes("index/terms", json.dumps(terms, ensure_ascii=False).encode('utf-8'))
+        writer.add_array("index/term_embeddings", np.asarray(term_embeddings, dtype=np.float32))
+        info['term_fingerprint'] = fingerprint
+    
+    ann_index = IVFIndex.load(directory)
+    if ann_index is not None and ann_index.rows == embeddings.shape[0]:
+        writer.add_array("index/ann_centroids", ann_index.centroids)
+        writer.add_array("index/ann_offsets", ann_index.offsets)
+        writer.add_array("index/ann_list_rows", ann_index.list_rows)
+    
+    writer.close(
+        fingerprint=fingerprint,
+        rows=int(embeddings.shape[0]),
+        dim=int(embeddings.shape[1]),
+        created=time.strftime("%Y-%m-%d %H:%M:%S"),
+        **info
+    )
+    logger.info(f"快照已生成: {output} ({os.path.getsize(output) / 1024 / 1024:.1f} MB, "
+                f"{embeddings.shape[0]} 条, 耗时 {time.time()-start_time:.2f}s)")
+    return output
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="将编码器与素材索引打包为单个可内存映射的快照文件")
+    parser.add_argument("--model_dir", default="model", help="模型目录")
+    parser.add_argument("--onnx_dir", default=None, help="ONNX编码器目录，默认 model/onnx")
+    parser.add_argument("--output", default=None, help="输出文件，默认 model/snapshot.bin")
+    args = parser.parse_args()
+    compile_snapshot(args.model_dir, args.output, args.onnx_dir)
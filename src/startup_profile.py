@@ -0,0 +1,48 @@
+import sys
+import time
+from contextlib import contextmanager
+
+# 报告中列出已导入的重量级依赖，便于确认 onnx/snapshot 后端没有加载 torch 与 transformers 栈
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "onnxruntime", "jieba")
+
+
+class StartupProfile:
+    """记录启动各阶段耗时（--startup-profile）
+    
+    phase() 记录一段耗时，mark() 记录自进程启动以来到达某个节点的时间。
+    未启用时所有方法都是空操作。
+    """
+    def __init__(self, enabled=False, start_time=None):
+        self.enabled = enabled
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.phases = []
+        self.marks = []
+        self.reported = False
+    
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+    
+    def add(self, name, seconds):
+        if self.enabled:
+            self.phases.append((name, seconds))
+    
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((name, time.perf_counter() - self.start_time))
+    
+    def report(self):
+        """返回各阶段耗时的文本报告"""
+        lines = ["=== 启动耗时 ==="]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<12} {seconds * 1000:>9.1f} ms")
+        for name, seconds in self.marks:
+            lines.append(f"  @ {name:<10} {seconds * 1000:>9.1f} ms (自启动)")
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        lines.append(f"  已导入: {', '.join(loaded) or '无'}")
+        self.reported = True
+        return "\n".join(lines)
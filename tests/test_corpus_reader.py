@@ -0,0 +1,52 @@
+import io
+import pytest
+from src.corpus_reader import iter_json_array
+
+READ_SIZES = (1, 2, 3, 64)
+
+
+def parse(text, read_size):
+    return list(iter_json_array(io.StringIO(text), read_size=read_size))
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+@pytest.mark.parametrize("text", ['[1] x', '[1]x', '[] x', '[{"a": 1}] \n ,', '[1]\n\n]'])
+def test_trailing_data_rejected(text, read_size):
+    with pytest.raises(ValueError):
+        parse(text, read_size)
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+@pytest.mark.parametrize("text", ['[1]', '[1]  \n', '[]', '[] \t\n'])
+def test_trailing_whitespace_accepted(text, read_size):
+    assert parse(text, read_size) == ([1] if '1' in text else [])
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+def test_numbers_split_at_every_position(read_size):
+    numbers = ['1.5e3', '-2', '0.25', '12E-2', '3e+4', '-0.5E1', '100']
+    text = '[' + ','.join(numbers) + ']'
+    expected = [1.5e3, -2, 0.25, 12e-2, 3e4, -0.5e1, 100]
+    # 每个前缀长度都让缓冲区边界落在不同位置
+    for offset in range(len(text)):
+        padded = ' ' * offset + text
+        assert parse(padded, read_size) == expected
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+def test_mixed_elements(read_size):
+    text = '[{"content": "天行健", "keywords": ["自强"]}, "x", true, null, 7]'
+    assert parse(text, read_size) == [{"content": "天行健", "keywords": ["自强"]}, "x", True, None, 7]
+
+
+@pytest.mark.parametrize("read_size", READ_SIZES)
+@pytest.mark.parametrize("text", ['[1,,2]', '[,1]', '[1,]', '[1 2]', '[1', '[1.5x]'])
+def test_malformed_arrays_rejected(text, read_size):
+    with pytest.raises(ValueError):
+        parse(text, read_size)
+
+
+@pytest.mark.parametrize("text", ['[{"a": "' + 'x' * 100, '[' + '1' * 100 + ']'])
+def test_oversized_element_rejected(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), read_size=4, max_item_size=20))